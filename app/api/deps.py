@@ -5,6 +5,7 @@ from app.database import get_db
 from app.models.user import User, UserRole
 from app.core.security import verify_token
 from app.core.exception import AuthenticationException, AuthorizationException
+from app.service.user_service import UserService
 
 security = HTTPBearer()
 
@@ -20,7 +21,7 @@ def get_current_user(
     if not user_id:
         raise AuthenticationException("Invalid token")
     
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = UserService(db).get_user_by_id(int(user_id))
     if not user:
         raise AuthenticationException("User not found")
     
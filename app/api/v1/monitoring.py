@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from app.api.deps import get_admin
+from app.models.user import User
+from app.utils.websocket_manager import manager
+from app.task.monitoring import get_queue_metrics
+from app.task.idempotency import get_idempotency_metrics
+from app.service.stripe_gateway import stripe_latency
+from app.task.payment_task import get_reconciliation_report
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+
+@router.get("/websockets")
+async def get_websocket_stats(current_user: User = Depends(get_admin)):
+    '''Live WebSocket connections and heartbeat reaper counters (admin only)'''
+    return manager.stats()
+
+@router.get("/queues")
+def get_queue_stats(current_user: User = Depends(get_admin)):
+    '''Celery queue depth and recent queue wait times (admin only)'''
+    return get_queue_metrics()
+
+@router.get("/idempotency")
+def get_idempotency_stats(current_user: User = Depends(get_admin)):
+    '''Task executions vs deduplicated deliveries (admin only)'''
+    return get_idempotency_metrics()
+
+@router.get("/stripe")
+def get_stripe_latency(current_user: User = Depends(get_admin)):
+    '''Stripe call latency histograms per operation and outcome (admin only)'''
+    return stripe_latency.snapshot()
+
+@router.get("/reconciliation")
+def get_reconciliation_stats(current_user: User = Depends(get_admin)):
+    '''Report of the last nightly payment reconciliation (admin only)'''
+    return get_reconciliation_report()
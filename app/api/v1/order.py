@@ -10,11 +10,16 @@ from app.schema.order import OrderCreate, OrderResponse, OrderUpdate
 from app.core.exception import NotFoundException, ValidationException, AuthorizationException
 from app.task.order_task import update_order_status, calculate_estimated_delivery_time
 from app.core.logging import logger
+from app.service.tracking_service import DeliveryTrackingService
+from app.utils.scheduler import on_order_created
+from app.service.outbox_service import enqueue_event
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+# create_order is plain def: its commits and the deadline ZADD block, so it runs in the threadpool
+
 @router.post("/", response_model=OrderResponse)
-async def create_order(
+def create_order(
     order_data: OrderCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -96,10 +101,13 @@ async def create_order(
         )
         db.add(order_item)
     
+    # Calculate estimated delivery time once the order is committed
+    enqueue_event(db, "order", db_order.id, "order.created", calculate_estimated_delivery_time, db_order.id)
+    
     db.commit()
     
-    # Calculate estimated delivery time
-    calculate_estimated_delivery_time.delay(db_order.id)
+    # Cancelled automatically if still unpaid when the deadline fires
+    on_order_created(db_order.id)
     
     # Load order with items for response
     order_with_items = db.query(Order).options(
@@ -162,6 +170,34 @@ async def get_order(
     
     return order
 
+@router.get("/{order_id}/trail")
+async def get_order_trail(
+    order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    '''Get the delivery route so far as an encoded polyline'''
+    
+    order = db.query(Order).filter(Order.id == order_id).first()
+    
+    if not order:
+        raise NotFoundException("Order")
+    
+    # Same visibility rules as the order itself
+    if (order.customer_id != current_user.id and
+        order.delivery_partner_id != current_user.id and
+        current_user.role.value != "admin"):
+        
+        restaurant = db.query(Restaurant).filter(
+            Restaurant.id == order.restaurant_id,
+            Restaurant.owner_id == current_user.id
+        ).first()
+        
+        if not restaurant:
+            raise AuthorizationException("Access denied to this order")
+    
+    return await DeliveryTrackingService.get_trail(order_id)
+
 @router.patch("/{order_id}", response_model=OrderResponse)
 async def update_order(
     order_id: int,
@@ -210,8 +246,11 @@ async def update_order(
         elif current_user.role.value != "admin":
             raise AuthorizationException("Not authorized to update order status")
         
-        # Trigger async status update
-        update_order_status.delay(order_id, new_status.value)
+        # Trigger async status update, published by the outbox relay after commit
+        enqueue_event(
+            db, "order", order_id, "order.status_change_requested",
+            update_order_status, order_id, new_status.value
+        )
     
     # Update delivery partner assignment
     if order_update.delivery_partner_id is not None:
@@ -219,8 +258,8 @@ async def update_order(
             raise AuthorizationException("Not authorized to assign delivery partner")
         
         order.delivery_partner_id = order_update.delivery_partner_id
-        db.commit()
     
+    db.commit()
     db.refresh(order)
     return order
 
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.api.deps import get_current_user
+from typing import Optional
+from datetime import datetime
+from app.database import get_db, SessionLocal
+from app.api.deps import get_current_user, get_admin
 from app.models.user import User
 from app.models.order import Order
-from app.schema.payment import PaymentIntentCreate, PaymentIntentResponse
+from app.models.payment import PaymentStatus
+from app.schema.payment import PaymentIntentCreate, PaymentIntentResponse, PaymentHistoryResponse
 from app.service.payment_service import PaymentService
-from app.task.payment_task import process_payment
 from app.core.logging import logger
+import json
 import stripe
 from app.config import settings
 
@@ -33,7 +37,7 @@ async def create_payment_intent(
         )
     
     payment_service = PaymentService(db)
-    result = payment_service.create_payment_intent(
+    result = await payment_service.acreate_payment_intent(
         payment_data.order_id,
         payment_data.payment_method
     )
@@ -57,7 +61,7 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     
     try:
         event = stripe.Webhook.construct_event(
-            payload, sig_header, settings.stripe_webhook_secret
+            payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
         logger.error(f"Invalid payload", error=str(e))
@@ -66,35 +70,52 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         logger.error(f"Invalid signature", error=str(e))
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        order_id = payment_intent['metadata'].get('order_id')
-        
-        if order_id:
-            # Trigger async payment processing
-            process_payment.delay(int(order_id))
-    
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        order_id = payment_intent['metadata'].get('order_id')
-        
-        if order_id:
-            # Handle failed payment
-            logger.error(f"Payment failed for order", order_id=order_id)
+    # Store and acknowledge; process_stripe_events applies events in order
+    if not PaymentService(db).record_webhook_event(json.loads(payload)):
+        logger.info(f"Duplicate Stripe event ignored", event_id=event['id'])
     
     return {"status": "success"}
 
-@router.get("/my-payments")
+@router.get("/my-payments", response_model=PaymentHistoryResponse)
 async def get_my_payments(
+    limit: int = Query(20, ge=1, le=100, description="Number of payments to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    '''Get current user's payment history'''
-    from app.models.payment import Payment
+    '''Get current user's payment history, newest first'''
+    try:
+        payments, next_cursor = PaymentService(db).get_payment_history(current_user.id, limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
     
-    payments = db.query(Payment).filter(
-        Payment.user_id == current_user.id
-    ).order_by(Payment.created_at.desc()).all()
+    return PaymentHistoryResponse(items=payments, next_cursor=next_cursor)
+
+@router.get("/export")
+async def export_payments(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv or ndjson"),
+    payment_status: Optional[PaymentStatus] = Query(None, alias="status", description="Filter by payment status"),
+    created_from: Optional[datetime] = Query(None, description="Created at or after"),
+    created_to: Optional[datetime] = Query(None, description="Created before"),
+    current_user: User = Depends(get_admin)
+):
+    '''Stream every matching payment for finance (admin only)'''
+    def stream():
+        # Own session: the response outlives the request's dependencies
+        db = SessionLocal()
+        try:
+            yield from PaymentService(db).export_payments(format, payment_status, created_from, created_to)
+        finally:
+            db.close()
     
-    return payments
\ No newline at end of file
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"payments-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
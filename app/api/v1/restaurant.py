@@ -12,9 +12,12 @@ from app.schema.restaurant import (
 )
 from app.core.exception import NotFoundException, ValidationException, AuthorizationException
 from app.core.logging import logger
+from app.service.restaurant_service import RestaurantService, invalidate_menu_cache, invalidate_restaurant_cache
 
 router = APIRouter(prefix="/restaurants", tags=["restaurants"])
 
+# Handlers that read or invalidate the cache are plain def: its Redis calls block, so they run in the threadpool
+
 
 
 @router.post("/", response_model=RestaurantResponse, status_code=status.HTTP_201_CREATED)
@@ -103,7 +106,7 @@ async def get_restaurant(
     return restaurant
 
 @router.patch("/{restaurant_id}", response_model=RestaurantResponse)
-async def update_restaurant(
+def update_restaurant(
     restaurant_id: int,
     restaurant_update: RestaurantUpdate,
     current_user: User = Depends(get_restaurant_owner),
@@ -126,13 +129,14 @@ async def update_restaurant(
     
     db.commit()
     db.refresh(restaurant)
+    invalidate_restaurant_cache(restaurant_id)
     
     logger.info(f"Restaurant updated", restaurant_id=restaurant_id)
     
     return restaurant
 
 @router.delete("/{restaurant_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_restaurant(
+def delete_restaurant(
     restaurant_id: int,
     current_user: User = Depends(get_restaurant_owner),
     db: Session = Depends(get_db)
@@ -149,6 +153,7 @@ async def delete_restaurant(
     
     restaurant.is_active = False
     db.commit()
+    invalidate_restaurant_cache(restaurant_id)
     
     logger.info(f"Restaurant deactivated", restaurant_id=restaurant_id)
     
@@ -221,7 +226,7 @@ async def list_categories(
 
 
 @router.post("/{restaurant_id}/menu", response_model=MenuItemResponse, status_code=status.HTTP_201_CREATED)
-async def create_menu_item(
+def create_menu_item(
     restaurant_id: int,
     menu_item_data: MenuItemCreate,
     current_user: User = Depends(get_restaurant_owner),
@@ -270,13 +275,14 @@ async def create_menu_item(
     db.add(db_menu_item)
     db.commit()
     db.refresh(db_menu_item)
+    invalidate_menu_cache(restaurant_id)
     
     logger.info(f"Menu item created", item_id=db_menu_item.id, restaurant_id=restaurant_id)
     
     return db_menu_item
 
 @router.get("/{restaurant_id}/menu", response_model=List[MenuItemResponse])
-async def get_restaurant_menu(
+def get_restaurant_menu(
     restaurant_id: int,
     category_id: Optional[int] = Query(None, description="Filter by category"),
     is_vegetarian: Optional[bool] = Query(None, description="Filter vegetarian items"),
@@ -286,21 +292,17 @@ async def get_restaurant_menu(
 ):
     '''Get restaurant menu items'''
     
-    query = db.query(MenuItem).filter(MenuItem.restaurant_id == restaurant_id)
-    
-    if available_only:
-        query = query.filter(MenuItem.is_available == True)
+    # The whole menu is cached per restaurant; the optional filters are applied to it here
+    menu_items = RestaurantService(db).get_menu_items(restaurant_id, available_only)
     
     if category_id:
-        query = query.filter(MenuItem.category_id == category_id)
+        menu_items = [item for item in menu_items if item.category_id == category_id]
     
     if is_vegetarian is not None:
-        query = query.filter(MenuItem.is_vegetarian == is_vegetarian)
+        menu_items = [item for item in menu_items if item.is_vegetarian == is_vegetarian]
     
     if is_vegan is not None:
-        query = query.filter(MenuItem.is_vegan == is_vegan)
-    
-    menu_items = query.all()
+        menu_items = [item for item in menu_items if item.is_vegan == is_vegan]
     
     return menu_items
 
@@ -323,7 +325,7 @@ async def get_menu_item(
     return menu_item
 
 @router.patch("/{restaurant_id}/menu/{item_id}", response_model=MenuItemResponse)
-async def update_menu_item(
+def update_menu_item(
     restaurant_id: int,
     item_id: int,
     menu_item_update: MenuItemUpdate,
@@ -375,13 +377,14 @@ async def update_menu_item(
     
     db.commit()
     db.refresh(menu_item)
+    invalidate_menu_cache(restaurant_id)
     
     logger.info(f"Menu item updated", item_id=item_id, restaurant_id=restaurant_id)
     
     return menu_item
 
 @router.delete("/{restaurant_id}/menu/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_menu_item(
+def delete_menu_item(
     restaurant_id: int,
     item_id: int,
     current_user: User = Depends(get_restaurant_owner),
@@ -408,13 +411,14 @@ async def delete_menu_item(
     # Soft delete by marking as unavailable
     menu_item.is_available = False
     db.commit()
+    invalidate_menu_cache(restaurant_id)
     
     logger.info(f"Menu item deleted", item_id=item_id, restaurant_id=restaurant_id)
     
     return None
 
 @router.patch("/{restaurant_id}/status", response_model=RestaurantResponse)
-async def update_restaurant_status(
+def update_restaurant_status(
     restaurant_id: int,
     status: RestaurantStatus,
     current_user: User = Depends(get_restaurant_owner),
@@ -433,6 +437,7 @@ async def update_restaurant_status(
     restaurant.status = status
     db.commit()
     db.refresh(restaurant)
+    invalidate_restaurant_cache(restaurant_id)
     
     logger.info(f"Restaurant status updated", restaurant_id=restaurant_id, status=status.value)
     
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import auth, users, restaurants, orders, payments, websocket
+from app.api.v1 import auth, users, restaurants, orders, payments, websocket, monitoring
 
 api_router = APIRouter()
 
@@ -10,6 +10,7 @@ api_router.include_router(restaurants.router)
 api_router.include_router(orders.router)
 api_router.include_router(payments.router)
 api_router.include_router(websocket.router)
+api_router.include_router(monitoring.router)
 """
 
 # ================================
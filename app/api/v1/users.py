@@ -8,9 +8,13 @@ from app.schema.user import UserResponse, UserUpdate, AddressCreate, AddressResp
 from app.core.exception import NotFoundException, ValidationException
 from app.core.logging import logger
 from app.task.user_task import sync_user_preferences
+from app.service.outbox_service import enqueue_event
+from app.service.user_service import invalidate_user_cache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Handlers that invalidate the user cache are plain def: its Redis calls block, so they run in the threadpool
+
 
 # ==================== User Profile Endpoints ====================
 
@@ -23,7 +27,7 @@ async def get_current_user_profile(
 
 
 @router.patch("/me", response_model=UserResponse)
-async def update_user_profile(
+def update_user_profile(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -36,11 +40,12 @@ async def update_user_profile(
     for field, value in update_data.items():
         setattr(current_user, field, value)
     
+    # Sync preferences to cache after commit
+    enqueue_event(db, "user", current_user.id, "user.profile_updated", sync_user_preferences, current_user.id)
+    
     db.commit()
     db.refresh(current_user)
-    
-    # Sync preferences to cache
-    sync_user_preferences.delay(current_user.id)
+    invalidate_user_cache(current_user.id)
     
     logger.info(f"User profile updated", user_id=current_user.id)
     
@@ -48,7 +53,7 @@ async def update_user_profile(
 
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user_account(
+def delete_user_account(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -56,11 +61,13 @@ async def delete_user_account(
     
     # Soft delete - just deactivate
     current_user.is_active = False
-    db.commit()
     
     # Send confirmation email
     from app.task.user_task import send_account_deletion_confirmation
-    send_account_deletion_confirmation.delay(current_user.id)
+    enqueue_event(db, "user", current_user.id, "user.deleted", send_account_deletion_confirmation, current_user.id)
+    
+    db.commit()
+    invalidate_user_cache(current_user.id)
     
     logger.info(f"User account deleted", user_id=current_user.id)
     
@@ -99,12 +106,13 @@ async def create_address(
     )
     
     db.add(db_address)
+    
+    # Sync updated preferences after commit
+    enqueue_event(db, "user", current_user.id, "user.addresses_updated", sync_user_preferences, current_user.id)
+    
     db.commit()
     db.refresh(db_address)
     
-    # Sync updated preferences
-    sync_user_preferences.delay(current_user.id)
-    
     logger.info(f"Address created", address_id=db_address.id, user_id=current_user.id)
     
     return db_address
@@ -173,12 +181,12 @@ async def update_address(
     for field, value in update_data.items():
         setattr(address, field, value)
     
+    # Sync updated preferences after commit
+    enqueue_event(db, "user", current_user.id, "user.addresses_updated", sync_user_preferences, current_user.id)
+    
     db.commit()
     db.refresh(address)
     
-    # Sync updated preferences
-    sync_user_preferences.delay(current_user.id)
-    
     logger.info(f"Address updated", address_id=address_id, user_id=current_user.id)
     
     return address
@@ -219,10 +227,11 @@ async def delete_address(
             other_address.is_default = True
     
     db.delete(address)
-    db.commit()
     
-    # Sync updated preferences
-    sync_user_preferences.delay(current_user.id)
+    # Sync updated preferences after commit
+    enqueue_event(db, "user", current_user.id, "user.addresses_updated", sync_user_preferences, current_user.id)
+    
+    db.commit()
     
     logger.info(f"Address deleted", address_id=address_id, user_id=current_user.id)
     
@@ -253,12 +262,13 @@ async def set_default_address(
     
     # Set this as default
     address.is_default = True
+    
+    # Sync updated preferences after commit
+    enqueue_event(db, "user", current_user.id, "user.addresses_updated", sync_user_preferences, current_user.id)
+    
     db.commit()
     db.refresh(address)
     
-    # Sync updated preferences
-    sync_user_preferences.delay(current_user.id)
-    
     logger.info(f"Default address updated", address_id=address_id, user_id=current_user.id)
     
     return address
@@ -377,15 +387,9 @@ async def get_user_preferences(
     """Get user preferences from cache"""
     
     from app.utils.redis_client import redis_client
-    import asyncio
     
     # Try to get from cache
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    cached_prefs = loop.run_until_complete(
-        redis_client.get(f"user_preferences:{current_user.id}")
-    )
-    loop.close()
+    cached_prefs = await redis_client.get_key(f"user_preferences:{current_user.id}")
     
     if cached_prefs:
         import json
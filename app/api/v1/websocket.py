@@ -5,7 +5,7 @@ from app.utils.websocket_manager import manager
 from app.core.security import verify_token
 from app.models.user import User
 from app.core.logging import logger
-import json
+from app.utils.ws_codec import negotiate_subprotocol, decode_message
 
 router = APIRouter()
 
@@ -27,20 +27,34 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
             await websocket.close(code=4001)
             return
         
+        # Clients that offer a msgpack subprotocol get binary frames, everyone else JSON
+        subprotocol = negotiate_subprotocol(websocket.scope.get('subprotocols', []))
+        
         # Connect to WebSocket manager
-        await manager.connect(websocket, user.id, user.role.value)
+        await manager.connect(websocket, user.id, user.role.value, subprotocol)
         
         try:
             while True:
                 # Receive messages from client
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                frame = await websocket.receive()
+                if frame['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(frame.get('code', 1000))
+                
+                data = frame.get('text')
+                message_data = decode_message(data if data is not None else frame.get('bytes'), subprotocol)
+                
+                # Any inbound frame proves the peer is alive
+                manager.touch(user.id)
                 
                 # Handle different message types
                 message_type = message_data.get('type')
                 
                 if message_type == 'ping':
-                    await websocket.send_text(json.dumps({'type': 'pong'}))
+                    await manager.send_personal_message({'type': 'pong'}, user.id)
+                
+                elif message_type == 'pong':
+                    # Reply to a server heartbeat, nothing else to do
+                    pass
                 
                 elif message_type == 'location_update' and user.role.value == 'delivery_partner':
                     # Handle delivery partner location updates
@@ -51,7 +65,7 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
                     await handle_order_update(user.id, message_data, db)
                 
         except WebSocketDisconnect:
-            manager.disconnect(user.id, user.role.value)
+            manager.disconnect(user.id, user.role.value, websocket)
             logger.info(f"WebSocket disconnected", user_id=user.id)
         
     except Exception as e:
@@ -97,6 +111,11 @@ async def handle_location_update(user_id: int, message_data: dict, db: Session):
             }
             
             await manager.send_personal_message(location_message, order.customer_id)
+            
+            # Keep a downsampled route history for replay on reconnect
+            if order.delivery_partner_id == user_id:
+                from app.service.tracking_service import DeliveryTrackingService
+                await DeliveryTrackingService.record_point(order_id, user_id, latitude, longitude)
         
     except Exception as e:
         logger.error(f"Error handling location update", error=str(e))
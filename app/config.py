@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 
 class Settings(BaseSettings):
     
@@ -12,6 +13,12 @@ class Settings(BaseSettings):
     
     # Redis
     redis_url: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS : int = 50
+    REDIS_SOCKET_TIMEOUT : float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT : float = 2.0
+    REDIS_RETRY_ON_TIMEOUT : bool = True
+    REDIS_RETRY_ATTEMPTS : int = 2
+    REDIS_HEALTH_CHECK_INTERVAL : int = 30
     
     # JWT
     SECRET_KEY : str
@@ -22,6 +29,102 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL : str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND : str = "redis://localhost:6379/0"
     
+    # Batch jobs
+    USER_STATS_CHUNK_SIZE : int = 5000
+    USER_DEACTIVATION_CHUNK_SIZE : int = 1000
+    USER_CLEANUP_CHUNK_SIZE : int = 1000
+    
+    # Promotional campaigns
+    CAMPAIGN_BATCH_SIZE : int = 500         # Recipients per batch-email task
+    CAMPAIGN_BATCHES_PER_RUN : int = 20     # Batches enqueued before the dispatcher re-schedules itself
+    CAMPAIGN_EMAILS_PER_SECOND : int = 50   # Provider throughput the send schedule is spaced to
+    
+    # Order deadlines (Redis sorted-set timers)
+    ORDER_PAYMENT_TIMEOUT_MINUTES : int = 15
+    ORDER_PREPARING_SLA_MINUTES : int = 45
+    ORDER_DEADLINE_BATCH_SIZE : int = 500
+    
+    # Stripe status polling (check_pending_payments, beat every 60s)
+    PAYMENT_POLL_CONCURRENCY : int = 8
+    PAYMENT_POLL_RATE_PER_SECOND : float = 20.0   # Stays well under Stripe's read limit
+    PAYMENT_POLL_BUDGET_SECONDS : int = 45        # Stop before the next beat fires
+    PAYMENT_POLL_MAX_BATCH : int = 2000
+    
+    # Stripe HTTP client (app/service/stripe_gateway.py)
+    STRIPE_API_BASE : str = "https://api.stripe.com"
+    STRIPE_CONNECT_TIMEOUT : float = 2.0
+    STRIPE_READ_TIMEOUT : float = 5.0           # Retrieves and lists
+    STRIPE_WRITE_TIMEOUT : float = 15.0         # Creates and refunds
+    STRIPE_MAX_CONNECTIONS : int = 20           # Per process; above PAYMENT_POLL_CONCURRENCY
+    STRIPE_MAX_KEEPALIVE_CONNECTIONS : int = 10
+    STRIPE_KEEPALIVE_EXPIRY : float = 30.0
+    STRIPE_LATENCY_FLUSH_INTERVAL : float = 10.0
+    
+    # Payment reconciliation (reconcile_payments, nightly)
+    RECONCILE_PAGE_SIZE : int = 100             # Stripe's list maximum
+    RECONCILE_LOOKBACK_HOURS : int = 48         # Re-read intents created this long before the checkpoint
+    RECONCILE_INITIAL_DAYS : int = 7            # Window of the first run
+    RECONCILE_REPORT_MAX_ITEMS : int = 100      # Per discrepancy list; counts are always complete
+    RECONCILE_REPORT_TTL_DAYS : int = 30
+    
+    # Payment history and export
+    PAYMENT_EXPORT_CHUNK_SIZE : int = 1000      # Rows per server-side cursor fetch and per streamed chunk
+    
+    # Stripe webhook events (process_stripe_events)
+    STRIPE_EVENT_BATCH_SIZE : int = 200
+    STRIPE_EVENT_LOCK_TTL : int = 120           # One processor at a time keeps events in order
+    STRIPE_EVENT_RUN_SECONDS : int = 60         # Hand over to a fresh task after this; re-checked against the lock each batch
+    STRIPE_EVENT_MAX_ATTEMPTS : int = 5         # A failing event is dead-lettered after this many tries
+    
+    # Task deduplication (app/task/idempotency.py)
+    TASK_IDEMPOTENCY_LOCK_TTL : int = 300       # Raised per task to a minute past its queue's hard time limit
+    TASK_IDEMPOTENCY_RESULT_TTL : int = 86400
+    
+    # Delivery ETAs (update_estimated_delivery_times, beat every 5 minutes)
+    ETA_AVERAGE_SPEED_KMH : float = 20.0
+    ETA_DEFAULT_TRAVEL_MINUTES : int = 15        # When either end has no coordinates
+    ETA_PICKUP_BUFFER_MINUTES : int = 5
+    ETA_MIN_CHANGE_SECONDS : int = 60            # Smaller moves are not written
+    ETA_NOTIFY_THRESHOLD_MINUTES : int = 5       # Customers hear about moves at least this big
+    
+    # Read-through cache (app/utils/cache.py): per-process LRU in front of Redis
+    CACHE_ENABLED : bool = True
+    CACHE_TTL : int = 300                       # Redis tier
+    CACHE_LOCAL_TTL : int = 30                  # Upper bound on staleness if an invalidation message is missed
+    CACHE_LOCAL_MAXSIZE : int = 2048            # Entries per process
+    CACHE_EARLY_REFRESH_BETA : float = 1.0      # > 1 refreshes earlier, 0 disables early refresh
+    CACHE_LOAD_LOCK_TTL : int = 10              # Longest a load may hold the cross-worker lock
+    CACHE_LOAD_WAIT : float = 2.0               # How long a miss waits for another worker's load
+    
+    # Transactional outbox
+    OUTBOX_BATCH_SIZE : int = 200
+    OUTBOX_POLL_INTERVAL : float = 0.5          # Seconds the relay sleeps when the outbox is empty
+    OUTBOX_MAX_BATCHES_PER_RUN : int = 20       # Beat fallback only
+    OUTBOX_RETENTION_HOURS : int = 72
+    
+    # Outgoing mail. Defaults match a local stand-in: python -m aiosmtpd -n -l localhost:8025
+    SMTP_HOST : str = "localhost"
+    SMTP_PORT : int = 8025
+    SMTP_USERNAME : Optional[str] = None
+    SMTP_PASSWORD : Optional[str] = None
+    SMTP_USE_TLS : bool = False
+    SMTP_POOL_SIZE : int = 2                        # Connections per worker process
+    SMTP_MAX_MESSAGES_PER_CONNECTION : int = 100    # Most providers cap messages per session
+    SMTP_TIMEOUT : int = 10
+    EMAIL_FROM : str = "Food Delivery <no-reply@fooddelivery.local>"
+    
+    # WebSocket heartbeats
+    WS_HEARTBEAT_INTERVAL : int = 25    # Seconds of silence before the server pings
+    WS_IDLE_TIMEOUT : int = 60          # Seconds of silence before the socket is reaped
+    WS_TIMER_TICK : float = 1.0         # Resolution of the heartbeat timer wheel
+    WS_TIMER_SLOTS : int = 64
+    
+    # Delivery tracking trail (Redis Stream per order)
+    TRAIL_MIN_DISTANCE_METERS : float = 25.0    # Keep a point once the rider moved this far...
+    TRAIL_MIN_INTERVAL_SECONDS : int = 15       # ...or this long after the last kept point
+    TRAIL_MAX_POINTS : int = 2000
+    TRAIL_TTL_SECONDS : int = 6 * 3600
+    
     # Payment
     STRIPE_SECRET_KEY: str
     STRIPE_PUBLISHABLE_KEY: str
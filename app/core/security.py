@@ -5,9 +5,9 @@ from passlib.context import CryptContext
 from fastapi import HTTPException , status
 from app.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"] , depreacted = "auto")
+pwd_context = CryptContext(schemes=["bcrypt"] , deprecated = "auto")
 
-def get_hash_password(password :str) -> str:
+def get_password_hash(password :str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password : str  , hashed_password : str) -> str:
@@ -6,6 +6,9 @@ from app.core.logging import configure_logging, logger
 from app.api.v1.router import api_router
 from app.database import engine, Base
 from app.core.exception import AppException
+from app.utils.websocket_manager import manager
+from app.service.stripe_gateway import stripe_gateway
+from app.utils.redis_client import redis_client
 import time
 
 # Configure logging
@@ -17,7 +20,13 @@ Base.metadata.create_all(bind=engine)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Food Delivery Backend")
+    manager.start_reaper()
+    manager.start_relay()
     yield
+    await manager.stop_relay()
+    await manager.stop_reaper()
+    await stripe_gateway.aclose()
+    await redis_client.close()
     logger.info("Shutting down Food Delivery Backend")
 
 app = FastAPI(
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -64,6 +64,13 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order")
     payment = relationship("Payment", back_populates="order", uselist=False)
 
+    __table_args__ = (
+        # Per-customer aggregates (stats, inactivity checks) filter on both
+        Index("ix_orders_customer_id_status", "customer_id", "status"),
+        # Scheduled jobs pick in-flight orders by status (ETA recompute)
+        Index("ix_orders_status_restaurant_id", "status", "restaurant_id"),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
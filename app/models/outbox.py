@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index, text
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class OutboxEvent(Base):
+    '''Domain event written in the same transaction as the change it describes.
+
+    The relay (app/task/outbox_relay.py) turns each row into a Celery task and
+    stamps published_at; events of one aggregate are dispatched in id order.
+    '''
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String, nullable=False)     # "order", "user"
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String, nullable=False)         # "order.created"
+
+    # Celery task to run and its arguments
+    task_name = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)               # {"args": [...], "kwargs": {...}}
+
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    published_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # The relay only ever reads unpublished rows; keep that index small on Postgres
+        Index("ix_outbox_events_pending", "id", postgresql_where=text("published_at IS NULL")),
+        Index("ix_outbox_events_aggregate", "aggregate_type", "aggregate_id", "id"),
+    )
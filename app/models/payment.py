@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean, Text, JSON, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -27,6 +27,7 @@ class Payment(Base):
     
     # Payment details
     stripe_payment_intent_id = Column(String, unique=True)
+    client_secret = Column(String)      # Handed back to clients retrying create-intent
     amount = Column(Float, nullable=False)
     currency = Column(String, default="usd")
     method = Column(Enum(PaymentMethod), nullable=False)
@@ -42,4 +43,35 @@ class Payment(Base):
 
     # Relationships
     user = relationship("User", back_populates="payments")
-    order = relationship("Order", back_populates="payment")
\ No newline at end of file
+    order = relationship("Order", back_populates="payment")
+
+    __table_args__ = (
+        # Payment history: keyset pages per user, newest first
+        Index("ix_payments_user_id_created_at", "user_id", "created_at", "id"),
+        # Open-intent lookup per order on create-intent
+        Index("ix_payments_order_id_status", "order_id", "status"),
+    )
+
+
+class StripeEvent(Base):
+    '''Append-only log of Stripe webhook deliveries, keyed by Stripe's event id.
+
+    The webhook only inserts (ON CONFLICT DO NOTHING), so redeliveries cost one
+    indexed insert; process_stripe_events applies them in Stripe's order.
+    '''
+    __tablename__ = "stripe_events"
+
+    id = Column(String, primary_key=True)                 # evt_...
+    type = Column(String, nullable=False)
+    stripe_created = Column(Integer, nullable=False)      # Unix time the event was created at Stripe
+    payload = Column(JSON, nullable=False)
+
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    failed_at = Column(DateTime(timezone=True), nullable=True)   # Dead-lettered: given up on after repeated failures
+
+    __table_args__ = (
+        Index("ix_stripe_events_pending", "stripe_created", "id", postgresql_where=text("processed_at IS NULL")),
+    )
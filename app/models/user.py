@@ -12,7 +12,7 @@ class UserRole(PyEnum):
     
     
 class User(Base):
-    __table_name__ = "users"
+    __tablename__ = "users"
     
     id = Column(Integer , primary_key=True , index = True , autoincrement=True)
     email = Column(String , unique=True , index=True , nullable=False)
@@ -28,7 +28,7 @@ class User(Base):
     
     # Relationship
     
-    addressess = relationship("UserAddress" , back_populates = "user")
+    addresses = relationship("UserAddress" , back_populates = "user")
     orders = relationship("Order", back_populates="customer", foreign_keys="Order.customer_id")
     restaurants = relationship("Restaurant", back_populates="owner")
     payments = relationship("Payment", back_populates="user")
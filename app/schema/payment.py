@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.payment import PaymentMethod, PaymentStatus
 
@@ -26,3 +26,7 @@ class PaymentResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class PaymentHistoryResponse(BaseModel):
+    items: List[PaymentResponse]
+    next_cursor: Optional[str] = None
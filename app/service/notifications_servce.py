@@ -4,7 +4,8 @@ from app.task.notification_task import (
     send_email_notification,
     send_sms_notification,
     send_push_notification,
-    send_websocket_notification
+    send_websocket_notification,
+    send_websocket_notifications
 )
 
 
@@ -46,27 +47,24 @@ class NotificationService:
     ):
         """Send order status update to all relevant parties"""
         
-        notification_data = {
+        notification_message = {
+            'type': 'order_status_update',
             'order_id': order_id,
             'old_status': old_status,
             'new_status': new_status
         }
         
-        # Notify customer
-        NotificationService.send_order_notification(
-            order_id, customer_id, 'order_status_update', notification_data
+        # One task for customer, restaurant and delivery partner (if assigned)
+        send_websocket_notifications.delay(
+            [customer_id, restaurant_owner_id, delivery_partner_id],
+            notification_message
         )
         
-        # Notify restaurant
-        NotificationService.send_order_notification(
-            order_id, restaurant_owner_id, 'order_status_update', notification_data
+        logger.info(
+            f"Order status notification sent",
+            order_id=order_id,
+            new_status=new_status
         )
-        
-        # Notify delivery partner if assigned
-        if delivery_partner_id:
-            NotificationService.send_order_notification(
-                order_id, delivery_partner_id, 'order_status_update', notification_data
-            )
     
     @staticmethod
     def send_payment_notification(
@@ -6,6 +6,7 @@ from app.models.restaurant import Restaurant, MenuItem
 from app.models.user import User
 from app.core.exception import ValidationException, NotFoundException, AuthorizationException
 from app.core.logging import logger
+from app.utils.scheduler import on_order_created, on_order_status_change
 from app.utils.helpers import (
     calculate_distance, 
     calculate_delivery_fee, 
@@ -116,6 +117,8 @@ class OrderService:
         
         self.db.commit()
         
+        on_order_created(order.id)
+        
         logger.info(f"Order created", order_id=order.id, customer_id=customer_id)
         
         return order
@@ -202,6 +205,8 @@ class OrderService:
         self.db.commit()
         self.db.refresh(order)
         
+        on_order_status_change(order_id, new_status)
+        
         logger.info(
             f"Order status updated",
             order_id=order_id,
@@ -255,6 +260,8 @@ class OrderService:
         self.db.commit()
         self.db.refresh(order)
         
+        on_order_status_change(order_id, OrderStatus.CANCELLED)
+        
         logger.info(f"Order cancelled", order_id=order_id, reason=reason)
         
         return order
@@ -0,0 +1,29 @@
+from typing import Any, Union
+from sqlalchemy.orm import Session
+from app.models.outbox import OutboxEvent
+
+
+def enqueue_event(
+    db: Session,
+    aggregate_type: str,
+    aggregate_id: int,
+    event_type: str,
+    task: Union[str, Any],
+    *args,
+    **kwargs
+) -> OutboxEvent:
+    """Stage a task in the outbox; it is only published if the caller's transaction commits.
+
+    `task` is a Celery task or its name. Nothing talks to the broker here, the
+    outbox relay dispatches the row after commit.
+    """
+    event = OutboxEvent(
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        event_type=event_type,
+        task_name=getattr(task, "name", task),
+        payload={"args": list(args), "kwargs": kwargs}
+    )
+
+    db.add(event)
+    return event
@@ -1,61 +1,230 @@
+import csv
+import io
+import json
 import stripe
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.config import settings
-from app.models.payment import Payment, PaymentStatus, PaymentMethod
+from app.models.payment import Payment, PaymentStatus, PaymentMethod, StripeEvent
 from app.models.order import Order
 from app.core.logging import logger
-from typing import Optional
+from app.utils.scheduler import payment_deadlines
+from app.service.outbox_service import enqueue_event
+from app.service.stripe_gateway import stripe_gateway
+from app.utils.pagination import encode_cursor, decode_cursor
+from typing import Iterator, List, Optional, Tuple
 import datetime
 
-stripe.api_key = settings.stripe_secret_key
+def _insert_ignore(db: Session, model, values: dict) -> bool:
+    '''INSERT ... ON CONFLICT DO NOTHING on the primary key; True if a row was written'''
+    dialect = db.get_bind().dialect.name
+    
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        
+        result = db.execute(dialect_insert(model).values(**values).on_conflict_do_nothing())
+        return result.rowcount == 1
+    
+    # Other backends: let the primary key reject the duplicate
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+# Column order of the finance export
+EXPORT_COLUMNS = (
+    Payment.id, Payment.order_id, Payment.user_id, Payment.stripe_payment_intent_id,
+    Payment.amount, Payment.currency, Payment.method, Payment.status,
+    Payment.refund_amount, Payment.refunded_at, Payment.created_at,
+)
+
+
+# Intents a retrying client can still confirm
+OPEN_PAYMENT_STATUSES = (PaymentStatus.PENDING, PaymentStatus.PROCESSING)
+
+
+def _export_value(value):
+    if isinstance(value, (PaymentStatus, PaymentMethod)):
+        return value.value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def intent_payment_status(intent_status: str) -> PaymentStatus:
+    '''Map a Stripe PaymentIntent status onto ours'''
+    if intent_status == 'succeeded':
+        return PaymentStatus.COMPLETED
+    elif intent_status in ['requires_payment_method', 'payment_failed']:
+        return PaymentStatus.FAILED
+    elif intent_status == 'canceled':
+        return PaymentStatus.CANCELLED
+    elif intent_status in ['requires_confirmation', 'requires_action']:
+        return PaymentStatus.PROCESSING
+    else:
+        return PaymentStatus.PENDING
+
 
 class PaymentService:
     def __init__(self, db: Session):
         self.db = db
     
-    def create_payment_intent(self, order_id: int, payment_method: PaymentMethod) -> Optional[dict]:
+    def record_webhook_event(self, event: dict) -> bool:
+        """Persist a verified webhook event once; False for a redelivery.
+        
+        Processing happens in process_stripe_events, kicked through the outbox
+        in the same transaction so a stored event is never left unannounced.
+        """
+        inserted = _insert_ignore(self.db, StripeEvent, {
+            'id': event['id'],
+            'type': event['type'],
+            'stripe_created': event['created'],
+            'payload': event
+        })
+        
+        if inserted:
+            enqueue_event(
+                self.db, "stripe_event", 0, "stripe.event_received",
+                "app.task.payment_task.process_stripe_events"
+            )
+        
+        self.db.commit()
+        return inserted
+    
+    def _intent_params(self, order: Order) -> dict:
+        return {
+            'amount': int(order.total_amount * 100),
+            'currency': 'INR',
+            'metadata': {
+                'order_id': order.id,
+                'customer_id': order.customer_id
+            }
+        }
+    
+    def _lock_order(self, order_id: int) -> Optional[Order]:
+        # Serializes intent lookup/creation per order; released at the next commit
+        return self.db.query(Order).filter(Order.id == order_id).with_for_update().first()
+    
+    def _open_payment(self, order: Order) -> Optional[Payment]:
+        '''A still-usable intent for the order, via ix_payments_order_id_status'''
+        return self.db.query(Payment).filter(
+            Payment.order_id == order.id,
+            Payment.status.in_(OPEN_PAYMENT_STATUSES),
+            Payment.amount == order.total_amount,
+            Payment.client_secret.isnot(None)
+        ).order_by(Payment.id.desc()).first()
+    
+    def _intent_idempotency_key(self, order: Order) -> str:
+        # Same key for concurrent attempts, a new one once an attempt has been recorded
+        # (or the amount changed, which Stripe would reject under a reused key)
+        attempts = self.db.query(Payment.id).filter(Payment.order_id == order.id).count()
+        return f"order-{order.id}-payment-intent-{attempts}-{int(order.total_amount * 100)}"
+    
+    def _intent_response(self, payment: Payment) -> dict:
+        return {
+            'client_secret': payment.client_secret,
+            'payment_intent_id': payment.stripe_payment_intent_id,
+            'payment_id': payment.id
+        }
+    
+    def _find_open_intent(self, order_id: int) -> Tuple[Optional[Order], Optional[dict], dict]:
+        """Look up a reusable intent under the order lock.
+        
+        Returns (order, response, create_kwargs); response is set when an open
+        intent exists. The lock is released before returning so it is never held
+        across a Stripe round trip.
+        """
+        order = self._lock_order(order_id)
+        if not order:
+            self.db.commit()
+            return None, None, {}
+        
+        existing = self._open_payment(order)
+        if existing:
+            response = self._intent_response(existing)
+            self.db.commit()
+            
+            logger.info(f"Reusing open payment intent", order_id=order_id, payment_intent_id=response['payment_intent_id'])
+            return order, response, {}
+        
+        create_kwargs = dict(self._intent_params(order), idempotency_key=self._intent_idempotency_key(order))
+        self.db.commit()
         
+        return order, None, create_kwargs
+    
+    def _record_payment_intent(self, order_id: int, payment_method: PaymentMethod, intent) -> dict:
+        order = self._lock_order(order_id)
+        
+        # A concurrent request for the same order may have recorded one meanwhile
+        existing = self._open_payment(order)
+        if existing:
+            response = self._intent_response(existing)
+            self.db.commit()
+            return response
+        
+        payment = Payment(
+            user_id=order.customer_id,
+            order_id=order.id,
+            stripe_payment_intent_id=intent.id,
+            client_secret=intent.client_secret,
+            amount=order.total_amount,
+            method=payment_method,
+            status=PaymentStatus.PENDING
+        )
+        
+        self.db.add(payment)
+        self.db.commit()
+        
+        logger.info(f"Payment intent created", 
+                   order_id=order.id, 
+                   payment_intent_id=intent.id)
+        
+        return self._intent_response(payment)
+    
+    def create_payment_intent(self, order_id: int, payment_method: PaymentMethod) -> Optional[dict]:
+        '''Return the order's open intent if it has one, otherwise create it'''
         try:
-            order = self.db.query(Order).filter(Order.id == order_id).first()
+            order, response, create_kwargs = self._find_open_intent(order_id)
             if not order:
                 logger.error(f"Order not found", order_id=order_id)
                 return None
+            if response:
+                return response
             
+            intent = stripe_gateway.create_payment_intent(**create_kwargs)
             
-            amount_cents = int(order.total_amount * 100)
-            
+            return self._record_payment_intent(order_id, payment_method, intent)
             
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency='INR',
-                metadata={
-                    'order_id': order_id,
-                    'customer_id': order.customer_id
-                }
-            )
-            
-            
-            payment = Payment(
-                user_id=order.customer_id,
-                order_id=order_id,
-                stripe_payment_intent_id=intent.id,
-                amount=order.total_amount,
-                method=payment_method,
-                status=PaymentStatus.PENDING
-            )
-            
-            self.db.add(payment)
-            self.db.commit()
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe error creating payment intent", error=str(e))
+            return None
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error creating payment intent", error=str(e))
+            return None
+    
+    async def acreate_payment_intent(self, order_id: int, payment_method: PaymentMethod) -> Optional[dict]:
+        '''create_payment_intent for the API: the Stripe round trip is awaited instead of blocking the loop'''
+        try:
+            # Commits before returning: with a fixed-size pool, requests holding a
+            # connection across the await would starve the rest and block the loop
+            order, response, create_kwargs = self._find_open_intent(order_id)
+            if not order:
+                logger.error(f"Order not found", order_id=order_id)
+                return None
+            if response:
+                return response
             
-            logger.info(f"Payment intent created", 
-                       order_id=order_id, 
-                       payment_intent_id=intent.id)
+            intent = await stripe_gateway.acreate_payment_intent(**create_kwargs)
             
-            return {
-                'client_secret': intent.client_secret,
-                'payment_intent_id': intent.id,
-                'payment_id': payment.id
-            }
+            return self._record_payment_intent(order_id, payment_method, intent)
             
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error creating payment intent", error=str(e))
@@ -72,11 +241,12 @@ class PaymentService:
                 return False
             
             # Retrieve payment intent from Stripe
-            intent = stripe.PaymentIntent.retrieve(payment.stripe_payment_intent_id)
+            intent = stripe_gateway.retrieve_payment_intent(payment.stripe_payment_intent_id)
             
             if intent.status == 'succeeded':
                 payment.status = PaymentStatus.COMPLETED
                 self.db.commit()
+                payment_deadlines.cancel(payment.order_id)
                 logger.info(f"Payment completed", payment_id=payment.id)
                 return True
             elif intent.status == 'requires_payment_method':
@@ -101,23 +271,19 @@ class PaymentService:
     def check_stripe_payment_status(self, payment_intent_id: str) -> PaymentStatus:
         
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            
-            if intent.status == 'succeeded':
-                return PaymentStatus.COMPLETED
-            elif intent.status in ['requires_payment_method', 'payment_failed']:
-                return PaymentStatus.FAILED
-            elif intent.status == 'canceled':
-                return PaymentStatus.CANCELLED
-            elif intent.status in ['requires_confirmation', 'requires_action']:
-                return PaymentStatus.PROCESSING
-            else:
-                return PaymentStatus.PENDING
+            return self.fetch_stripe_payment_status(payment_intent_id)
                 
         except stripe.error.StripeError as e:
             logger.error(f"Error checking payment status", payment_intent_id=payment_intent_id, error=str(e))
             return PaymentStatus.FAILED
     
+    @staticmethod
+    def fetch_stripe_payment_status(payment_intent_id: str) -> PaymentStatus:
+        '''Current status of a PaymentIntent; Stripe errors are raised, not read as FAILED'''
+        intent = stripe_gateway.retrieve_payment_intent(payment_intent_id)
+        
+        return intent_payment_status(intent.status)
+    
     def process_refund(self, payment: Payment, refund_amount: Optional[float] = None) -> bool:
         
         try:
@@ -128,7 +294,7 @@ class PaymentService:
             amount_cents = int(amount_to_refund * 100)
             
             # Create refund
-            refund = stripe.Refund.create(
+            refund = stripe_gateway.create_refund(
                 payment_intent=payment.stripe_payment_intent_id,
                 amount=amount_cents
             )
@@ -136,7 +302,7 @@ class PaymentService:
             if refund.status == 'succeeded':
                 payment.status = PaymentStatus.REFUNDED
                 payment.refund_amount = amount_to_refund
-                payment.refunded_at = datetime.utcnow()
+                payment.refunded_at = datetime.datetime.utcnow()
                 self.db.commit()
                 
                 logger.info(f"Refund processed", payment_id=payment.id, amount=amount_to_refund)
@@ -147,3 +313,67 @@ class PaymentService:
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error processing refund", payment_id=payment.id, error=str(e))
             return False
+    
+    def get_payment_history(self, user_id: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[Payment], Optional[str]]:
+        """One page of a user's payments, newest first.
+        
+        Keyset pagination on (created_at, id) walks ix_payments_user_id_created_at,
+        so page 500 costs the same as page 1. Raises ValueError for a bad cursor.
+        """
+        query = select(Payment).where(Payment.user_id == user_id)
+        
+        position = decode_cursor(cursor)
+        if position:
+            query = query.where(tuple_(Payment.created_at, Payment.id) < tuple_(*position))
+        
+        payments = self.db.execute(
+            query.order_by(Payment.created_at.desc(), Payment.id.desc()).limit(limit + 1)
+        ).scalars().all()
+        
+        next_cursor = None
+        if len(payments) > limit:
+            payments = payments[:limit]
+            next_cursor = encode_cursor(payments[-1].created_at, payments[-1].id)
+        
+        return payments, next_cursor
+    
+    def export_payments(
+        self,
+        export_format: str = "csv",
+        status: Optional[PaymentStatus] = None,
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None
+    ) -> Iterator[str]:
+        """Stream payments as CSV or NDJSON chunks in constant memory.
+        
+        The header goes out before the query runs. Rows are then read through a
+        server-side cursor (yield_per), and each partition becomes one chunk.
+        """
+        names = [column.key for column in EXPORT_COLUMNS]
+        
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(names)
+            yield buffer.getvalue()
+        
+        query = select(*EXPORT_COLUMNS).order_by(Payment.id)
+        if status:
+            query = query.where(Payment.status == status)
+        if created_from:
+            query = query.where(Payment.created_at >= created_from)
+        if created_to:
+            query = query.where(Payment.created_at < created_to)
+        
+        result = self.db.execute(query.execution_options(yield_per=settings.PAYMENT_EXPORT_CHUNK_SIZE))
+        
+        for rows in result.partitions():
+            values = [[_export_value(value) for value in row] for row in rows]
+            
+            if export_format == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(values)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(dict(zip(names, row))) + "\n" for row in values)
@@ -4,7 +4,19 @@ from app.models.restaurant import Restaurant, MenuItem, MenuCategory, Restaurant
 from app.models.user import User
 from app.core.exception import ValidationException, NotFoundException, AuthorizationException
 from app.core.logging import logger
-from app.utils.helpers import calculate_distance
+from app.utils import calculate_distance
+from app.utils.cache import EntityCodec, cache, cached
+
+
+def invalidate_restaurant_cache(restaurant_id: int):
+    cache.invalidate(RestaurantService.get_restaurant_by_id.cache_key(restaurant_id))
+
+
+def invalidate_menu_cache(restaurant_id: int):
+    cache.invalidate(*[
+        RestaurantService.get_menu_items.cache_key(restaurant_id, available_only)
+        for available_only in (True, False)
+    ])
 
 
 class RestaurantService:
@@ -31,8 +43,13 @@ class RestaurantService:
         
         return restaurant
     
+    @cached("restaurant", EntityCodec(Restaurant))
     def get_restaurant_by_id(self, restaurant_id: int) -> Optional[Restaurant]:
         
+        return self._load_restaurant(restaurant_id)
+    
+    def _load_restaurant(self, restaurant_id: int) -> Optional[Restaurant]:
+        # Uncached, for callers that modify what they load
         return self.db.query(Restaurant).filter(
             Restaurant.id == restaurant_id,
             Restaurant.is_active == True
@@ -74,7 +91,7 @@ class RestaurantService:
     def update_restaurant(self, restaurant_id: int, owner_id: int, update_data: dict) -> Restaurant:
         
         
-        restaurant = self.get_restaurant_by_id(restaurant_id)
+        restaurant = self._load_restaurant(restaurant_id)
         if not restaurant:
             raise NotFoundException("Restaurant")
         
@@ -87,6 +104,7 @@ class RestaurantService:
         
         self.db.commit()
         self.db.refresh(restaurant)
+        invalidate_restaurant_cache(restaurant_id)
         
         logger.info(f"Restaurant updated", restaurant_id=restaurant_id)
         
@@ -100,7 +118,7 @@ class RestaurantService:
     ) -> Restaurant:
         
         
-        restaurant = self.get_restaurant_by_id(restaurant_id)
+        restaurant = self._load_restaurant(restaurant_id)
         if not restaurant:
             raise NotFoundException("Restaurant")
         
@@ -110,6 +128,7 @@ class RestaurantService:
         restaurant.status = status
         self.db.commit()
         self.db.refresh(restaurant)
+        invalidate_restaurant_cache(restaurant_id)
         
         logger.info(f"Restaurant status updated", restaurant_id=restaurant_id, status=status.value)
         
@@ -118,7 +137,7 @@ class RestaurantService:
     def add_menu_item(self, restaurant_id: int, owner_id: int, item_data: dict) -> MenuItem:
         
         
-        restaurant = self.get_restaurant_by_id(restaurant_id)
+        restaurant = self._load_restaurant(restaurant_id)
         if not restaurant:
             raise NotFoundException("Restaurant")
         
@@ -133,11 +152,13 @@ class RestaurantService:
         self.db.add(menu_item)
         self.db.commit()
         self.db.refresh(menu_item)
+        invalidate_menu_cache(restaurant_id)
         
         logger.info(f"Menu item added", restaurant_id=restaurant_id, item_id=menu_item.id)
         
         return menu_item
     
+    @cached("menu", EntityCodec(MenuItem, many=True))
     def get_menu_items(self, restaurant_id: int, available_only: bool = True) -> List[MenuItem]:
         
         
@@ -157,7 +178,7 @@ class RestaurantService:
     ) -> MenuItem:
         
         
-        restaurant = self.get_restaurant_by_id(restaurant_id)
+        restaurant = self._load_restaurant(restaurant_id)
         if not restaurant or restaurant.owner_id != owner_id:
             raise AuthorizationException("Not authorized")
         
@@ -172,6 +193,7 @@ class RestaurantService:
         menu_item.is_available = is_available
         self.db.commit()
         self.db.refresh(menu_item)
+        invalidate_menu_cache(restaurant_id)
         
         logger.info(f"Menu item availability updated", item_id=item_id, available=is_available)
         
@@ -0,0 +1,271 @@
+'''
+Stripe API calls over pooled keep-alive HTTP connections.
+
+One httpx client per process is reused for every call, so a request or a poll
+only pays for TLS setup when the pool has no idle connection. Workers use the
+blocking methods, the API uses the `a`-prefixed coroutines so a Stripe round
+trip never blocks the event loop. Every operation has its own timeout and
+feeds the `stripe_latency` histogram. Responses come back as stripe objects
+and failures as stripe.error exceptions, the same as the stripe library.
+'''
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+import httpx
+import stripe
+from app.config import settings
+from app.utils.latency import LatencyHistogram
+from app.core.logging import logger
+
+stripe_latency = LatencyHistogram("stripe_latency", flush_interval=settings.STRIPE_LATENCY_FLUSH_INTERVAL)
+
+
+def _encode(params: Dict, prefix: Optional[str] = None) -> Dict[str, str]:
+    '''Flatten nested params into Stripe's form encoding: metadata[order_id]=1, items[0][price]=...'''
+    encoded = {}
+
+    for key, value in params.items():
+        if value is None:
+            continue
+
+        name = f"{prefix}[{key}]" if prefix else str(key)
+
+        if isinstance(value, dict):
+            encoded.update(_encode(value, name))
+        elif isinstance(value, (list, tuple)):
+            encoded.update(_encode(dict(enumerate(value)), name))
+        elif isinstance(value, bool):
+            encoded[name] = "true" if value else "false"
+        else:
+            encoded[name] = str(value)
+
+    return encoded
+
+
+def _stripe_error(response: httpx.Response) -> stripe.error.StripeError:
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    message = error.get("message") or f"Stripe returned HTTP {response.status_code}"
+    details = dict(
+        http_body=response.text,
+        http_status=response.status_code,
+        json_body=body,
+        headers=dict(response.headers)
+    )
+
+    if response.status_code in (400, 404):
+        return stripe.error.InvalidRequestError(message, error.get("param"), code=error.get("code"), **details)
+    if response.status_code == 401:
+        return stripe.error.AuthenticationError(message, **details)
+    if response.status_code == 402:
+        return stripe.error.CardError(message, error.get("param"), error.get("code"), **details)
+    if response.status_code == 403:
+        return stripe.error.PermissionError(message, **details)
+    if response.status_code == 429:
+        return stripe.error.RateLimitError(message, **details)
+
+    return stripe.error.APIError(message, **details)
+
+
+class StripeGateway:
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str = "https://api.stripe.com",
+        connect_timeout: float = 2.0,
+        read_timeout: float = 5.0,
+        write_timeout: float = 15.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0
+    ):
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+
+        self._client: Optional[httpx.Client] = None
+        self._client_pid: Optional[int] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "StripeGateway":
+        return cls(
+            api_key=settings.STRIPE_SECRET_KEY,
+            api_base=settings.STRIPE_API_BASE,
+            connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+            read_timeout=settings.STRIPE_READ_TIMEOUT,
+            write_timeout=settings.STRIPE_WRITE_TIMEOUT,
+            max_connections=settings.STRIPE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.STRIPE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.STRIPE_KEEPALIVE_EXPIRY
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Stripe-Version": stripe.api_version,
+        }
+
+    def _get_sync_client(self) -> httpx.Client:
+        # Opened lazily and per process: a pool inherited across fork would share sockets
+        with self._lock:
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = httpx.Client(base_url=self.api_base, headers=self._headers(), limits=self.limits)
+                self._client_pid = os.getpid()
+            return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(base_url=self.api_base, headers=self._headers(), limits=self.limits)
+        return self._async_client
+
+    def _request_args(self, method: str, params: Optional[Dict], timeout: float, idempotency_key: Optional[str]) -> Dict:
+        encoded = _encode(params or {})
+        args = {
+            "timeout": httpx.Timeout(timeout, connect=self.connect_timeout),
+            "headers": {"Idempotency-Key": idempotency_key} if idempotency_key else None,
+        }
+
+        if method == "GET":
+            args["params"] = encoded
+        else:
+            args["data"] = encoded
+
+        return args
+
+    def _result(self, operation: str, response: httpx.Response, started: float):
+        elapsed = time.perf_counter() - started
+
+        if response.status_code >= 400:
+            stripe_latency.observe(operation, elapsed, "error")
+            raise _stripe_error(response)
+
+        stripe_latency.observe(operation, elapsed)
+        return stripe.StripeObject.construct_from(response.json(), self.api_key)
+
+    def _transport_error(self, operation: str, error: httpx.HTTPError, started: float, timeout: float):
+        outcome = "timeout" if isinstance(error, httpx.TimeoutException) else "connection_error"
+        stripe_latency.observe(operation, time.perf_counter() - started, outcome)
+        logger.error(f"Stripe request failed", operation=operation, outcome=outcome, error=str(error))
+
+        if outcome == "timeout":
+            return stripe.error.APIConnectionError(f"Stripe {operation} timed out after {timeout}s")
+        return stripe.error.APIConnectionError(f"Stripe {operation} failed: {error}")
+
+    def request(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        timeout: Optional[float] = None,
+        idempotency_key: Optional[str] = None
+    ):
+        timeout = timeout or (self.read_timeout if method == "GET" else self.write_timeout)
+        started = time.perf_counter()
+
+        try:
+            response = self._get_sync_client().request(
+                method, path, **self._request_args(method, params, timeout, idempotency_key)
+            )
+        except httpx.HTTPError as e:
+            raise self._transport_error(operation, e, started, timeout)
+
+        return self._result(operation, response, started)
+
+    async def arequest(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        timeout: Optional[float] = None,
+        idempotency_key: Optional[str] = None
+    ):
+        timeout = timeout or (self.read_timeout if method == "GET" else self.write_timeout)
+        started = time.perf_counter()
+
+        try:
+            response = await self._get_async_client().request(
+                method, path, **self._request_args(method, params, timeout, idempotency_key)
+            )
+        except httpx.HTTPError as e:
+            raise self._transport_error(operation, e, started, timeout)
+
+        return self._result(operation, response, started)
+
+    # PaymentIntents
+
+    def create_payment_intent(self, timeout: Optional[float] = None, idempotency_key: Optional[str] = None, **params):
+        return self.request("payment_intent.create", "POST", "/v1/payment_intents", params, timeout, idempotency_key)
+
+    async def acreate_payment_intent(self, timeout: Optional[float] = None, idempotency_key: Optional[str] = None, **params):
+        return await self.arequest("payment_intent.create", "POST", "/v1/payment_intents", params, timeout, idempotency_key)
+
+    def retrieve_payment_intent(self, intent_id: str, timeout: Optional[float] = None):
+        return self.request("payment_intent.retrieve", "GET", f"/v1/payment_intents/{intent_id}", timeout=timeout)
+
+    async def aretrieve_payment_intent(self, intent_id: str, timeout: Optional[float] = None):
+        return await self.arequest("payment_intent.retrieve", "GET", f"/v1/payment_intents/{intent_id}", timeout=timeout)
+
+    # Refunds
+
+    def create_refund(self, timeout: Optional[float] = None, idempotency_key: Optional[str] = None, **params):
+        return self.request("refund.create", "POST", "/v1/refunds", params, timeout, idempotency_key)
+
+    async def acreate_refund(self, timeout: Optional[float] = None, idempotency_key: Optional[str] = None, **params):
+        return await self.arequest("refund.create", "POST", "/v1/refunds", params, timeout, idempotency_key)
+
+    # Lists
+
+    def list_pages(self, operation: str, path: str, params: Optional[Dict] = None, page_size: int = 100, timeout: Optional[float] = None):
+        '''Yield each page of a list endpoint, following starting_after until has_more is false'''
+        params = dict(params or {}, limit=page_size)
+
+        while True:
+            page = self.request(operation, "GET", path, params, timeout)
+
+            if page.data:
+                yield page.data
+            if not page.has_more or not page.data:
+                return
+
+            params["starting_after"] = page.data[-1].id
+
+    def list_payment_intents(self, page_size: int = 100, **params):
+        return self.list_pages("payment_intent.list", "/v1/payment_intents", params, page_size)
+
+    def list_refunds(self, page_size: int = 100, **params):
+        return self.list_pages("refund.list", "/v1/refunds", params, page_size)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._client_pid == os.getpid():
+                self._client.close()
+            self._client = None
+
+        stripe_latency.flush()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+        await asyncio.to_thread(stripe_latency.flush)
+
+
+stripe_gateway = StripeGateway.from_settings()
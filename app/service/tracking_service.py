@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.core.logging import logger
+from app.utils import calculate_distance
+from app.utils.redis_client import redis_client
+
+
+# Last accepted point per order, so downsampling rarely needs a Redis read
+_last_points: "OrderedDict[int, Tuple[float, float, float]]" = OrderedDict()
+_LAST_POINTS_MAX = 10000
+
+
+def trail_key(order_id: int) -> str:
+    return f"delivery_trail:{order_id}"
+
+
+def encode_polyline(points: List[Tuple[float, float]], precision: int = 5) -> str:
+    '''Encode (lat, lng) pairs with the Google encoded polyline algorithm'''
+    factor = 10 ** precision
+    output = []
+    prev_lat = prev_lng = 0
+
+    for lat, lng in points:
+        lat_i = int(round(lat * factor))
+        lng_i = int(round(lng * factor))
+
+        for delta in (lat_i - prev_lat, lng_i - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+
+            while value >= 0x20:
+                output.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            output.append(chr(value + 63))
+
+        prev_lat, prev_lng = lat_i, lng_i
+
+    return "".join(output)
+
+
+class DeliveryTrackingService:
+
+    @staticmethod
+    async def record_point(
+        order_id: int,
+        delivery_partner_id: int,
+        latitude: float,
+        longitude: float
+    ) -> bool:
+        """Append a location to the order's trail if it moved or aged enough"""
+
+        now = time.time()
+        last = await DeliveryTrackingService._last_point(order_id)
+
+        if last:
+            last_lat, last_lng, last_ts = last
+            moved_m = calculate_distance(last_lat, last_lng, latitude, longitude) * 1000
+
+            if (moved_m < settings.TRAIL_MIN_DISTANCE_METERS and
+                    now - last_ts < settings.TRAIL_MIN_INTERVAL_SECONDS):
+                return False
+
+        entry_id = await redis_client.stream_append(
+            trail_key(order_id),
+            {
+                'lat': latitude,
+                'lng': longitude,
+                'ts': round(now, 3),
+                'partner_id': delivery_partner_id
+            },
+            maxlen=settings.TRAIL_MAX_POINTS,
+            expire=settings.TRAIL_TTL_SECONDS
+        )
+
+        if entry_id is None:
+            return False
+
+        _remember(order_id, (latitude, longitude, now))
+        return True
+
+    @staticmethod
+    async def get_trail(order_id: int) -> Dict:
+        """Whole trail of an order as one polyline, for redrawing the map in one call"""
+
+        entries = await redis_client.stream_range(trail_key(order_id))
+
+        points = []
+        timestamps = []
+        for _, fields in entries:
+            points.append((float(fields['lat']), float(fields['lng'])))
+            timestamps.append(float(fields['ts']))
+
+        latest = None
+        if points:
+            latest = {
+                'latitude': points[-1][0],
+                'longitude': points[-1][1],
+                'timestamp': timestamps[-1]
+            }
+
+        return {
+            'order_id': order_id,
+            'points': len(points),
+            'polyline': encode_polyline(points),
+            'started_at': timestamps[0] if timestamps else None,
+            'latest': latest
+        }
+
+    @staticmethod
+    async def _last_point(order_id: int) -> Optional[Tuple[float, float, float]]:
+        if order_id in _last_points:
+            _last_points.move_to_end(order_id)
+            return _last_points[order_id]
+
+        # Another worker may have written the trail, fall back to the stream tail
+        entry = await redis_client.stream_last(trail_key(order_id))
+        if not entry:
+            return None
+
+        try:
+            fields = entry[1]
+            point = (float(fields['lat']), float(fields['lng']), float(fields['ts']))
+        except (KeyError, ValueError) as e:
+            logger.error(f"Malformed delivery trail entry", order_id=order_id, error=str(e))
+            return None
+
+        _remember(order_id, point)
+        return point
+
+
+def _remember(order_id: int, point: Tuple[float, float, float]):
+    _last_points[order_id] = point
+    _last_points.move_to_end(order_id)
+
+    while len(_last_points) > _LAST_POINTS_MAX:
+        _last_points.popitem(last=False)
@@ -4,7 +4,12 @@ from app.models.user import User, UserAddress, UserRole
 from app.core.security import get_password_hash, verify_password
 from app.core.exception import ValidationException, NotFoundException
 from app.core.logging import logger
-from app.utils.helpers import validate_email, validate_phone, format_phone
+from app.utils import validate_email, validate_phone, format_phone
+from app.utils.cache import EntityCodec, cache, cached
+
+
+def invalidate_user_cache(*user_ids: int):
+    cache.invalidate(*[UserService.get_user_by_id.cache_key(user_id) for user_id in user_ids])
 
 
 class UserService:
@@ -83,8 +88,14 @@ class UserService:
         
         return user
     
+    # The password hash stays out of Redis; it loads from the database if read
+    @cached("user", EntityCodec(User, exclude=("hashed_password",)))
     def get_user_by_id(self, user_id: int) -> Optional[User]:
      
+        return self._load_user(user_id)
+    
+    def _load_user(self, user_id: int) -> Optional[User]:
+        # Uncached, for callers that modify what they load
         return self.db.query(User).filter(User.id == user_id).first()
     
     def get_user_by_email(self, email: str) -> Optional[User]:
@@ -98,7 +109,7 @@ class UserService:
     def update_user(self, user_id: int, **kwargs) -> User:
       
         
-        user = self.get_user_by_id(user_id)
+        user = self._load_user(user_id)
         if not user:
             raise NotFoundException("User")
         
@@ -114,6 +125,7 @@ class UserService:
         
         self.db.commit()
         self.db.refresh(user)
+        invalidate_user_cache(user_id)
         
         logger.info(f"User updated", user_id=user_id)
         
@@ -122,12 +134,13 @@ class UserService:
     def deactivate_user(self, user_id: int) -> bool:
        
         
-        user = self.get_user_by_id(user_id)
+        user = self._load_user(user_id)
         if not user:
             raise NotFoundException("User")
         
         user.is_active = False
         self.db.commit()
+        invalidate_user_cache(user_id)
         
         logger.info(f"User deactivated", user_id=user_id)
         
@@ -136,12 +149,13 @@ class UserService:
     def verify_user_email(self, user_id: int) -> bool:
         
         
-        user = self.get_user_by_id(user_id)
+        user = self._load_user(user_id)
         if not user:
             raise NotFoundException("User")
         
         user.is_verified = True
         self.db.commit()
+        invalidate_user_cache(user_id)
         
         logger.info(f"User email verified", user_id=user_id)
         
@@ -150,7 +164,7 @@ class UserService:
     def change_password(self, user_id: int, old_password: str, new_password: str) -> bool:
       
         
-        user = self.get_user_by_id(user_id)
+        user = self._load_user(user_id)
         if not user:
             raise NotFoundException("User")
         
@@ -1,15 +1,85 @@
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
+from fnmatch import fnmatch
+from kombu import Exchange, Queue
 from app.config import settings
 
+# Queues, one per workload so a flood in one never starves another
+QUEUE_REALTIME = "realtime"      # WebSocket / push notifications
+QUEUE_PAYMENTS = "payments"      # Stripe processing, refunds, polling
+QUEUE_ORDERS = "orders"          # Order lifecycle and ETAs
+QUEUE_MESSAGING = "messaging"    # Emails and SMS
+QUEUE_BATCH = "batch"            # Nightly jobs, reports, campaigns
+QUEUE_DEFAULT = "default"        # Anything not routed explicitly
+
+# Worker settings per queue. Priority follows the Redis transport: 0 is the most urgent.
+QUEUE_PROFILES = {
+    QUEUE_REALTIME: {"concurrency": 16, "prefetch_multiplier": 4, "soft_time_limit": 10, "time_limit": 20, "priority": 0},
+    QUEUE_PAYMENTS: {"concurrency": 8, "prefetch_multiplier": 1, "soft_time_limit": 60, "time_limit": 120, "priority": 0},
+    QUEUE_ORDERS: {"concurrency": 8, "prefetch_multiplier": 2, "soft_time_limit": 60, "time_limit": 120, "priority": 3},
+    QUEUE_MESSAGING: {"concurrency": 4, "prefetch_multiplier": 8, "soft_time_limit": 30, "time_limit": 60, "priority": 6},
+    QUEUE_BATCH: {"concurrency": 2, "prefetch_multiplier": 1, "soft_time_limit": 55 * 60, "time_limit": 60 * 60, "priority": 9},
+    QUEUE_DEFAULT: {"concurrency": 4, "prefetch_multiplier": 1, "soft_time_limit": 60, "time_limit": 30 * 60, "priority": 5},
+}
+
+# Task name pattern -> queue. First match wins, so specific names go before wildcards.
+TASK_ROUTES = {
+    "app.task.notification_task.send_email_*": QUEUE_MESSAGING,
+    "app.task.notification_task.send_bulk_email*": QUEUE_MESSAGING,
+    "app.task.notification_task.send_sms_notification": QUEUE_MESSAGING,
+    "app.task.notification_task.*": QUEUE_REALTIME,
+    "app.task.payment_task.reconcile_payments": QUEUE_BATCH,
+    "app.task.payment_task.*": QUEUE_PAYMENTS,
+    "app.task.order_task.*": QUEUE_ORDERS,
+    "app.task.user_task.send_promotional_email_to_inactive_users": QUEUE_BATCH,
+    "app.task.user_task.send_*": QUEUE_MESSAGING,
+    "app.task.user_task.deactivate_inactive_users": QUEUE_BATCH,
+    "app.task.user_task.cleanup_unverified_users": QUEUE_BATCH,
+    "app.task.user_task.generate_user_report": QUEUE_BATCH,
+    "app.task.user_task.batch_update_user_stats": QUEUE_BATCH,
+    "app.task.outbox_relay.relay_outbox": QUEUE_REALTIME,
+    "app.task.outbox_relay.purge_outbox": QUEUE_BATCH,
+}
+
+
+def queue_for_task(task_name: str) -> str:
+    for pattern, queue in TASK_ROUTES.items():
+        if fnmatch(task_name, pattern):
+            return queue
+
+    return QUEUE_DEFAULT
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    return {"queue": queue_for_task(name)}
+
+
+class QueueProfileAnnotations:
+    '''Give every task the time limits and priority of the queue it is routed to'''
+
+    def annotate(self, task):
+        profile = QUEUE_PROFILES[queue_for_task(task.name)]
+
+        return {
+            "soft_time_limit": profile["soft_time_limit"],
+            "time_limit": profile["time_limit"],
+            "priority": profile["priority"],
+        }
+
+
 celery_app = Celery(
     "food_deliver",
     broker  = settings.CELERY_BROKER_URL,
     backend = settings.CELERY_RESULT_BACKEND,
-    
+
     include=[
         "app.task.order_task",
         "app.task.notification_task",
-        "app.task.payment_task"
+        "app.task.payment_task",
+        "app.task.user_task",
+        "app.task.monitoring",
+        "app.task.outbox_relay"
     ]
 )
 
@@ -23,20 +93,75 @@ celery_app.conf.update(
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=60,  # 1 minute
     worker_prefetch_multiplier=1,
-    worker_max_tasks_per_child=1000,)
+    worker_max_tasks_per_child=1000,
+    task_queues=[Queue(name, Exchange(name), routing_key=name) for name in QUEUE_PROFILES],
+    task_default_queue=QUEUE_DEFAULT,
+    task_routes=(route_task,),
+    task_annotations=(QueueProfileAnnotations(),),
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+    },)
 
 
 
 celery_app.conf.beat_schedule = {
     "check-payment-status": {
-        "task": "app.tasks.payment_tasks.check_pending_payments",
+        "task": "app.task.payment_task.check_pending_payments",
         "schedule": 60.0,  # Run every minute
     },
     "update-order-status": {
-        "task": "app.tasks.order_tasks.update_estimated_delivery_times",
+        "task": "app.task.order_task.update_estimated_delivery_times",
         "schedule": 300.0,  # Run every 5 minutes
     },
+    "process-order-deadlines": {
+        "task": "app.task.order_task.process_order_deadlines",
+        "schedule": 5.0,  # Cheap when nothing is due: one ZRANGEBYSCORE per timer
+    },
+    "relay-outbox": {
+        "task": "app.task.outbox_relay.relay_outbox",
+        "schedule": 5.0,  # Fallback for the python -m app.task.outbox_relay process
+    },
+    "purge-outbox": {
+        "task": "app.task.outbox_relay.purge_outbox",
+        "schedule": 3600.0,
+    },
+    "process-stripe-events": {
+        "task": "app.task.payment_task.process_stripe_events",
+        "schedule": 30.0,  # Fallback; new events kick processing through the outbox
+    },
+    "reconcile-payments": {
+        "task": "app.task.payment_task.reconcile_payments",
+        "schedule": crontab(hour=3, minute=30),  # Nightly, off peak
+    },
+    "record-queue-metrics": {
+        "task": "app.task.monitoring.record_queue_metrics",
+        "schedule": 30.0,
+    },
 }
-    
-    
-    
\ No newline at end of file
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    '''Per-process setup, paid once per forked child instead of once per task'''
+    from app.database import engine
+    from app.utils.redis_client import sync_redis_client
+
+    # Connections inherited from the parent must not be reused after fork
+    engine.dispose(close=False)
+    sync_redis_client.init_pool()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    from app.utils.redis_client import sync_redis_client
+    from app.utils.mailer import mail_transport
+    from app.service.stripe_gateway import stripe_gateway
+
+    sync_redis_client.close()
+    mail_transport.close()
+    stripe_gateway.close()
+
+
+# Publishers need the queue-wait signal handlers too, not only workers
+import app.task.monitoring  # noqa: E402,F401
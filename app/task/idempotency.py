@@ -0,0 +1,105 @@
+import functools
+import inspect
+import json
+import uuid
+from typing import Dict
+from app.config import settings
+from app.utils.redis_client import sync_redis_client
+from app.task.celery_app import QUEUE_PROFILES, queue_for_task
+from app.core.logging import logger
+
+# Per task counters: "<task>:executed", "<task>:duplicate", "<task>:cached"
+STATS_KEY = "idempotency_stats"
+
+
+def idempotency_key(task_name: str, *business_ids) -> str:
+    return f"idempotency:{task_name}:" + ":".join(str(business_id) for business_id in business_ids)
+
+
+def idempotent(*key_args: str, lock_ttl: int = None, result_ttl: int = None):
+    '''Run a task body at most once per business id.
+
+    Goes under @celery_app.task. The key is the task name plus the values of
+    `key_args`. A delivery that finds a cached result returns it, one that finds
+    the key held by a running execution returns None; neither touches the
+    database or Stripe. Only truthy results are cached, so a failed attempt can
+    be retried. If Redis is down the body runs anyway.
+
+    Each execution holds the key with its own token and releases it by
+    compare-and-delete, so it never frees a lock a redelivered copy took after
+    it expired. The TTL stays above the hard time limit of the task's queue.
+    '''
+
+    def decorator(func):
+        task_name = f"{func.__module__}.{func.__name__}"
+        signature = inspect.signature(func)
+        ttl = max(
+            lock_ttl or settings.TASK_IDEMPOTENCY_LOCK_TTL,
+            QUEUE_PROFILES[queue_for_task(task_name)]["time_limit"] + 60
+        )
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+
+            key = idempotency_key(task_name, *[bound.arguments[name] for name in key_args])
+            result_key = f"{key}:result"
+
+            try:
+                cached = sync_redis_client.redis.get(result_key)
+                if cached is not None:
+                    _record(task_name, "cached")
+                    return json.loads(cached)
+
+                # Not acquire_lock: a Redis error has to run the body, not count as a duplicate
+                token = uuid.uuid4().hex
+                if not sync_redis_client.redis.set(key, token, nx=True, ex=ttl):
+                    _record(task_name, "duplicate")
+                    logger.info(f"Duplicate task skipped", task=task_name, key=key)
+                    return None
+
+            except Exception as e:
+                logger.error(f"Idempotency check failed", task=task_name, key=key, error=str(e))
+                return func(*args, **kwargs)
+
+            try:
+                result = func(*args, **kwargs)
+                _record(task_name, "executed")
+
+                if result:
+                    sync_redis_client.set(
+                        result_key, json.dumps(result), expire=result_ttl or settings.TASK_IDEMPOTENCY_RESULT_TTL
+                    )
+
+                return result
+
+            finally:
+                sync_redis_client.release_lock(key, token)
+
+        return wrapper
+
+    return decorator
+
+
+def _record(task_name: str, outcome: str):
+    try:
+        sync_redis_client.redis.hincrby(STATS_KEY, f"{task_name}:{outcome}", 1)
+
+    except Exception as e:
+        logger.error(f"Failed to record idempotency stats", task=task_name, error=str(e))
+
+
+def get_idempotency_metrics() -> Dict[str, dict]:
+    '''Executions vs deduplicated deliveries per task'''
+    metrics = {}
+
+    for field, count in sync_redis_client.redis.hgetall(STATS_KEY).items():
+        task_name, outcome = field.rsplit(":", 1)
+        metrics.setdefault(task_name, {"executed": 0, "duplicate": 0, "cached": 0})[outcome] = int(count)
+
+    for values in metrics.values():
+        total = sum(values.values())
+        values["dedupe_ratio"] = round((values["duplicate"] + values["cached"]) / total, 4) if total else 0.0
+
+    return metrics
@@ -0,0 +1,102 @@
+import time
+import redis
+from typing import Dict, List
+from celery.signals import before_task_publish, task_prerun
+from app.config import settings
+from app.task.celery_app import celery_app, QUEUE_PROFILES, queue_for_task
+from app.utils.redis_client import sync_redis_client
+from app.core.logging import logger
+
+# Last N queue wait samples kept per queue
+LATENCY_SAMPLES = 500
+LATENCY_KEY = "celery_queue_wait:{queue}"
+
+_broker = None
+
+
+def _broker_client():
+    global _broker
+    if _broker is None:
+        _broker = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    return _broker
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    '''Stamp every message so the worker can measure time spent waiting in the queue'''
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    try:
+        published_at = getattr(task.request, "published_at", None)
+        if published_at is None:
+            return
+
+        delivery_info = task.request.delivery_info or {}
+        queue = delivery_info.get("routing_key") or queue_for_task(task.name)
+        key = LATENCY_KEY.format(queue=queue)
+
+        with sync_redis_client.pipeline() as pipe:
+            pipe.lpush(key, round(time.time() - float(published_at), 4))
+            pipe.ltrim(key, 0, LATENCY_SAMPLES - 1)
+
+    except Exception as e:
+        logger.error(f"Failed to record queue wait", task=getattr(task, "name", None), error=str(e))
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def get_queue_metrics() -> Dict[str, dict]:
+    '''Depth (all priority sub-queues) and recent wait times for every queue'''
+    sep = celery_app.conf.broker_transport_options.get("sep", ":")
+    steps = celery_app.conf.broker_transport_options.get("priority_steps", [0])
+
+    broker_pipe = _broker_client().pipeline(transaction=False)
+    for queue in QUEUE_PROFILES:
+        for step in steps:
+            broker_pipe.llen(queue if not step else f"{queue}{sep}{step}")
+    depths = broker_pipe.execute()
+
+    with sync_redis_client.pipeline() as latency_pipe:
+        for queue in QUEUE_PROFILES:
+            latency_pipe.lrange(LATENCY_KEY.format(queue=queue), 0, -1)
+        latencies = latency_pipe.execute()
+
+    metrics = {}
+    for i, queue in enumerate(QUEUE_PROFILES):
+        samples = sorted(float(s) for s in latencies[i])
+
+        metrics[queue] = {
+            "depth": sum(depths[i * len(steps):(i + 1) * len(steps)]),
+            "wait_samples": len(samples),
+            "wait_avg_seconds": round(sum(samples) / len(samples), 4) if samples else 0.0,
+            "wait_p50_seconds": _percentile(samples, 50),
+            "wait_p95_seconds": _percentile(samples, 95),
+            "wait_max_seconds": samples[-1] if samples else 0.0,
+        }
+
+    return metrics
+
+
+@celery_app.task
+def record_queue_metrics():
+    '''Log a queue depth / wait snapshot for dashboards'''
+    try:
+        metrics = get_queue_metrics()
+
+        for queue, values in metrics.items():
+            logger.info(f"Celery queue metrics", queue=queue, **values)
+
+        return metrics
+
+    except Exception as e:
+        logger.error(f"Failed to record queue metrics", error=str(e))
+        return None
@@ -1,19 +1,38 @@
 from celery import current_app
+from typing import Iterable, Tuple
 from app.task.celery_app import celery_app
-from app.utils.websocket_manager import manager
-from app.utils.redis_client import redis_client
+from app.database import SessionLocal
+from app.models.user import User
+from app.utils.websocket_manager import USER_CHANNEL_PREFIX, BROADCAST_CHANNEL
+from app.utils.redis_client import sync_redis_client
+from app.utils.mailer import send_templated_emails
 from app.core.logging import logger
-import asyncio
+import json
+
+
+def publish_websocket_message(user_ids: Iterable[int], message: dict) -> int:
+    '''Publish one payload to every user's channel in a single pipelined round trip'''
+    payload = json.dumps(message)
+    
+    with sync_redis_client.pipeline() as pipe:
+        for user_id in user_ids:
+            pipe.publish(f"{USER_CHANNEL_PREFIX}{user_id}", payload)
+        
+        return len(pipe.execute())
+
+def publish_websocket_messages(messages: Iterable[Tuple[int, dict]]) -> int:
+    '''Publish a different payload per user, still in one pipelined round trip'''
+    with sync_redis_client.pipeline() as pipe:
+        for user_id, message in messages:
+            pipe.publish(f"{USER_CHANNEL_PREFIX}{user_id}", json.dumps(message))
+        
+        return len(pipe.execute())
 
 @celery_app.task
 def send_websocket_notification(user_id: int, message: dict):
     
     try:
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(manager.send_personal_message(message, user_id))
-        loop.close()
+        publish_websocket_message([user_id], message)
         
         logger.info(f"WebSocket notification sent", user_id=user_id, message_type=message.get('type'))
         return True
@@ -22,9 +41,36 @@ def send_websocket_notification(user_id: int, message: dict):
         return False
 
 @celery_app.task
-def send_email_notification(user_email: str, subject: str, template: str, context: dict):
+def send_websocket_notifications(user_ids: list, message: dict):
+    '''Deliver one payload to several users: one recipient query, one pipelined publish'''
+    db = SessionLocal()
     try:
+        wanted = {user_id for user_id in user_ids if user_id}
+        if not wanted:
+            return 0
+        
+        recipients = [
+            row.id for row in db.query(User.id).filter(
+                User.id.in_(wanted),
+                User.is_active == True
+            ).all()
+        ]
         
+        sent = publish_websocket_message(recipients, message) if recipients else 0
+        
+        logger.info(f"WebSocket notification sent", recipients=sent, message_type=message.get('type'))
+        return sent
+    except Exception as e:
+        logger.error(f"Failed to send WebSocket notifications", user_ids=user_ids, error=str(e))
+        return 0
+    finally:
+        db.close()
+
+@celery_app.task
+def send_email_notification(user_email: str, subject: str, template: str, context: dict):
+    try:
+        if not send_templated_emails([{'email': user_email}], subject, template, context):
+            return False
         
         logger.info(f"Email notification sent", email=user_email, subject=subject)
         return True
@@ -32,6 +78,22 @@ def send_email_notification(user_email: str, subject: str, template: str, contex
         logger.error(f"Failed to send email notification", email=user_email, error=str(e))
         return False
 
+@celery_app.task
+def send_bulk_email_notification(recipients: list, subject: str, template: str, context: dict = None):
+    '''Send one template to many recipients over a single pooled SMTP connection.
+    
+    recipients is a list of {"email": ..., "context": {...}}; per-recipient context
+    is merged over the shared one.
+    '''
+    try:
+        sent = send_templated_emails(recipients, subject, template, context)
+        
+        logger.info(f"Bulk email notification sent", recipients=len(recipients), sent=sent, subject=subject, template=template)
+        return sent
+    except Exception as e:
+        logger.error(f"Failed to send bulk email notification", recipients=len(recipients), error=str(e))
+        return 0
+
 @celery_app.task
 def send_sms_notification(phone_number: str, message: str):
    
@@ -61,16 +123,11 @@ def send_push_notification(user_id: int, title: str, body: str, data: dict = Non
 def broadcast_system_notification(message: dict, roles: list = None):
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        if roles:
-            for role in roles:
-                loop.run_until_complete(manager.send_to_role(message, role))
-        else:
-            loop.run_until_complete(manager.broadcast(message))
-        
-        loop.close()
+        # API processes hold the sockets; each one fans this out to its own connections
+        sync_redis_client.redis.publish(
+            BROADCAST_CHANNEL,
+            json.dumps({'roles': roles, 'message': message})
+        )
         
         logger.info(f"System notification broadcasted", roles=roles)
         return True
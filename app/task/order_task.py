@@ -1,13 +1,25 @@
 from celery import current_app
 from sqlalchemy.orm  import Session
+from sqlalchemy import update , select , exists
 from app.database  import SessionLocal
-from datetime import datetime , timedelta
+from datetime import datetime , timedelta , timezone
 from app.task.celery_app import celery_app
 from app.models.order import Order , OrderStatus
+from app.models.payment import Payment , PaymentStatus
+from app.models.restaurant import Restaurant
+from app.config import settings
+from app.utils import calculate_distance
+from app.utils.redis_client import sync_redis_client
 from app.utils.websocket_manager import manager
+from app.utils.scheduler import payment_deadlines , preparing_deadlines , on_order_status_change
+from app.task.notification_task import send_websocket_notifications, publish_websocket_messages, broadcast_system_notification
+from app.task.idempotency import idempotent
+from app.service.tracking_service import trail_key
 from app.core.logging import logger
+import time
 
 @celery_app.task
+@idempotent("order_id" , "new_status")
 def update_order_status(order_id :int , new_status : str):
     # Update order and notify relevant parties 
     
@@ -21,13 +33,13 @@ def update_order_status(order_id :int , new_status : str):
         
         old_status = order.status
         
-        order.status = OrderStatus[new_status]
+        order.status = OrderStatus(new_status)
         
         #Update timestamp based on status 
         
-        now = datetime.now()
+        now = datetime.now(timezone.utc)
         
-        if new_status == OrderStatus.PREPARING.values:
+        if new_status == OrderStatus.PREPARING.value:
             order.prepared_at = now
             
         elif new_status == OrderStatus.OUT_FOR_DELIVERY.value:
@@ -41,28 +53,24 @@ def update_order_status(order_id :int , new_status : str):
             
         db.commit()
         
+        on_order_status_change(order_id , order.status)
+        
         # Send real - time notifications 
         
         notification_message = {
             "type" : "order_status_update",
             "order_id" : order_id,
-            "order_number" : Order.order_number,
+            "order_number" : order.order_number,
             "old_status": old_status.value,
             "new_status": new_status,
             "timestamp": now.isoformat()
         }  
         
-        # Notify customer 
-        
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_websocket_notification",
-            args=[order.restaurant.owner_id, notification_message]
-        )
-        
+        # Notify customer, restaurant and delivery partner with a single task 
         
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_websocket_notification",
-            args=[order.restaurant.owner_id, notification_message]
+        send_websocket_notifications.delay(
+            [order.customer_id, order.restaurant.owner_id, order.delivery_partner_id],
+            notification_message
         )
         
         logger.info(f"Order status updated", order_id=order_id, 
@@ -77,6 +85,135 @@ def update_order_status(order_id :int , new_status : str):
     finally:
         db.close()
         
+# Orders whose ETA can still move; the scheduled recompute touches nothing else
+ACTIVE_ETA_STATUSES = (OrderStatus.PREPARING , OrderStatus.READY_FOR_PICKUP , OrderStatus.OUT_FOR_DELIVERY)
+
+
+def _eta_rows(db : Session , condition):
+    # One query joined to restaurants, no lazy relationship loads per order
+    
+    return db.execute(
+        select(
+            Order.id,
+            Order.customer_id,
+            Order.status,
+            Order.created_at,
+            Order.prepared_at,
+            Order.estimated_delivery_time,
+            Order.delivery_latitude,
+            Order.delivery_longitude,
+            Restaurant.delivery_time,
+            Restaurant.latitude,
+            Restaurant.longitude
+        )
+        .join(Restaurant , Restaurant.id == Order.restaurant_id)
+        .where(condition)
+    ).all()
+
+
+def _partner_positions(order_ids : list) -> dict:
+    # Latest trail point of every order on the road, one pipelined round trip
+    
+    if not order_ids:
+        return {}
+    
+    with sync_redis_client.pipeline() as pipe:
+        for order_id in order_ids:
+            pipe.xrevrange(trail_key(order_id) , count = 1)
+        
+        trails = pipe.execute()
+    
+    positions = {}
+    for order_id , entries in zip(order_ids , trails):
+        if entries:
+            fields = entries[0][1]
+            positions[order_id] = (float(fields['lat']) , float(fields['lng']))
+    
+    return positions
+
+
+def _as_utc(value):
+    # Order timestamps are timezone-aware columns; this module works in aware UTC throughout
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo = timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _travel_minutes(origin , lat , lng) -> float:
+    if None in (origin[0] , origin[1] , lat , lng):
+        return settings.ETA_DEFAULT_TRAVEL_MINUTES
+    
+    return calculate_distance(origin[0] , origin[1] , lat , lng) / settings.ETA_AVERAGE_SPEED_KMH * 60
+
+
+def _estimate_etas(rows , now : datetime , positions : dict) -> list:
+    '''New ETA for every row in one pass: remaining prep + pickup buffer + travel to the customer'''
+    
+    pickup = timedelta(minutes = settings.ETA_PICKUP_BUFFER_MINUTES)
+    etas = []
+    
+    for row in rows:
+        restaurant = (row.latitude , row.longitude)
+        
+        if row.status == OrderStatus.OUT_FOR_DELIVERY:
+            # Measure from the rider when we know where they are
+            origin = positions.get(row.id , restaurant)
+            eta = now + timedelta(minutes = _travel_minutes(origin , row.delivery_latitude , row.delivery_longitude))
+        
+        else:
+            travel = timedelta(minutes = _travel_minutes(restaurant , row.delivery_latitude , row.delivery_longitude))
+            
+            if row.status == OrderStatus.READY_FOR_PICKUP:
+                ready_at = now
+            else:
+                # Kitchen started at prepared_at (set on PREPARING); earlier statuses have not started yet
+                started = _as_utc(row.prepared_at) if row.status == OrderStatus.PREPARING and row.prepared_at else now
+                ready_at = max(now , started + timedelta(minutes = row.delivery_time or 30))
+            
+            eta = ready_at + pickup + travel
+        
+        etas.append(eta.replace(microsecond = 0))
+    
+    return etas
+
+
+def _apply_etas(db : Session , rows , etas : list , now : datetime) -> tuple:
+    # Write only ETAs that actually changed and notify only customers whose ETA moved noticeably
+    
+    min_change = timedelta(seconds = settings.ETA_MIN_CHANGE_SECONDS)
+    notify_after = timedelta(minutes = settings.ETA_NOTIFY_THRESHOLD_MINUTES)
+    
+    changes = []
+    notifications = []
+    
+    for row , eta in zip(rows , etas):
+        previous = _as_utc(row.estimated_delivery_time)
+        moved = abs(eta - previous) if previous else None
+        
+        if moved is not None and moved < min_change:
+            continue
+        
+        changes.append({"id": row.id , "estimated_delivery_time": eta})
+        
+        if moved is None or moved >= notify_after:
+            notifications.append((row.customer_id , {
+                "type": "delivery_time_update",
+                "order_id": row.id,
+                "estimated_delivery_time": eta.isoformat()
+            }))
+    
+    if changes:
+        db.execute(update(Order) , changes)
+        db.commit()
+    
+    if notifications:
+        publish_websocket_messages(notifications)
+    
+    return len(changes) , len(notifications)
+
+
 @celery_app.task
 def calculate_estimated_delivery_time(order_id :int):
     # Calculate and update estimate delivery time 
@@ -84,32 +221,15 @@ def calculate_estimated_delivery_time(order_id :int):
     db = SessionLocal()
     
     try:
-        order = db.query(Order).filter(Order.id == order_id).first()
+        rows = _eta_rows(db , Order.id == order_id)
         
-        if not order:
+        if not rows:
             return False
         
-        # prep time 
-        prep_time = order.restaurant.delivery_time or 30
-        
-        travel_time = 15  # Default 15 minutes
+        now = datetime.now(timezone.utc)
+        positions = _partner_positions([order_id]) if rows[0].status == OrderStatus.OUT_FOR_DELIVERY else {}
         
-        estimated_time = datetime.now() + timedelta(minutes=prep_time + travel_time)
-        
-        order.estimated_delivery_time = estimated_time
-        db.commit()
-        
-        # Notify customer about delivery time
-        notification = {
-            "type": "delivery_time_update",
-            "order_id": order.id,
-            "estimated_delivery_time": estimated_time.isoformat()
-        }
-
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_websocket_notification",
-            args=[order.customer_id, notification]
-        )
+        _apply_etas(db , rows , _estimate_etas(rows , now , positions) , now)
         
         return True
         
@@ -122,36 +242,169 @@ def calculate_estimated_delivery_time(order_id :int):
 
 
 @celery_app.task
-def auto_cancel_unpaid_order():
+def update_estimated_delivery_times():
+    # Recompute ETAs of in-flight orders only (beat, every 5 minutes)
+    
     db = SessionLocal()
     
     try:
-        cutoff_time = datetime.now() + timedelta(minutes=15)
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
         
-        unpaid_orders = db.query(Order).filter(Order.status == OrderStatus , Order.created_at < cutoff_time).all()
+        rows = _eta_rows(db , Order.status.in_(ACTIVE_ETA_STATUSES))
         
-        cancelled_count = 0
+        if not rows:
+            return 0
         
+        positions = _partner_positions([row.id for row in rows if row.status == OrderStatus.OUT_FOR_DELIVERY])
         
-        for order in unpaid_orders:
-            order.status = OrderStatus.CANCELLED
-            order.cancelled_at = datetime.now()
-            cancelled_count +=1
-            
-         # Notify customer
-            notification = {
+        updated , notified = _apply_etas(db , rows , _estimate_etas(rows , now , positions) , now)
+        
+        logger.info(
+            f"Estimated delivery times updated",
+            active_orders = len(rows),
+            updated = updated,
+            notified = notified,
+            duration_ms = round((time.monotonic() - started) * 1000 , 1)
+        )
+        return updated
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to update estimated delivery times" , error = str(e))
+        return 0
+    finally:
+        db.close()
+
+
+def _cancel_unpaid_orders(db : Session , condition) -> int:
+    # One UPDATE ... RETURNING for the whole set; orders paid in the meantime are left alone
+    
+    now = datetime.now(timezone.utc)
+    
+    cancelled = db.execute(
+        update(Order)
+        .where(
+            condition,
+            Order.status == OrderStatus.PENDING,
+            ~exists().where(Payment.order_id == Order.id , Payment.status == PaymentStatus.COMPLETED)
+        )
+        .values(status = OrderStatus.CANCELLED , cancelled_at = now)
+        .returning(Order.id , Order.customer_id)
+        .execution_options(synchronize_session = False)
+    ).all()
+    
+    db.commit()
+    
+    if cancelled:
+        publish_websocket_messages(
+            (row.customer_id , {
                 "type": "order_cancelled",
-                "order_id": order.id,
+                "order_id": row.id,
                 "reason": "Payment timeout",
-                "timestamp": datetime.utcnow().isoformat()
-            }
+                "timestamp": now.isoformat()
+            })
+            for row in cancelled
+        )
+    
+    return len(cancelled)
+
+
+def _notify_overdue_preparation(db : Session , order_ids : list) -> int:
+    overdue = db.execute(
+        select(Order.id , Order.order_number , Restaurant.owner_id)
+        .join(Restaurant , Restaurant.id == Order.restaurant_id)
+        .where(Order.id.in_(order_ids) , Order.status == OrderStatus.PREPARING)
+    ).all()
+    
+    if not overdue:
+        return 0
+    
+    now = datetime.now(timezone.utc).isoformat()
+    
+    publish_websocket_messages(
+        (row.owner_id , {
+            "type": "order_preparation_overdue",
+            "order_id": row.id,
+            "order_number": row.order_number,
+            "timestamp": now
+        })
+        for row in overdue
+    )
+    
+    broadcast_system_notification(
+        {"type": "orders_preparation_overdue", "order_ids": [row.id for row in overdue], "timestamp": now},
+        roles = ["admin"]
+    )
+    
+    return len(overdue)
+
+
+@celery_app.task
+def process_order_deadlines():
+    # Fire due order timers; only entries that are already due are touched
+    
+    db = SessionLocal()
+    batch_size = settings.ORDER_DEADLINE_BATCH_SIZE
+    
+    cancelled_count = 0
+    overdue_count = 0
+    order_ids = []
+    current = payment_deadlines
+    
+    try:
+        while True:
+            order_ids = payment_deadlines.pop_due(batch_size)
+            if not order_ids:
+                break
             
-            current_app.send_task(
-                "app.tasks.notification_tasks.send_websocket_notification",
-                args=[order.customer_id, notification]
-            )
+            cancelled_count += _cancel_unpaid_orders(db , Order.id.in_(order_ids))
+            
+            if len(order_ids) < batch_size:
+                break
+        
+        order_ids = []
+        current = preparing_deadlines
+        
+        while True:
+            order_ids = preparing_deadlines.pop_due(batch_size)
+            if not order_ids:
+                break
+            
+            overdue_count += _notify_overdue_preparation(db , order_ids)
+            
+            if len(order_ids) < batch_size:
+                break
+        
+        if cancelled_count or overdue_count:
+            logger.info(f"Order deadlines processed" , cancelled = cancelled_count , overdue = overdue_count)
+        
+        return {"cancelled": cancelled_count , "overdue": overdue_count}
+        
+    except Exception as e:
+        db.rollback()
+        
+        # Put the popped batch back so the next poll retries it
+        for order_id in order_ids:
+            current.schedule(order_id , 0)
+        
+        logger.error(f"Failed to process order deadlines" , error = str(e))
+        return None
+    finally:
+        db.close()
+
+
+@celery_app.task
+def auto_cancel_unpaid_order():
+    # Full sweep, only needed as a backstop if the deadline set was lost (e.g. Redis flushed)
+    
+    db = SessionLocal()
+    
+    try:
+        cutoff_time = datetime.now(timezone.utc) - timedelta(minutes = settings.ORDER_PAYMENT_TIMEOUT_MINUTES)
+        
+        cancelled_count = _cancel_unpaid_orders(db , Order.created_at < cutoff_time)
         
-        db.commit()
         logger.info(f"Auto-cancelled {cancelled_count} unpaid orders")
         return cancelled_count
         
@@ -161,9 +414,3 @@ def auto_cancel_unpaid_order():
         return 0
     finally:
         db.close()    
-        
-        
-
-
-    
-            
\ No newline at end of file
@@ -0,0 +1,195 @@
+'''
+Publish outbox events to Celery.
+
+    python -m app.task.outbox_relay
+
+The long-running relay drains the outbox continuously; beat also runs
+relay_outbox every few seconds so events still flow if the relay is down.
+Several relays can run at once: rows are claimed with FOR UPDATE SKIP LOCKED.
+'''
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+from app.task.celery_app import celery_app
+from app.database import SessionLocal
+from app.models.outbox import OutboxEvent
+from app.config import settings
+from app.core.logging import logger
+
+
+def _dispatchable(db: Session, events: List[OutboxEvent]) -> List[OutboxEvent]:
+    '''Events of the batch that can go out without overtaking an older event of the same aggregate.
+
+    An older pending event outside this batch (claimed by another relay, or
+    beyond the limit) holds back everything after it for that aggregate.
+    '''
+    batch_ids = {event.id for event in events}
+    aggregates = {(event.aggregate_type, event.aggregate_id) for event in events}
+
+    pending = db.execute(
+        select(OutboxEvent.id, OutboxEvent.aggregate_type, OutboxEvent.aggregate_id)
+        .where(
+            OutboxEvent.published_at.is_(None),
+            OutboxEvent.aggregate_type.in_({aggregate_type for aggregate_type, _ in aggregates}),
+            OutboxEvent.aggregate_id.in_({aggregate_id for _, aggregate_id in aggregates}),
+            OutboxEvent.id <= max(batch_ids)
+        )
+        .order_by(OutboxEvent.id)
+    ).all()
+
+    blocked = set()
+    ready = set()
+
+    for row in pending:
+        key = (row.aggregate_type, row.aggregate_id)
+        if key not in aggregates or key in blocked:
+            continue
+
+        if row.id in batch_ids:
+            ready.add(row.id)
+        else:
+            blocked.add(key)
+
+    return [event for event in events if event.id in ready]
+
+
+def drain_batch(db: Session, batch_size: int) -> Tuple[int, int]:
+    '''Claim one batch, publish it over a single broker connection; returns (claimed, published)'''
+    events = db.execute(
+        select(OutboxEvent)
+        .where(OutboxEvent.published_at.is_(None))
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    if not events:
+        db.commit()
+        return 0, 0
+
+    published = []
+    failed = set()
+
+    with celery_app.producer_or_acquire() as producer:
+        for event in _dispatchable(db, events):
+            aggregate = (event.aggregate_type, event.aggregate_id)
+            if aggregate in failed:
+                continue
+
+            try:
+                celery_app.send_task(
+                    event.task_name,
+                    args=event.payload.get("args", []),
+                    kwargs=event.payload.get("kwargs", {}),
+                    producer=producer,
+                    retry=False
+                )
+                published.append(event.id)
+
+            except Exception as e:
+                # Later events of this aggregate stay pending so none overtakes it; other aggregates go on
+                failed.add(aggregate)
+                event.attempts = (event.attempts or 0) + 1
+                event.last_error = str(e)[:500]
+
+                logger.error(f"Outbox publish failed", event_id=event.id, task=event.task_name, error=str(e))
+
+    if published:
+        db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(published))
+            .values(published_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    # Releases the row locks
+    db.commit()
+
+    return len(events), len(published)
+
+
+@celery_app.task
+def relay_outbox():
+    '''Drain the outbox from beat, bounded so a backlog never holds the worker for long'''
+    db = SessionLocal()
+    published_count = 0
+
+    try:
+        for _ in range(settings.OUTBOX_MAX_BATCHES_PER_RUN):
+            claimed, published = drain_batch(db, settings.OUTBOX_BATCH_SIZE)
+            published_count += published
+
+            if claimed < settings.OUTBOX_BATCH_SIZE or not published:
+                break
+
+        if published_count:
+            logger.info(f"Outbox events published", published=published_count)
+
+        return published_count
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to relay outbox", error=str(e))
+        return published_count
+    finally:
+        db.close()
+
+
+@celery_app.task
+def purge_outbox():
+    '''Delete events published longer ago than the retention window'''
+    db = SessionLocal()
+
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+
+        deleted = db.execute(
+            delete(OutboxEvent)
+            .where(OutboxEvent.published_at < cutoff)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+
+        logger.info(f"Purged {deleted} published outbox events")
+        return deleted
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to purge outbox", error=str(e))
+        return 0
+    finally:
+        db.close()
+
+
+def main():
+    logger.info(f"Outbox relay started", batch_size=settings.OUTBOX_BATCH_SIZE)
+
+    while True:
+        db = SessionLocal()
+
+        try:
+            claimed, published = drain_batch(db, settings.OUTBOX_BATCH_SIZE)
+
+            if published:
+                logger.info(f"Outbox events published", published=published)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Outbox relay error", error=str(e))
+            claimed = published = 0
+
+        finally:
+            db.close()
+
+        # Keep draining while there is a backlog, otherwise poll
+        if claimed < settings.OUTBOX_BATCH_SIZE or not published:
+            time.sleep(settings.OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
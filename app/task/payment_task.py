@@ -1,14 +1,30 @@
 from celery import current_app
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from sqlalchemy.orm import Session
+from sqlalchemy import select, update
 from app.task.celery_app import celery_app
 from app.database import SessionLocal
-from app.models.payment import Payment, PaymentStatus
+from app.models.payment import Payment, PaymentStatus, StripeEvent
 from app.models.order import Order, OrderStatus
-from app.service.payment_service import PaymentService
+from app.models.restaurant import Restaurant
+from app.config import settings
+from app.service.payment_service import PaymentService, intent_payment_status
+from app.service.stripe_gateway import stripe_gateway
+from app.task.notification_task import publish_websocket_messages
+from app.task.order_task import update_order_status, calculate_estimated_delivery_time
+from app.task.notification_task import send_websocket_notification
+from app.task.idempotency import idempotent
+from app.utils.rate_limiter import TokenBucket
+from app.utils.scheduler import payment_deadlines
+from app.utils.redis_client import sync_redis_client
 from app.core.logging import logger
 from datetime import datetime, timedelta
+import json
+import stripe
+import time
 
 @celery_app.task
+@idempotent("payment_id")
 def process_payment(payment_id: int):
 
     db = SessionLocal()
@@ -25,16 +41,10 @@ def process_payment(payment_id: int):
             # Update order status
             order = db.query(Order).filter(Order.id == payment.order_id).first()
             if order:
-                current_app.send_task(
-                    
-                    args=[order.id, OrderStatus.CONFIRMED.value]
-                )
+                update_order_status.delay(order.id, OrderStatus.CONFIRMED.value)
                 
                 # Calculate estimated delivery time
-                current_app.send_task(
-                    
-                    args=[order.id]
-                )
+                calculate_estimated_delivery_time.delay(order.id)
         
         return success
         
@@ -44,46 +54,156 @@ def process_payment(payment_id: int):
     finally:
         db.close()
 
+def _apply_payment_statuses(db: Session, statuses: dict, now: datetime) -> tuple:
+    '''Bulk-write new payment statuses and move their PENDING orders along; the caller commits.
+
+    statuses maps rows with .id and .order_id to the new PaymentStatus.
+    Returns the order ids whose payment settled and the order transitions made.
+    '''
+    db.execute(
+        update(Payment),
+        [{"id": payment.id, "status": status} for payment, status in statuses.items()]
+    )
+    
+    completed = [payment.order_id for payment, status in statuses.items() if status == PaymentStatus.COMPLETED]
+    failed = [payment.order_id for payment, status in statuses.items() if status == PaymentStatus.FAILED]
+    
+    transitions = []
+    if completed:
+        transitions += [
+            (row, OrderStatus.CONFIRMED) for row in db.execute(
+                update(Order)
+                .where(Order.id.in_(completed), Order.status == OrderStatus.PENDING)
+                .values(status=OrderStatus.CONFIRMED)
+                .returning(Order.id, Order.order_number, Order.customer_id, Order.restaurant_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+        ]
+    if failed:
+        transitions += [
+            (row, OrderStatus.CANCELLED) for row in db.execute(
+                update(Order)
+                .where(Order.id.in_(failed), Order.status == OrderStatus.PENDING)
+                .values(status=OrderStatus.CANCELLED, cancelled_at=now)
+                .returning(Order.id, Order.order_number, Order.customer_id, Order.restaurant_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+        ]
+    
+    return completed + failed, transitions
+
+
+def _announce_order_transitions(db: Session, order_ids: list, transitions: list, now: datetime):
+    # After commit: clear payment deadlines, one pipelined publish, ETAs for confirmed orders
+    
+    # Paid or failed, the payment deadline no longer applies
+    payment_deadlines.cancel_many(order_ids)
+    
+    if not transitions:
+        return
+    
+    owners = dict(db.execute(
+        select(Restaurant.id, Restaurant.owner_id)
+        .where(Restaurant.id.in_({row.restaurant_id for row, _ in transitions}))
+    ).all())
+    
+    messages = []
+    for row, new_status in transitions:
+        message = {
+            "type": "order_status_update",
+            "order_id": row.id,
+            "order_number": row.order_number,
+            "old_status": OrderStatus.PENDING.value,
+            "new_status": new_status.value,
+            "timestamp": now.isoformat()
+        }
+        messages.append((row.customer_id, message))
+        if owners.get(row.restaurant_id):
+            messages.append((owners[row.restaurant_id], message))
+    
+    publish_websocket_messages(messages)
+    
+    for row, new_status in transitions:
+        if new_status == OrderStatus.CONFIRMED:
+            calculate_estimated_delivery_time.delay(row.id)
+
+
 @celery_app.task
 def check_pending_payments():
     
     db = SessionLocal()
     try:
-        # Check payments that are older than 5 minutes
+        started = time.monotonic()
+        deadline = started + settings.PAYMENT_POLL_BUDGET_SECONDS
+        
+        # Check payments that are older than 5 minutes, oldest first
         cutoff_time = datetime.utcnow() - timedelta(minutes=5)
         
-        pending_payments = db.query(Payment).filter(
-            Payment.status == PaymentStatus.PENDING,
-            Payment.created_at < cutoff_time
+        pending_payments = db.execute(
+            select(Payment.id, Payment.order_id, Payment.stripe_payment_intent_id)
+            .where(
+                Payment.status == PaymentStatus.PENDING,
+                Payment.created_at < cutoff_time,
+                Payment.stripe_payment_intent_id.isnot(None)
+            )
+            .order_by(Payment.created_at)
+            .limit(settings.PAYMENT_POLL_MAX_BATCH)
         ).all()
         
-        payment_service = PaymentService(db)
-        updated_count = 0
-        
-        for payment in pending_payments:
-            if payment.stripe_payment_intent_id:
-                status = payment_service.check_stripe_payment_status(
-                    payment.stripe_payment_intent_id
-                )
-                if status != payment.status:
-                    payment.status = status
-                    updated_count += 1
-                    
-                    
-                    if status == PaymentStatus.COMPLETED:
-                        current_app.send_task(
-                            "app.tasks.order_tasks.update_order_status",
-                            args=[payment.order_id, OrderStatus.CONFIRMED.value]
-                        )
-                    elif status == PaymentStatus.FAILED:
-                        current_app.send_task(
-                            "app.tasks.order_tasks.update_order_status",
-                            args=[payment.order_id, OrderStatus.CANCELLED.value]
-                        )
+        if not pending_payments:
+            return 0
+        
+        bucket = TokenBucket(settings.PAYMENT_POLL_RATE_PER_SECOND)
+        
+        def fetch_status(payment_intent_id):
+            # Whatever is not fetched before the deadline waits for the next run
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not bucket.acquire(timeout=remaining):
+                return None
+            
+            try:
+                return PaymentService.fetch_stripe_payment_status(payment_intent_id)
+            except stripe.error.StripeError as e:
+                logger.error(f"Error checking payment status", payment_intent_id=payment_intent_id, error=str(e))
+                return None
+        
+        statuses = {}
+        pool = ThreadPoolExecutor(max_workers=settings.PAYMENT_POLL_CONCURRENCY)
+        try:
+            futures = {
+                pool.submit(fetch_status, payment.stripe_payment_intent_id): payment
+                for payment in pending_payments
+            }
+            
+            for future in as_completed(futures, timeout=max(deadline - time.monotonic(), 0) + 5):
+                status = future.result()
+                if status is not None and status != PaymentStatus.PENDING:
+                    statuses[futures[future]] = status
+        
+        except FuturesTimeout:
+            logger.warning(f"Payment status polling ran out of time", checked=len(statuses))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        if not statuses:
+            logger.info(f"Updated 0 payment statuses", polled=len(pending_payments))
+            return 0
+        
+        # Every change below goes out in one transaction
+        now = datetime.utcnow()
+        order_ids, transitions = _apply_payment_statuses(db, statuses, now)
         
         db.commit()
-        logger.info(f"Updated {updated_count} payment statuses")
-        return updated_count
+        
+        _announce_order_transitions(db, order_ids, transitions, now)
+        
+        logger.info(
+            f"Updated {len(statuses)} payment statuses",
+            polled=len(pending_payments),
+            orders_transitioned=len(transitions),
+            duration_ms=round((time.monotonic() - started) * 1000, 1)
+        )
+        return len(statuses)
         
     except Exception as e:
         db.rollback()
@@ -92,6 +212,207 @@ def check_pending_payments():
     finally:
         db.close()
 
+# Webhook event type -> payment status it settles the intent in
+STRIPE_INTENT_STATUSES = {
+    'payment_intent.processing': PaymentStatus.PROCESSING,
+    'payment_intent.succeeded': PaymentStatus.COMPLETED,
+    'payment_intent.payment_failed': PaymentStatus.FAILED,
+    'payment_intent.canceled': PaymentStatus.CANCELLED,
+}
+
+# A late or replayed event must not move a payment out of these
+FINAL_PAYMENT_STATUSES = {PaymentStatus.COMPLETED, PaymentStatus.REFUNDED, PaymentStatus.CANCELLED}
+
+STRIPE_EVENTS_LOCK = "stripe_events:processing"
+
+
+def _apply_stripe_events(db: Session, events: list, now: datetime) -> tuple:
+    '''Fold one ordered batch into payment updates and mark it processed; the caller commits'''
+    intent_statuses = {}
+    refunds = {}
+    
+    # Events are ordered, so the last one per intent wins
+    for event in events:
+        obj = event.payload['data']['object']
+        
+        if event.type in STRIPE_INTENT_STATUSES:
+            intent_statuses[obj['id']] = STRIPE_INTENT_STATUSES[event.type]
+        elif event.type == 'charge.refunded' and obj.get('payment_intent'):
+            refunds[obj['payment_intent']] = obj['amount_refunded'] / 100
+    
+    order_ids, transitions = [], []
+    intent_ids = set(intent_statuses) | set(refunds)
+    
+    if intent_ids:
+        payments = db.execute(
+            select(Payment.id, Payment.order_id, Payment.status, Payment.stripe_payment_intent_id)
+            .where(Payment.stripe_payment_intent_id.in_(intent_ids))
+        ).all()
+        
+        statuses = {
+            payment: intent_statuses[payment.stripe_payment_intent_id]
+            for payment in payments
+            if payment.stripe_payment_intent_id in intent_statuses
+            and payment.status not in FINAL_PAYMENT_STATUSES
+            and payment.status != intent_statuses[payment.stripe_payment_intent_id]
+        }
+        if statuses:
+            order_ids, transitions = _apply_payment_statuses(db, statuses, now)
+        
+        refunded = [
+            {
+                "id": payment.id,
+                "status": PaymentStatus.REFUNDED,
+                "refund_amount": refunds[payment.stripe_payment_intent_id],
+                "refunded_at": now
+            }
+            for payment in payments
+            if payment.stripe_payment_intent_id in refunds and payment.status != PaymentStatus.REFUNDED
+        ]
+        if refunded:
+            db.execute(update(Payment), refunded)
+    
+    # Unknown and unmatched events are marked too, so they are never re-read
+    db.execute(
+        update(StripeEvent)
+        .where(StripeEvent.id.in_([event.id for event in events]))
+        .values(processed_at=now, attempts=StripeEvent.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    
+    return order_ids, transitions
+
+
+def _apply_stripe_batch(db: Session, events: list):
+    now = datetime.utcnow()
+    order_ids, transitions = _apply_stripe_events(db, events, now)
+    db.commit()
+    
+    # The events are applied; a failed announcement must not send them back through the one-by-one path
+    try:
+        _announce_order_transitions(db, order_ids, transitions, now)
+    
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to announce Stripe event transitions", orders=len(order_ids), error=str(e))
+
+
+def _apply_stripe_events_singly(db: Session, events: list) -> tuple:
+    '''Fallback after a batch failed: one transaction per event, stopping at the first that fails.
+    
+    The failing event keeps its place in the queue so later events are not
+    applied ahead of it, until it has failed STRIPE_EVENT_MAX_ATTEMPTS times and
+    is dead-lettered. Returns (events settled, whether processing is blocked).
+    '''
+    settled = 0
+    
+    for event in events:
+        event_id = event.id
+        
+        try:
+            _apply_stripe_batch(db, [event])
+            settled += 1
+            continue
+        
+        except Exception as e:
+            db.rollback()
+            error = str(e)[:500]
+        
+        attempts = db.execute(select(StripeEvent.attempts).where(StripeEvent.id == event_id)).scalar() or 0
+        values = {"attempts": attempts + 1, "last_error": error}
+        dead = attempts + 1 >= settings.STRIPE_EVENT_MAX_ATTEMPTS
+        
+        if dead:
+            now = datetime.utcnow()
+            values.update(processed_at=now, failed_at=now)
+        
+        db.execute(update(StripeEvent).where(StripeEvent.id == event_id).values(**values))
+        db.commit()
+        
+        if not dead:
+            logger.error(f"Stripe event failed", event_id=event_id, attempts=attempts + 1, error=error)
+            return settled, True
+        
+        logger.error(f"Stripe event dead-lettered", event_id=event_id, attempts=attempts + 1, error=error)
+        settled += 1
+    
+    return settled, False
+
+
+@celery_app.task
+def process_stripe_events():
+    '''Apply stored webhook events in Stripe order, one batch per transaction.
+    
+    Kicked through the outbox for every new event and by beat as a fallback.
+    A Redis lock keeps a single processor running so batches never interleave;
+    kicks that find it held return straight away, the running one picks their
+    events up on its next batch. The lock is renewed after every batch and a run
+    stops after STRIPE_EVENT_RUN_SECONDS, queueing a successor if events remain.
+    '''
+    token = sync_redis_client.acquire_lock(STRIPE_EVENTS_LOCK, settings.STRIPE_EVENT_LOCK_TTL)
+    if token is None:
+        return 0
+    
+    db = SessionLocal()
+    processed = 0
+    handover = False
+    deadline = time.monotonic() + settings.STRIPE_EVENT_RUN_SECONDS
+    
+    try:
+        while True:
+            events = db.execute(
+                select(StripeEvent)
+                .where(StripeEvent.processed_at.is_(None))
+                .order_by(StripeEvent.stripe_created, StripeEvent.id)
+                .limit(settings.STRIPE_EVENT_BATCH_SIZE)
+            ).scalars().all()
+            
+            if not events:
+                break
+            
+            try:
+                _apply_stripe_batch(db, events)
+                processed += len(events)
+            
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Stripe event batch failed, applying events one by one", size=len(events), error=str(e))
+                
+                settled, blocked = _apply_stripe_events_singly(db, events)
+                processed += settled
+                
+                if blocked:
+                    break
+            
+            if len(events) < settings.STRIPE_EVENT_BATCH_SIZE:
+                break
+            
+            # Past the run budget, or the lock is gone: another processor may start, stop here
+            if time.monotonic() >= deadline:
+                handover = True
+                break
+            if not sync_redis_client.extend_lock(STRIPE_EVENTS_LOCK, token, settings.STRIPE_EVENT_LOCK_TTL):
+                logger.warning(f"Stripe events lock lost, stopping", processed=processed)
+                break
+        
+        if processed:
+            logger.info(f"Stripe events processed", processed=processed)
+        
+        return processed
+    
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to process Stripe events", error=str(e))
+        
+        return processed
+    finally:
+        db.close()
+        sync_redis_client.release_lock(STRIPE_EVENTS_LOCK, token)
+        
+        if handover:
+            process_stripe_events.delay()
+
+
 @celery_app.task
 def process_refund(payment_id: int, refund_amount: float = None):
     
@@ -107,10 +428,7 @@ def process_refund(payment_id: int, refund_amount: float = None):
         
         if success:
             # Update order status
-            current_app.send_task(
-                "app.tasks.order_tasks.update_order_status",
-                args=[payment.order_id, OrderStatus.REFUNDED.value]
-            )
+            update_order_status.delay(payment.order_id, OrderStatus.REFUNDED.value)
             
             # Notify customer
             notification = {
@@ -120,10 +438,7 @@ def process_refund(payment_id: int, refund_amount: float = None):
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            current_app.send_task(
-                "app.tasks.notification_tasks.send_websocket_notification",
-                args=[payment.user_id, notification]
-            )
+            send_websocket_notification.delay(payment.user_id, notification)
         
         return success
         
@@ -131,4 +446,181 @@ def process_refund(payment_id: int, refund_amount: float = None):
         logger.error(f"Failed to process refund", payment_id=payment_id, error=str(e))
         return False
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+RECONCILE_CHECKPOINT_KEY = "payments:reconcile:checkpoint"
+RECONCILE_REPORT_KEY = "payments:reconcile:report"
+
+
+def _new_report(since: int) -> dict:
+    return {
+        "since": datetime.utcfromtimestamp(since).isoformat(),
+        "api_calls": 0,
+        "intents_checked": 0,
+        "refunds_checked": 0,
+        "statuses_updated": 0,
+        "refunds_updated": 0,
+        # Reported, not applied
+        "unknown_intents_count": 0,
+        "amount_mismatches_count": 0,
+        "final_status_conflicts_count": 0,
+        "unknown_intents": [],
+        "amount_mismatches": [],
+        "final_status_conflicts": [],
+    }
+
+
+def _note(report: dict, field: str, entry):
+    # Keep the stored report small; the count is what matters on a bad night
+    report[f"{field}_count"] += 1
+    if len(report[field]) < settings.RECONCILE_REPORT_MAX_ITEMS:
+        report[field].append(entry)
+
+
+def _diff_intents(db: Session, intents: list, report: dict) -> dict:
+    '''Compare one page of intents with our rows in a single query; returns the status changes to apply'''
+    payments = {
+        payment.stripe_payment_intent_id: payment
+        for payment in db.execute(
+            select(Payment.id, Payment.order_id, Payment.status, Payment.amount, Payment.stripe_payment_intent_id)
+            .where(Payment.stripe_payment_intent_id.in_([intent.id for intent in intents]))
+        ).all()
+    }
+    
+    statuses = {}
+    for intent in intents:
+        payment = payments.get(intent.id)
+        if payment is None:
+            _note(report, "unknown_intents", intent.id)
+            continue
+        
+        if intent.amount != round(payment.amount * 100):
+            _note(report, "amount_mismatches", {"payment_id": payment.id, "ours": round(payment.amount * 100), "stripe": intent.amount})
+        
+        remote = intent_payment_status(intent.status)
+        if remote == payment.status or (payment.status == PaymentStatus.REFUNDED and remote == PaymentStatus.COMPLETED):
+            continue
+        
+        if payment.status in FINAL_PAYMENT_STATUSES:
+            _note(report, "final_status_conflicts", {"payment_id": payment.id, "ours": payment.status.value, "stripe": intent.status})
+            continue
+        
+        statuses[payment] = remote
+    
+    return statuses
+
+
+def _apply_refunds(db: Session, refunds: dict, report: dict):
+    '''refunds maps intent id -> (refunded cents in the window, latest refund time)'''
+    intent_ids = list(refunds)
+    
+    for start in range(0, len(intent_ids), settings.RECONCILE_PAGE_SIZE):
+        chunk = intent_ids[start:start + settings.RECONCILE_PAGE_SIZE]
+        
+        rows = db.execute(
+            select(Payment.id, Payment.status, Payment.refund_amount, Payment.stripe_payment_intent_id)
+            .where(Payment.stripe_payment_intent_id.in_(chunk))
+        ).all()
+        
+        updates = []
+        for payment in rows:
+            cents, refunded_at = refunds[payment.stripe_payment_intent_id]
+            amount = max(payment.refund_amount or 0.0, cents / 100)
+            
+            if payment.status != PaymentStatus.REFUNDED or amount != (payment.refund_amount or 0.0):
+                updates.append({
+                    "id": payment.id,
+                    "status": PaymentStatus.REFUNDED,
+                    "refund_amount": amount,
+                    "refunded_at": refunded_at
+                })
+        
+        if updates:
+            db.execute(update(Payment), updates)
+            db.commit()
+            report["refunds_updated"] += len(updates)
+
+
+@celery_app.task
+def reconcile_payments():
+    '''Nightly consistency pass against Stripe using list endpoints.
+    
+    Pages through the intents and refunds created since the last checkpoint
+    (less a lookback, as Stripe lists filter on creation, not update time).
+    Each page of 100 is diffed against payments in one indexed query. Safe
+    corrections go out as bulk updates; anything else goes into the report.
+    Intents younger than the payment timeout are left to the live paths.
+    '''
+    db = SessionLocal()
+    started = time.time()
+    
+    checkpoint = sync_redis_client.get_key(RECONCILE_CHECKPOINT_KEY)
+    if checkpoint:
+        since = int(float(checkpoint)) - settings.RECONCILE_LOOKBACK_HOURS * 3600
+    else:
+        since = int(started) - settings.RECONCILE_INITIAL_DAYS * 86400
+    
+    settled_before = started - settings.ORDER_PAYMENT_TIMEOUT_MINUTES * 60
+    report = _new_report(since)
+    
+    try:
+        for page in stripe_gateway.list_payment_intents(page_size=settings.RECONCILE_PAGE_SIZE, created={"gte": since}):
+            report["api_calls"] += 1
+            
+            intents = [intent for intent in page if intent.created <= settled_before]
+            report["intents_checked"] += len(intents)
+            if not intents:
+                continue
+            
+            statuses = _diff_intents(db, intents, report)
+            if statuses:
+                now = datetime.utcnow()
+                order_ids, transitions = _apply_payment_statuses(db, statuses, now)
+                db.commit()
+                
+                _announce_order_transitions(db, order_ids, transitions, now)
+                report["statuses_updated"] += len(statuses)
+        
+        refunds = {}
+        for page in stripe_gateway.list_refunds(page_size=settings.RECONCILE_PAGE_SIZE, created={"gte": since}):
+            report["api_calls"] += 1
+            
+            for refund in page:
+                if refund.status != 'succeeded' or not refund.get('payment_intent'):
+                    continue
+                
+                report["refunds_checked"] += 1
+                cents, latest = refunds.get(refund.payment_intent, (0, None))
+                created = datetime.utcfromtimestamp(refund.created)
+                refunds[refund.payment_intent] = (cents + refund.amount, max(latest or created, created))
+        
+        _apply_refunds(db, refunds, report)
+        
+        report["duration_seconds"] = round(time.time() - started, 2)
+        report["finished_at"] = datetime.utcnow().isoformat()
+        
+        # Only a complete pass moves the checkpoint
+        sync_redis_client.set_many(
+            {RECONCILE_CHECKPOINT_KEY: int(started), RECONCILE_REPORT_KEY: report},
+            expires={RECONCILE_REPORT_KEY: settings.RECONCILE_REPORT_TTL_DAYS * 86400}
+        )
+        
+        logger.info(
+            f"Payment reconciliation finished",
+            **{key: value for key, value in report.items() if not isinstance(value, list)}
+        )
+        return report
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Payment reconciliation failed", error=str(e), api_calls=report["api_calls"])
+        return None
+    finally:
+        db.close()
+
+
+def get_reconciliation_report() -> dict:
+    '''Last completed reconciliation run'''
+    report = sync_redis_client.get_key(RECONCILE_REPORT_KEY)
+    return json.loads(report) if report else {}
@@ -6,17 +6,21 @@
 # Handles email verification, password reset, activity tracking, etc.
 # ================================================================
 
-from celery import current_app
+from celery import group
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, update, delete, exists, and_
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from app.task.celery_app import celery_app
+from app.task.notification_task import send_email_notification, send_bulk_email_notification, send_sms_notification
 from app.database import SessionLocal
+from app.config import settings
 from app.models.user import User, UserAddress
-from app.utils.redis_client import redis_client
+from app.service.user_service import invalidate_user_cache
+from app.utils.redis_client import sync_redis_client
 from app.core.logging import logger
-from app.utils.helpers import generate_otp, generate_verification_token
-import asyncio
+from app.utils import generate_otp, generate_verification_token
+import time
 
 
 @celery_app.task
@@ -31,26 +35,13 @@ def send_welcome_email(user_id: int):
         
         # Send welcome email
         email_subject = "Welcome to Food Delivery!"
-        email_body = f"""
-        Hi {user.full_name},
-        
-        Welcome to our food delivery platform!
-        
-        Your account has been successfully created.
-        Username: {user.username}
-        Email: {user.email}
-        
-        Start ordering from your favorite restaurants now!
-        
-        Best regards,
-        Food Delivery Team
-        """
         
         # Trigger email notification task
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_email_notification",
-            args=[user.email, email_subject, "welcome_email", {"user": user.full_name}]
-        )
+        send_email_notification.delay(user.email, email_subject, "welcome_email", {
+            "user": user.full_name,
+            "username": user.usename,
+            "email": user.email
+        })
         
         logger.info(f"Welcome email sent", user_id=user_id)
         return True
@@ -76,40 +67,17 @@ def send_verification_email(user_id: int):
         token = generate_verification_token()
         
         # Store token in Redis with 24 hour expiration
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(f"verify_email:{token}", user_id, expire=86400)
-        )
-        loop.close()
+        sync_redis_client.set(f"verify_email:{token}", user_id, expire=86400)
         
         # Generate verification URL
         verification_url = f"https://yourapp.com/verify-email?token={token}"
         
         # Send verification email
         email_subject = "Verify Your Email Address"
-        email_body = f"""
-        Hi {user.full_name},
-        
-        Please verify your email address by clicking the link below:
-        
-        {verification_url}
-        
-        This link will expire in 24 hours.
-        
-        If you didn't create this account, please ignore this email.
-        
-        Best regards,
-        Food Delivery Team
-        """
-        
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_email_notification",
-            args=[user.email, email_subject, "verify_email", {
-                "user": user.full_name,
-                "verification_url": verification_url
-            }]
-        )
+        send_email_notification.delay(user.email, email_subject, "verify_email", {
+            "user": user.full_name,
+            "verification_url": verification_url
+        })
         
         logger.info(f"Verification email sent", user_id=user_id)
         return True
@@ -135,40 +103,17 @@ def send_password_reset_email(user_id: int):
         token = generate_verification_token()
         
         # Store token in Redis with 1 hour expiration
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(f"reset_password:{token}", user_id, expire=3600)
-        )
-        loop.close()
+        sync_redis_client.set(f"reset_password:{token}", user_id, expire=3600)
         
         # Generate reset URL
         reset_url = f"https://yourapp.com/reset-password?token={token}"
         
         # Send reset email
         email_subject = "Reset Your Password"
-        email_body = f"""
-        Hi {user.full_name},
-        
-        You requested to reset your password. Click the link below to create a new password:
-        
-        {reset_url}
-        
-        This link will expire in 1 hour.
-        
-        If you didn't request this, please ignore this email and your password will remain unchanged.
-        
-        Best regards,
-        Food Delivery Team
-        """
-        
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_email_notification",
-            args=[user.email, email_subject, "reset_password", {
-                "user": user.full_name,
-                "reset_url": reset_url
-            }]
-        )
+        send_email_notification.delay(user.email, email_subject, "reset_password", {
+            "user": user.full_name,
+            "reset_url": reset_url
+        })
         
         logger.info(f"Password reset email sent", user_id=user_id)
         return True
@@ -194,30 +139,19 @@ def send_2fa_code(user_id: int):
         otp = generate_otp(length=6)
         
         # Store OTP in Redis with 5 minute expiration
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(f"2fa_otp:{user_id}", otp, expire=300)
-        )
-        loop.close()
+        sync_redis_client.set(f"2fa_otp:{user_id}", otp, expire=300)
         
         # Send OTP via SMS
         if user.phone:
             message = f"Your verification code is: {otp}. Valid for 5 minutes."
-            current_app.send_task(
-                "app.tasks.notification_tasks.send_sms_notification",
-                args=[user.phone, message]
-            )
+            send_sms_notification.delay(user.phone, message)
         
         # Also send via email as backup
         email_subject = "Your Verification Code"
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_email_notification",
-            args=[user.email, email_subject, "2fa_code", {
-                "user": user.full_name,
-                "otp": otp
-            }]
-        )
+        send_email_notification.delay(user.email, email_subject, "2fa_code", {
+            "user": user.full_name,
+            "otp": otp
+        })
         
         logger.info(f"2FA code sent", user_id=user_id)
         return True
@@ -241,16 +175,11 @@ def update_user_activity(user_id: int, activity_type: str, metadata: dict = None
         }
         
         # Store in Redis for real-time tracking
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(
-                f"user_activity:{user_id}:latest",
-                activity_data,
-                expire=3600
-            )
+        sync_redis_client.set(
+            f"user_activity:{user_id}:latest",
+            activity_data,
+            expire=3600
         )
-        loop.close()
         
         logger.info(f"User activity tracked", user_id=user_id, activity=activity_type)
         return True
@@ -265,36 +194,52 @@ def deactivate_inactive_users():
     '''Deactivate users who haven't logged in for 1 year'''
     db = SessionLocal()
     try:
+        from app.models.order import Order
+        
         cutoff_date = datetime.utcnow() - timedelta(days=365)
+        chunk_size = settings.USER_DEACTIVATION_CHUNK_SIZE
+        
+        # Old active accounts with no order in the last year (would need last_login field in production)
+        has_recent_order = exists().where(
+            Order.customer_id == User.id,
+            Order.created_at > cutoff_date
+        )
         
-        # Find inactive users (would need last_login field in production)
-        inactive_users = db.query(User).filter(
+        chunk_ids = select(User.id).where(
             User.is_active == True,
-            User.created_at < cutoff_date
-        ).all()
+            User.created_at < cutoff_date,
+            ~has_recent_order
+        ).order_by(User.id).limit(chunk_size).correlate(None).scalar_subquery()
+        
+        deactivate_chunk = update(User).where(
+            User.id.in_(chunk_ids)
+        ).values(
+            is_active=False
+        ).returning(
+            User.id, User.email, User.full_name
+        ).execution_options(synchronize_session=False)
         
         deactivated_count = 0
-        for user in inactive_users:
-            # Check if user has any orders in last year
-            from app.models.order import Order
-            recent_orders = db.query(Order).filter(
-                Order.customer_id == user.id,
-                Order.created_at > cutoff_date
-            ).count()
+        while True:
+            # Short transaction per chunk so the users table is never locked for long
+            deactivated = db.execute(deactivate_chunk).all()
+            db.commit()
             
-            if recent_orders == 0:
-                user.is_active = False
-                deactivated_count += 1
+            if deactivated:
+                invalidate_user_cache(*[user_id for user_id, _, _ in deactivated])
                 
-                # Send notification
-                current_app.send_task(
-                    "app.tasks.notification_tasks.send_email_notification",
-                    args=[user.email, "Account Deactivated", "account_deactivated", {
-                        "user": user.full_name
-                    }]
-                )
+                group(
+                    send_email_notification.s(email, "Account Deactivated", "account_deactivated", {
+                        "user": full_name
+                    })
+                    for _, email, full_name in deactivated
+                ).apply_async()
+            
+            deactivated_count += len(deactivated)
+            
+            if len(deactivated) < chunk_size:
+                break
         
-        db.commit()
         logger.info(f"Deactivated {deactivated_count} inactive users")
         return deactivated_count
         
@@ -337,16 +282,11 @@ def sync_user_preferences(user_id: int):
         }
         
         # Store in Redis
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(
-                f"user_preferences:{user_id}",
-                preferences,
-                expire=3600
-            )
+        sync_redis_client.set(
+            f"user_preferences:{user_id}",
+            preferences,
+            expire=3600
         )
-        loop.close()
         
         logger.info(f"User preferences synced", user_id=user_id)
         return True
@@ -368,28 +308,9 @@ def send_account_deletion_confirmation(user_id: int):
             return False
         
         email_subject = "Account Deletion Confirmation"
-        email_body = f"""
-        Hi {user.full_name},
-        
-        Your account has been successfully deleted.
-        
-        All your personal information has been removed from our system.
-        
-        If you didn't request this deletion or want to restore your account,
-        please contact our support team within 30 days.
-        
-        We're sorry to see you go!
-        
-        Best regards,
-        Food Delivery Team
-        """
-        
-        current_app.send_task(
-            "app.tasks.notification_tasks.send_email_notification",
-            args=[user.email, email_subject, "account_deleted", {
-                "user": user.full_name
-            }]
-        )
+        send_email_notification.delay(user.email, email_subject, "account_deleted", {
+            "user": user.full_name
+        })
         
         logger.info(f"Account deletion confirmation sent", user_id=user_id)
         return True
@@ -406,19 +327,84 @@ def cleanup_unverified_users():
     '''Delete unverified users after 7 days'''
     db = SessionLocal()
     try:
+        from app.models.order import Order
+        from app.models.payment import Payment
+        from app.models.restaurant import Restaurant
+        
         cutoff_date = datetime.utcnow() - timedelta(days=7)
+        chunk_size = settings.USER_CLEANUP_CHUNK_SIZE
+        cursor_key = "cleanup_unverified_users:cursor"
+        
+        # Resume after the last committed chunk if a previous run died midway
+        last_id = int(sync_redis_client.get_key(cursor_key) or 0)
         
-        unverified_users = db.query(User).filter(
+        # Accounts referenced by orders (as customer or delivery partner), payments or restaurants are kept
+        unverified = and_(
             User.is_verified == False,
-            User.created_at < cutoff_date
-        ).all()
+            User.created_at < cutoff_date,
+            ~exists().where(Order.customer_id == User.id),
+            ~exists().where(Order.delivery_partner_id == User.id),
+            ~exists().where(Payment.user_id == User.id),
+            ~exists().where(Restaurant.owner_id == User.id)
+        )
         
         deleted_count = 0
-        for user in unverified_users:
-            db.delete(user)
-            deleted_count += 1
+        while True:
+            started = time.monotonic()
+            
+            user_ids = db.execute(
+                select(User.id).where(unverified, User.id > last_id).order_by(User.id).limit(chunk_size)
+            ).scalars().all()
+            
+            if not user_ids:
+                break
+            
+            # Set-based deletes, no ORM cascade; re-check the predicate in case a user verified meanwhile
+            still_unverified = select(User.id).where(User.id.in_(user_ids), unverified)
+            
+            try:
+                db.execute(
+                    delete(UserAddress).where(UserAddress.user_id.in_(still_unverified)),
+                    execution_options={"synchronize_session": False}
+                )
+                deleted_ids = db.execute(
+                    delete(User).where(User.id.in_(still_unverified)).returning(User.id),
+                    execution_options={"synchronize_session": False}
+                ).scalars().all()
+                db.commit()
+                
+                # A deleted user's token must stop authenticating through the cache
+                if deleted_ids:
+                    invalidate_user_cache(*deleted_ids)
+                deleted = len(deleted_ids)
+            
+            except IntegrityError as e:
+                # A reference the predicate does not know about; skip the chunk rather than fail on it every run
+                db.rollback()
+                deleted = 0
+                logger.error(
+                    f"Unverified users chunk skipped",
+                    first_id=user_ids[0],
+                    last_id=user_ids[-1],
+                    error=str(e)
+                )
+            
+            last_id = user_ids[-1]
+            sync_redis_client.set(cursor_key, last_id, expire=86400)
+            deleted_count += deleted
+            
+            logger.info(
+                f"Unverified users chunk deleted",
+                deleted=deleted,
+                last_id=last_id,
+                duration_ms=round((time.monotonic() - started) * 1000, 1)
+            )
+            
+            if len(user_ids) < chunk_size:
+                break
+        
+        sync_redis_client.delete(cursor_key)
         
-        db.commit()
         logger.info(f"Cleaned up {deleted_count} unverified users")
         return deleted_count
         
@@ -473,16 +459,11 @@ def generate_user_report(user_id: int):
         }
         
         # Store report in Redis
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(
-            redis_client.set(
-                f"user_report:{user_id}",
-                report,
-                expire=86400  # 24 hours
-            )
+        sync_redis_client.set(
+            f"user_report:{user_id}",
+            report,
+            expire=86400  # 24 hours
         )
-        loop.close()
         
         logger.info(f"User report generated", user_id=user_id)
         return report
@@ -494,91 +475,142 @@ def generate_user_report(user_id: int):
         db.close()
 
 
-@celery_app.task
-def send_promotional_email_to_inactive_users():
-    '''Send promotional emails to users who haven't ordered in 30 days'''
+@celery_app.task(bind=True)
+def send_promotional_email_to_inactive_users(self, campaign_id: str = None, cutoff: str = None, enqueued: int = 0):
+    '''Send promotional emails to users who haven't ordered in 30 days.
+    
+    Walks every eligible user in id order, enqueues one batch-email task per chunk
+    spaced to CAMPAIGN_EMAILS_PER_SECOND, and re-schedules itself every
+    CAMPAIGN_BATCHES_PER_RUN chunks. The id cursor is checkpointed in Redis so a
+    crashed run resumes instead of starting over.
+    '''
     db = SessionLocal()
     try:
-        cutoff_date = datetime.utcnow() - timedelta(days=30)
-        
         from app.models.order import Order
         
-        # Find users with no recent orders
-        recent_order_user_ids = db.query(Order.customer_id).filter(
-            Order.created_at > cutoff_date
-        ).distinct().subquery()
+        campaign_id = campaign_id or f"comeback-{datetime.utcnow().date().isoformat()}"
+        cursor_key = f"campaign:{campaign_id}:cursor"
+        done_key = f"campaign:{campaign_id}:done"
+        
+        progress = sync_redis_client.get_many([done_key, cursor_key])
+        if progress[done_key] is not None:
+            logger.info(f"Promotional campaign already sent", campaign_id=campaign_id)
+            return enqueued
+        
+        # Fixed for the whole campaign so continuations see the same population
+        cutoff_date = datetime.fromisoformat(cutoff) if cutoff else datetime.utcnow() - timedelta(days=30)
+        last_id = int(progress[cursor_key] or 0)
         
-        inactive_users = db.query(User).filter(
+        eligible = and_(
             User.is_active == True,
-            ~User.id.in_(recent_order_user_ids)
-        ).limit(100).all()  # Process in batches
-        
-        sent_count = 0
-        for user in inactive_users:
-            email_subject = "We Miss You! Special Offer Inside"
-            current_app.send_task(
-                "app.tasks.notification_tasks.send_email_notification",
-                args=[user.email, email_subject, "promotional_comeback", {
-                    "user": user.full_name,
-                    "discount_code": "COMEBACK20"
-                }]
+            ~exists().where(Order.customer_id == User.id, Order.created_at > cutoff_date)
+        )
+        
+        batch_size = settings.CAMPAIGN_BATCH_SIZE
+        rate = max(settings.CAMPAIGN_EMAILS_PER_SECOND, 1)
+        countdown = 0.0
+        
+        for _ in range(settings.CAMPAIGN_BATCHES_PER_RUN):
+            rows = db.execute(
+                select(User.id, User.email, User.full_name)
+                .where(eligible, User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            ).all()
+            
+            if not rows:
+                break
+            
+            send_bulk_email_notification.apply_async(
+                args=[
+                    [{'email': row.email, 'context': {'user': row.full_name}} for row in rows],
+                    "We Miss You! Special Offer Inside",
+                    "promotional_comeback",
+                    {'discount_code': "COMEBACK20"}
+                ],
+                countdown=countdown
             )
-            sent_count += 1
+            
+            # Next batch goes out once the provider has had time for this one
+            countdown += len(rows) / rate
+            enqueued += len(rows)
+            last_id = rows[-1].id
+            sync_redis_client.set(cursor_key, last_id, expire=7 * 86400)
+            
+            if len(rows) < batch_size:
+                break
+        else:
+            self.apply_async(
+                kwargs={'campaign_id': campaign_id, 'cutoff': cutoff_date.isoformat(), 'enqueued': enqueued},
+                countdown=countdown
+            )
+            logger.info(f"Promotional campaign checkpoint", campaign_id=campaign_id, last_id=last_id, enqueued=enqueued)
+            return enqueued
+        
+        # Marking done and dropping the cursor together, a crash in between would restart the campaign
+        with sync_redis_client.transaction() as pipe:
+            pipe.set(done_key, enqueued, ex=7 * 86400)
+            pipe.delete(cursor_key)
         
-        logger.info(f"Sent promotional emails to {sent_count} inactive users")
-        return sent_count
+        logger.info(f"Sent promotional emails to {enqueued} inactive users", campaign_id=campaign_id)
+        return enqueued
         
     except Exception as e:
-        logger.error(f"Failed to send promotional emails", error=str(e))
+        logger.error(f"Failed to send promotional emails", campaign_id=campaign_id, error=str(e))
         return 0
     finally:
         db.close()
 
 
-@celery_app.task
-def batch_update_user_stats():
+@celery_app.task(bind=True)
+def batch_update_user_stats(self):
     '''Update user statistics in batch (scheduled task)'''
     db = SessionLocal()
     try:
         from app.models.order import Order, OrderStatus
         
-        # Get all active users
-        users = db.query(User).filter(User.is_active == True).all()
-        
+        # One grouped aggregate for every active user (zero stats for users with no deliveries)
+        stats_query = select(
+            User.id,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0)
+        ).outerjoin(
+            Order,
+            and_(Order.customer_id == User.id, Order.status == OrderStatus.DELIVERED)
+        ).where(
+            User.is_active == True
+        ).group_by(User.id).execution_options(yield_per=settings.USER_STATS_CHUNK_SIZE)
+        
+        last_updated = datetime.utcnow().isoformat()
         updated_count = 0
-        for user in users:
-            # Calculate stats
-            total_orders = db.query(Order).filter(
-                Order.customer_id == user.id,
-                Order.status == OrderStatus.DELIVERED
-            ).count()
-            
-            total_spent = db.query(func.sum(Order.total_amount)).filter(
-                Order.customer_id == user.id,
-                Order.status == OrderStatus.DELIVERED
-            ).scalar() or 0
+        failed_count = 0
+        
+        # Stream the aggregate with a server-side cursor, one Redis round trip per chunk
+        for chunk in db.execute(stats_query).partitions():
+            written = sync_redis_client.set_many(
+                {
+                    f"user_stats:{user_id}": {
+                        'total_orders': total_orders,
+                        'total_spent': float(total_spent),
+                        'last_updated': last_updated
+                    }
+                    for user_id, total_orders, total_spent in chunk
+                },
+                expire=86400
+            )
             
-            # Store in Redis
-            stats = {
-                'total_orders': total_orders,
-                'total_spent': float(total_spent),
-                'last_updated': datetime.utcnow().isoformat()
-            }
+            # set_many logs and returns False on a Redis error; only written chunks count
+            if not written:
+                failed_count += len(chunk)
+                logger.error(f"User stats chunk not written", failed=failed_count)
+                continue
             
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(
-                redis_client.set(
-                    f"user_stats:{user.id}",
-                    stats,
-                    expire=86400
-                )
-            )
-            loop.close()
+            updated_count += len(chunk)
             
-            updated_count += 1
+            self.update_state(state='PROGRESS', meta={'updated': updated_count, 'failed': failed_count})
+            logger.info(f"User stats chunk written", updated=updated_count)
         
-        logger.info(f"Updated stats for {updated_count} users")
+        logger.info(f"Updated stats for {updated_count} users", failed=failed_count)
         return updated_count
         
     except Exception as e:
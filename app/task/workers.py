@@ -0,0 +1,34 @@
+'''
+Start a worker bound to one queue with that queue's concurrency and prefetch.
+
+    python -m app.task.workers payments
+    python -m app.task.workers realtime --loglevel=debug
+'''
+import sys
+from app.task.celery_app import celery_app, QUEUE_PROFILES
+
+
+def worker_argv(queue: str, extra: list = None) -> list:
+    profile = QUEUE_PROFILES[queue]
+
+    return [
+        "worker",
+        f"--queues={queue}",
+        f"--concurrency={profile['concurrency']}",
+        f"--prefetch-multiplier={profile['prefetch_multiplier']}",
+        f"--hostname={queue}@%h",
+        "--loglevel=info",
+        *(extra or []),
+    ]
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in QUEUE_PROFILES:
+        print(f"usage: python -m app.task.workers <{'|'.join(QUEUE_PROFILES)}> [celery worker options]")
+        sys.exit(1)
+
+    celery_app.worker_main(worker_argv(sys.argv[1], sys.argv[2:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+'''
+Read-through caching for service lookups.
+
+Two tiers: a per-process LRU answers repeat reads without a network hop, and
+Redis shares loaded values between API processes and Celery workers. A miss
+loads once: concurrent misses in one process wait for the thread already
+loading, and misses in other processes wait on a short Redis lock. Entries
+are refreshed a little before they expire, with a probability that rises as
+expiry nears (XFetch), so one caller reloads while everyone else keeps
+reading the old value. Invalidations delete the Redis entry and are published
+so every process drops its local copy.
+
+Cached values are JSON payloads, not ORM objects: EntityCodec turns rows into
+column dicts and back into instances attached to the caller's session.
+'''
+import functools
+import inspect
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Date, DateTime
+from sqlalchemy import Enum as SAEnum
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.config import settings
+from app.utils.redis_client import sync_redis_client
+from app.core.logging import logger
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class JSONCodec:
+    '''Values that are already JSON-serialisable'''
+
+    def dump(self, value: Any) -> Any:
+        return value
+
+    def load(self, owner: Any, payload: Any) -> Any:
+        return payload
+
+
+class EntityCodec:
+    '''Rows of one model as column dicts, loaded back into `owner.db` without a query.
+
+    Instances come back persistent and clean, so relationships lazy-load and
+    changes commit as usual. Columns in `exclude` are never written to Redis and
+    load from the database on first access.
+    '''
+
+    def __init__(self, model, many: bool = False, exclude: Iterable[str] = ()):
+        self.model = model
+        self.many = many
+        self.exclude = set(exclude)
+
+    @functools.cached_property
+    def columns(self) -> List[Tuple[str, Any]]:
+        # Resolved on first use, mapper inspection needs every related model imported
+        return [
+            (attr.key, attr.columns[0].type)
+            for attr in sa_inspect(self.model).column_attrs
+            if attr.key not in self.exclude
+        ]
+
+    def _dump_row(self, instance) -> Dict[str, Any]:
+        row = {}
+
+        for key, _ in self.columns:
+            value = getattr(instance, key)
+
+            if isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, (datetime, date)):
+                value = value.isoformat()
+
+            row[key] = value
+
+        return row
+
+    def _load_row(self, db, row: Dict[str, Any]):
+        values = {}
+
+        for key, column_type in self.columns:
+            value = row.get(key)
+
+            if value is not None:
+                if isinstance(column_type, SAEnum) and column_type.enum_class is not None:
+                    value = column_type.enum_class(value)
+                elif isinstance(column_type, DateTime):
+                    value = datetime.fromisoformat(value)
+                elif isinstance(column_type, Date):
+                    value = date.fromisoformat(value)
+
+            values[key] = value
+
+        instance = self.model(**values)
+        make_transient_to_detached(instance)
+        return db.merge(instance, load=False)
+
+    def dump(self, value: Any) -> Any:
+        if value is None:
+            return None
+
+        if self.many:
+            return [self._dump_row(instance) for instance in value]
+        return self._dump_row(value)
+
+    def load(self, owner: Any, payload: Any) -> Any:
+        if self.many:
+            return [self._load_row(owner.db, row) for row in payload]
+        return self._load_row(owner.db, payload)
+
+
+class _Flight:
+    '''One in-process load that other threads asking for the same key wait on'''
+
+    __slots__ = ("done", "ok", "payload")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.payload = None
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        ttl: int = 300,
+        local_ttl: int = 30,
+        local_maxsize: int = 2048,
+        beta: float = 1.0,
+        lock_ttl: int = 10,
+        load_wait: float = 2.0
+    ):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_maxsize = local_maxsize
+        self.beta = beta
+        self.lock_ttl = lock_ttl
+        self.load_wait = load_wait
+
+        # key -> (payload, expires_at, delta, local_deadline); expires_at and delta drive early refresh
+        self._local: "OrderedDict[str, Tuple[Any, float, float, float]]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._listener_pid: Optional[int] = None
+
+    @classmethod
+    def from_settings(cls) -> "TwoTierCache":
+        return cls(
+            ttl=settings.CACHE_TTL,
+            local_ttl=settings.CACHE_LOCAL_TTL,
+            local_maxsize=settings.CACHE_LOCAL_MAXSIZE,
+            beta=settings.CACHE_EARLY_REFRESH_BETA,
+            lock_ttl=settings.CACHE_LOAD_LOCK_TTL,
+            load_wait=settings.CACHE_LOAD_WAIT
+        )
+
+    # Local tier
+
+    def _local_get(self, key: str) -> Optional[Tuple[Any, float, float, float]]:
+        with self._lock:
+            entry = self._local.get(key)
+
+            if entry is None:
+                return None
+            if entry[3] <= time.time():
+                del self._local[key]
+                return None
+
+            self._local.move_to_end(key)
+            return entry
+
+    def _local_put(self, key: str, payload: Any, expires_at: float, delta: float, local_ttl: int):
+        with self._lock:
+            self._local[key] = (payload, expires_at, delta, min(expires_at, time.time() + local_ttl))
+            self._local.move_to_end(key)
+
+            while len(self._local) > self.local_maxsize:
+                self._local.popitem(last=False)
+
+    def _local_drop(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    # Redis tier
+
+    def _shared_get(self, key: str) -> Optional[Tuple[Any, float, float]]:
+        raw = sync_redis_client.get_key(key)
+        if raw is None:
+            return None
+
+        try:
+            entry = json.loads(raw)
+            return entry["v"], entry["x"], entry["d"]
+
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _shared_put(self, key: str, payload: Any, expires_at: float, delta: float, ttl: int):
+        sync_redis_client.set(key, {"v": payload, "x": expires_at, "d": delta}, expire=ttl)
+
+    def _should_refresh(self, expires_at: float, delta: float) -> bool:
+        '''XFetch: reload early with a probability that grows as expiry nears and with the cost of a load'''
+        if self.beta <= 0:
+            return False
+
+        return time.time() - delta * self.beta * math.log(1.0 - random.random()) >= expires_at
+
+    # Loading
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[int] = None, local_ttl: Optional[int] = None) -> Any:
+        '''Cached payload for `key`, calling `loader` on a miss; None results are never cached'''
+        self._ensure_listener()
+
+        ttl = ttl or self.ttl
+        local_ttl = local_ttl or self.local_ttl
+
+        entry = self._local_get(key)
+        if entry is not None:
+            payload, expires_at, delta, _ = entry
+
+            if not self._should_refresh(expires_at, delta):
+                return payload
+            return self._load(key, loader, ttl, local_ttl, stale=payload)
+
+        shared = self._shared_get(key)
+        if shared is not None:
+            payload, expires_at, delta = shared
+            self._local_put(key, payload, expires_at, delta, local_ttl)
+
+            if not self._should_refresh(expires_at, delta):
+                return payload
+            return self._load(key, loader, ttl, local_ttl, stale=payload)
+
+        return self._load(key, loader, ttl, local_ttl)
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: int, local_ttl: int, stale: Any = None) -> Any:
+        '''Single flight within the process: one thread loads, the others wait for it or keep the stale value'''
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if stale is not None:
+                return stale
+
+            flight.done.wait(self.load_wait + self.lock_ttl)
+            if flight.ok:
+                return flight.payload
+
+            # The leading load failed or took too long, try on our own
+            return loader()
+
+        try:
+            flight.payload = self._load_shared(key, loader, ttl, local_ttl, stale)
+            flight.ok = True
+            return flight.payload
+
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _load_shared(self, key: str, loader: Callable[[], Any], ttl: int, local_ttl: int, stale: Any) -> Any:
+        '''Single flight across processes: the worker holding the Redis lock loads, the others poll for its result'''
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+
+        try:
+            acquired = sync_redis_client.redis.set(lock_key, token, nx=True, ex=self.lock_ttl)
+
+        except Exception as e:
+            logger.error(f"Cache lock unavailable, loading directly", key=key, error=str(e))
+            acquired = None
+            token = None
+
+        if not acquired and token is not None:
+            if stale is not None:
+                return stale
+
+            deadline = time.monotonic() + self.load_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+
+                shared = self._shared_get(key)
+                if shared is not None:
+                    payload, expires_at, delta = shared
+                    self._local_put(key, payload, expires_at, delta, local_ttl)
+                    return payload
+
+            logger.warning(f"Cache load wait timed out", key=key)
+
+        try:
+            started = time.perf_counter()
+            payload = loader()
+            delta = time.perf_counter() - started
+
+            if payload is not None:
+                expires_at = time.time() + ttl
+                self._shared_put(key, payload, expires_at, delta, ttl)
+                self._local_put(key, payload, expires_at, delta, local_ttl)
+
+            return payload
+
+        finally:
+            # Only if still ours, it may have expired and been taken by another worker
+            if acquired:
+                sync_redis_client.release_lock(lock_key, token)
+
+    # Invalidation
+
+    def invalidate(self, *keys: str):
+        '''Drop keys from Redis and from the local tier of every process'''
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+
+        self._local_drop(keys)
+
+        try:
+            with sync_redis_client.pipeline() as pipe:
+                pipe.delete(*keys)
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+
+        except Exception as e:
+            logger.error(f"Cache invalidation failed", keys=keys, error=str(e))
+
+    def _ensure_listener(self):
+        # One subscriber thread per process; a forked worker starts its own
+        if self._listener_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+
+            self._listener_pid = os.getpid()
+            self._local.clear()
+            self._flights.clear()
+
+        threading.Thread(target=self._listen, name="cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+
+            try:
+                pubsub = sync_redis_client.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                # Invalidations sent while we were not subscribed are lost
+                self.clear_local()
+
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._local_drop(json.loads(message["data"]))
+
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed", error=str(e))
+                time.sleep(1.0)
+
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+cache = TwoTierCache.from_settings()
+
+
+def cached(namespace: str, codec=None, ttl: Optional[int] = None, local_ttl: Optional[int] = None):
+    '''Cache a service method by its arguments; the first parameter (self) is not part of the key.
+
+    The wrapped method gets `cache_key(*args)` and `invalidate(*args)`, called
+    with the same arguments as the method minus self.
+    '''
+    codec = codec or JSONCodec()
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def cache_key(*args, **kwargs) -> str:
+            bound = signature.bind(None, *args, **kwargs)
+            bound.apply_defaults()
+
+            parts = [str(value) for value in list(bound.arguments.values())[1:]]
+            return ":".join(["cache", namespace, *parts])
+
+        @functools.wraps(func)
+        def wrapper(owner, *args, **kwargs):
+            if not settings.CACHE_ENABLED:
+                return func(owner, *args, **kwargs)
+
+            payload = cache.get_or_load(
+                cache_key(*args, **kwargs),
+                lambda: codec.dump(func(owner, *args, **kwargs)),
+                ttl,
+                local_ttl
+            )
+            return codec.load(owner, payload) if payload is not None else None
+
+        wrapper.cache_key = cache_key
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(cache_key(*args, **kwargs))
+        return wrapper
+
+    return decorator
@@ -0,0 +1,123 @@
+import threading
+import time
+from typing import Dict, Tuple
+from app.utils.redis_client import sync_redis_client
+from app.core.logging import logger
+
+# Upper bounds in milliseconds; the last bucket takes everything slower
+DEFAULT_BUCKETS_MS: Tuple[float, ...] = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    '''Bucketed latency counts per operation, merged across processes in one Redis hash.
+
+    Observations are counted in memory and flushed with a single pipelined
+    HINCRBY round trip at most every `flush_interval` seconds. The flush runs
+    on a background thread, so observe() never does Redis I/O on the caller's
+    thread or event loop. Fields in the hash:
+    "<operation>:<outcome>:le_<bucket>", "<operation>:<outcome>:sum_ms".
+    '''
+
+    def __init__(self, key: str, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS, flush_interval: float = 10.0):
+        self.key = key
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def _bucket(self, elapsed_ms: float) -> str:
+        for bound in self.buckets_ms:
+            if elapsed_ms <= bound:
+                return f"le_{bound:g}"
+        return "le_inf"
+
+    def observe(self, operation: str, seconds: float, outcome: str = "ok"):
+        elapsed_ms = seconds * 1000
+        prefix = f"{operation}:{outcome}"
+
+        with self._lock:
+            bucket_field = f"{prefix}:{self._bucket(elapsed_ms)}"
+            self._pending[bucket_field] = self._pending.get(bucket_field, 0) + 1
+            self._pending[f"{prefix}:sum_ms"] = self._pending.get(f"{prefix}:sum_ms", 0.0) + elapsed_ms
+
+            due = not self._flushing and time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._flushing = True
+
+        if due:
+            threading.Thread(target=self._background_flush, name=f"{self.key}-flush", daemon=True).start()
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return
+
+        try:
+            with sync_redis_client.pipeline() as pipe:
+                for field, value in pending.items():
+                    if field.endswith(":sum_ms"):
+                        pipe.hincrbyfloat(self.key, field, round(value, 3))
+                    else:
+                        pipe.hincrby(self.key, field, int(value))
+
+        except Exception as e:
+            logger.error(f"Failed to flush latency histogram", key=self.key, error=str(e))
+
+    def snapshot(self) -> Dict[str, dict]:
+        '''Per "<operation>:<outcome>": count, average, approximate percentiles and bucket counts'''
+        self.flush()
+
+        series: Dict[str, dict] = {}
+        for field, value in sync_redis_client.redis.hgetall(self.key).items():
+            name, stat = field.rsplit(":", 1)
+            entry = series.setdefault(name, {"buckets": {}, "sum_ms": 0.0})
+
+            if stat == "sum_ms":
+                entry["sum_ms"] = float(value)
+            else:
+                entry["buckets"][stat] = int(value)
+
+        bounds = [f"le_{bound:g}" for bound in self.buckets_ms] + ["le_inf"]
+        metrics = {}
+
+        for name, entry in series.items():
+            buckets = {bound: entry["buckets"].get(bound, 0) for bound in bounds}
+            count = sum(buckets.values())
+
+            metrics[name] = {
+                "count": count,
+                "avg_ms": round(entry["sum_ms"] / count, 2) if count else 0.0,
+                "p50_ms": self._percentile(buckets, count, 50),
+                "p95_ms": self._percentile(buckets, count, 95),
+                "p99_ms": self._percentile(buckets, count, 99),
+                "buckets": buckets,
+            }
+
+        return metrics
+
+    def _percentile(self, buckets: Dict[str, int], count: int, pct: float):
+        # Upper bound of the bucket holding the percentile; None when it falls in the overflow bucket
+        if not count:
+            return 0.0
+
+        target = pct / 100 * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets_ms, buckets.values()):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+
+        return None
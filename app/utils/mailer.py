@@ -0,0 +1,187 @@
+import queue
+import smtplib
+import threading
+from email.message import EmailMessage
+from typing import Dict, Iterable, List, Optional
+from app.config import settings
+from app.core.logging import logger
+from app.utils.email_templates import render_template
+
+
+def build_message(to: str, subject: str, template: str, context: Dict) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = settings.EMAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(render_template(template, context))
+
+    return message
+
+
+class SMTPTransport:
+    '''Persistent SMTP connections shared by every send in a worker process.
+
+    Connections are opened lazily (never in the parent before fork), reused for
+    up to max_messages each and reopened once if the server dropped them while idle.
+    '''
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        pool_size: int = 2,
+        max_messages: int = 100,
+        timeout: float = 10
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue()
+        self._sent: Dict[int, int] = {}
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "SMTPTransport":
+        return cls(
+            host=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            use_tls=settings.SMTP_USE_TLS,
+            pool_size=settings.SMTP_POOL_SIZE,
+            max_messages=settings.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            timeout=settings.SMTP_TIMEOUT
+        )
+
+    def send(self, message: EmailMessage) -> bool:
+        return self.send_many([message]) == 1
+
+    def send_many(self, messages: Iterable[EmailMessage]) -> int:
+        '''Send messages back to back over one pooled connection; returns how many were accepted'''
+        messages = list(messages)
+        if not messages:
+            return 0
+
+        sent = 0
+        connection = None
+
+        try:
+            for message in messages:
+                if connection is not None and self._sent[id(connection)] >= self.max_messages:
+                    self._discard(connection)
+                    connection = None
+
+                for attempt in (1, 2):
+                    if connection is None:
+                        connection = self._acquire()
+
+                    try:
+                        connection.send_message(message)
+                        self._sent[id(connection)] += 1
+                        sent += 1
+                        break
+
+                    except smtplib.SMTPServerDisconnected:
+                        # Idle connection dropped by the server, retry once on a fresh one
+                        self._discard(connection)
+                        connection = None
+                        if attempt == 2:
+                            raise
+
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        # smtplib already reset the transaction, the connection stays usable
+                        logger.error(f"SMTP message rejected", to=message["To"], error=str(e))
+                        break
+
+            return sent
+
+        except Exception:
+            if connection is not None:
+                self._discard(connection)
+                connection = None
+            raise
+
+        finally:
+            if connection is not None:
+                self._release(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def _acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.pool_size
+            if can_open:
+                self._opened += 1
+
+        if not can_open:
+            return self._idle.get(timeout=self.timeout)
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        if self.use_tls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+
+        self._sent[id(connection)] = 0
+        return connection
+
+    def _release(self, connection: smtplib.SMTP):
+        # A connection at its cap never goes back to the pool, whoever acquires next gets a fresh one
+        if self._sent.get(id(connection), 0) >= self.max_messages:
+            self._discard(connection)
+            return
+
+        self._idle.put(connection)
+
+    def _discard(self, connection: smtplib.SMTP):
+        self._sent.pop(id(connection), None)
+
+        with self._lock:
+            self._opened -= 1
+
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+
+mail_transport = SMTPTransport.from_settings()
+
+
+def send_templated_emails(recipients: List[Dict], subject: str, template: str, context: Optional[Dict] = None) -> int:
+    '''recipients: [{"email": ..., "context": {...}}]; per-recipient context wins over the shared one'''
+    shared = context or {}
+
+    return mail_transport.send_many(
+        build_message(recipient["email"], subject, template, {**shared, **recipient.get("context", {})})
+        for recipient in recipients
+    )
@@ -1,17 +1,95 @@
 import redis
+import redis.asyncio as aioredis
 import json 
-from typing import Any , Optional
+import uuid
+from contextlib import asynccontextmanager , contextmanager
+from typing import Any , AsyncContextManager , AsyncIterator , ContextManager , Dict , Iterable , Iterator , List , Optional , Tuple
+from redis.asyncio.client import Pipeline as AsyncPipeline
+from redis.backoff import ExponentialBackoff
+from redis.client import Pipeline
+from redis.retry import Retry
 from app.config import settings
 from  app.core.logging import logger
 
 
+def serialize_value(value : Any) -> Any:
+    '''Storage convention shared by every client: containers are stored as JSON'''
+    if isinstance(value , (dict , list)):
+        return json.dumps(value)
+    
+    return value
+
+
+# Owned locks: the value is a random token, only its holder may release or extend the lock
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def expiry_for(key : str , expire : Optional[int] , expires : Optional[Dict[str , Optional[int]]]) -> Optional[int]:
+    '''Per-key TTL from ``expires`` when given, else the batch-wide ``expire``'''
+    if expires and key in expires:
+        return expires[key]
+    
+    return expire
+
+
+def pool_options() -> Dict[str , Any]:
+    '''Connection settings shared by the async and the blocking pool'''
+    return dict(
+        decode_responses = True ,
+        max_connections = settings.REDIS_MAX_CONNECTIONS ,
+        socket_timeout = settings.REDIS_SOCKET_TIMEOUT ,
+        socket_connect_timeout = settings.REDIS_SOCKET_CONNECT_TIMEOUT ,
+        retry_on_timeout = settings.REDIS_RETRY_ON_TIMEOUT ,
+        retry = Retry(ExponentialBackoff(cap = 1.0 , base = 0.05) , settings.REDIS_RETRY_ATTEMPTS) ,
+        health_check_interval = settings.REDIS_HEALTH_CHECK_INTERVAL
+    )
+
+
 class RedisClient:
+    '''Non-blocking client for the API; one pool per process, opened on first use'''
+    
     def __init__(self):
-        self.redis = redis.from_url(settings.redis_url , decode_response = True)
+        self.pool : Optional[aioredis.ConnectionPool] = None
+        self._redis : Optional[aioredis.Redis] = None
+        self._script_sources : Dict[str , str] = {}
+        self._scripts : Dict[str , Any] = {}
+    
+    def init_pool(self):
+        self.pool = aioredis.ConnectionPool.from_url(settings.redis_url , **pool_options())
+        self._redis = aioredis.Redis(connection_pool = self.pool)
+    
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+        
+        if self.pool is not None:
+            await self.pool.disconnect()
+        
+        self.pool = None
+        self._redis = None
+    
+    @property
+    def redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self.init_pool()
+        
+        return self._redis
         
     async def get_key(self , key : str) -> Optional[str]:
         try:
-            return self.redis.get(key)    
+            return await self.redis.get(key)    
         
         except Exception as e:
             logger.error(f" Redis GET error :{e}", key=key)
@@ -21,10 +99,7 @@ class RedisClient:
     
     async def set(self , key : str , value : Any  , expire : Optional[int] = None) -> bool:
         try:
-            if isinstance(value , (dict , list)):
-                value = json.dumps(value)
-            
-            return self.redis.set(key , value , ex = expire)    
+            return await self.redis.set(key , serialize_value(value) , ex = expire)    
         
         except Exception as e:
             logger.error(f"Redis SET error :{e}" , key = key) 
@@ -34,7 +109,7 @@ class RedisClient:
     
     async def delete(self , key : str) -> bool:
         try:
-            return bool(self.redis.delete(key))
+            return bool(await self.redis.delete(key))
         
         except Exception as e:
             logger.error(f"Redis DELETE error: {e}" , key = key) 
@@ -42,14 +117,308 @@ class RedisClient:
             return False
         
     
-    async def exist(self , key : str) -> bool:    
+    async def exists(self , key : str) -> bool:    
         try:
-            return bool(self.redis.exist(key))
+            return bool(await self.redis.exists(key))
         
         except Exception as e:
-            logger.error(f"Redis EXIST error: {e}" , key = key)
+            logger.error(f"Redis EXISTS error: {e}" , key = key)
             
             return False      
         
+    
+    async def get_many(self , keys : Iterable[str]) -> Dict[str , Optional[str]]:
+        '''MGET: every key in one round trip, missing keys map to None'''
+        keys = list(keys)
+        if not keys:
+            return {}
+        
+        try:
+            return dict(zip(keys , await self.redis.mget(keys)))
+        
+        except Exception as e:
+            logger.error(f"Redis MGET error: {e}" , count = len(keys))
+            
+            return {key : None for key in keys}
+        
+    
+    async def set_many(
+        self ,
+        values : Dict[str , Any] ,
+        expire : Optional[int] = None ,
+        expires : Optional[Dict[str , Optional[int]]] = None
+    ) -> bool:
+        '''Write every key in one round trip; ``expires`` overrides ``expire`` per key'''
+        if not values:
+            return True
+        
+        try:
+            async with self.redis.pipeline(transaction = False) as pipe:
+                for key , value in values.items():
+                    pipe.set(key , serialize_value(value) , ex = expiry_for(key , expire , expires))
+                
+                return all(await pipe.execute())
+        
+        except Exception as e:
+            logger.error(f"Redis SET many error: {e}" , count = len(values))
+            
+            return False
+        
+    
+    async def delete_many(self , keys : Iterable[str]) -> int:
+        keys = list(keys)
+        if not keys:
+            return 0
+        
+        try:
+            return await self.redis.delete(*keys)
+        
+        except Exception as e:
+            logger.error(f"Redis DELETE many error: {e}" , count = len(keys))
+            
+            return 0
+        
+    
+    @asynccontextmanager
+    async def pipeline(self , transaction : bool = False) -> AsyncIterator[AsyncPipeline]:
+        '''Queue commands on the yielded pipeline; whatever is still queued is sent when the block exits'''
+        async with self.redis.pipeline(transaction = transaction) as pipe:
+            yield pipe
+            
+            if pipe.command_stack:
+                await pipe.execute()
+        
+    
+    def transaction(self) -> AsyncContextManager[AsyncPipeline]:
+        '''Same as pipeline() but wrapped in MULTI/EXEC, so the commands apply atomically'''
+        return self.pipeline(transaction = True)
+        
+    
+    def register_script(self , name : str , source : str):
+        self._script_sources[name] = source
+        self._scripts.pop(name , None)
+        
+    
+    async def run_script(self , name : str , keys : Iterable[str] = () , args : Iterable[Any] = ()) -> Any:
+        '''EVALSHA a registered script, loading it on the server the first time it is missing'''
+        if name not in self._scripts:
+            self._scripts[name] = self.redis.register_script(self._script_sources[name])
+        
+        return await self._scripts[name](keys = list(keys) , args = list(args) , client = self.redis)
+        
+    
+    async def stream_append(self , key : str , fields : Dict[str , Any] , maxlen : int , expire : Optional[int] = None) -> Optional[str]:
+        '''XADD to a stream capped at roughly ``maxlen`` entries'''
+        try:
+            async with self.pipeline() as pipe:
+                pipe.xadd(key , fields , maxlen = maxlen , approximate = True)
+                
+                if expire:
+                    pipe.expire(key , expire)
+                
+                return (await pipe.execute())[0]
+        
+        except Exception as e:
+            logger.error(f"Redis XADD error: {e}" , key = key)
+            
+            return None
+        
+    
+    async def stream_range(self , key : str , count : Optional[int] = None) -> List[Tuple[str , Dict[str , str]]]:
+        try:
+            return await self.redis.xrange(key , count = count)
+        
+        except Exception as e:
+            logger.error(f"Redis XRANGE error: {e}" , key = key)
+            
+            return []
+        
+    
+    async def stream_last(self , key : str) -> Optional[Tuple[str , Dict[str , str]]]:
+        try:
+            entries = await self.redis.xrevrange(key , count = 1)
+            return entries[0] if entries else None
+        
+        except Exception as e:
+            logger.error(f"Redis XREVRANGE error: {e}" , key = key)
+            
+            return None
+        
+
+class SyncRedisClient:
+    '''Blocking client for Celery workers; the pool is built once per worker process'''
+    
+    def __init__(self):
+        self.pool : Optional[redis.ConnectionPool] = None
+        self._redis : Optional[redis.Redis] = None
+        self._script_sources : Dict[str , str] = {}
+        self._scripts : Dict[str , Any] = {}
+    
+    def init_pool(self):
+        # Called from worker_process_init so forked children never share parent sockets
+        self.close()
+        
+        self.pool = redis.ConnectionPool.from_url(settings.redis_url , **pool_options())
+        self._redis = redis.Redis(connection_pool = self.pool)
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.disconnect()
+        
+        self.pool = None
+        self._redis = None
+    
+    @property
+    def redis(self) -> redis.Redis:
+        # Lazily initialise for solo/thread pools where worker_process_init never fires
+        if self._redis is None:
+            self.init_pool()
+        
+        return self._redis
+    
+    def get_key(self , key : str) -> Optional[str]:
+        try:
+            return self.redis.get(key)
+        
+        except Exception as e:
+            logger.error(f" Redis GET error :{e}", key=key)
+            
+            return None
+    
+    def set(self , key : str , value : Any , expire : Optional[int] = None) -> bool:
+        try:
+            return self.redis.set(key , serialize_value(value) , ex = expire)
+        
+        except Exception as e:
+            logger.error(f"Redis SET error :{e}" , key = key)
+            
+            return False
+    
+    def delete(self , key : str) -> bool:
+        try:
+            return bool(self.redis.delete(key))
+        
+        except Exception as e:
+            logger.error(f"Redis DELETE error: {e}" , key = key)
+            
+            return False
+    
+    def exists(self , key : str) -> bool:
+        try:
+            return bool(self.redis.exists(key))
+        
+        except Exception as e:
+            logger.error(f"Redis EXISTS error: {e}" , key = key)
+            
+            return False
+    
+    def get_many(self , keys : Iterable[str]) -> Dict[str , Optional[str]]:
+        '''MGET: every key in one round trip, missing keys map to None'''
+        keys = list(keys)
+        if not keys:
+            return {}
+        
+        try:
+            return dict(zip(keys , self.redis.mget(keys)))
+        
+        except Exception as e:
+            logger.error(f"Redis MGET error: {e}" , count = len(keys))
+            
+            return {key : None for key in keys}
+    
+    def set_many(
+        self ,
+        values : Dict[str , Any] ,
+        expire : Optional[int] = None ,
+        expires : Optional[Dict[str , Optional[int]]] = None
+    ) -> bool:
+        '''Write every key in one round trip; ``expires`` overrides ``expire`` per key'''
+        if not values:
+            return True
+        
+        try:
+            with self.redis.pipeline(transaction = False) as pipe:
+                for key , value in values.items():
+                    pipe.set(key , serialize_value(value) , ex = expiry_for(key , expire , expires))
+                
+                return all(pipe.execute())
+        
+        except Exception as e:
+            logger.error(f"Redis SET many error: {e}" , count = len(values))
+            
+            return False
+    
+    def delete_many(self , keys : Iterable[str]) -> int:
+        keys = list(keys)
+        if not keys:
+            return 0
+        
+        try:
+            return self.redis.delete(*keys)
+        
+        except Exception as e:
+            logger.error(f"Redis DELETE many error: {e}" , count = len(keys))
+            
+            return 0
+    
+    @contextmanager
+    def pipeline(self , transaction : bool = False) -> Iterator[Pipeline]:
+        '''Queue commands on the yielded pipeline; whatever is still queued is sent when the block exits'''
+        with self.redis.pipeline(transaction = transaction) as pipe:
+            yield pipe
+            
+            if pipe.command_stack:
+                pipe.execute()
+    
+    def transaction(self) -> ContextManager[Pipeline]:
+        '''Same as pipeline() but wrapped in MULTI/EXEC, so the commands apply atomically'''
+        return self.pipeline(transaction = True)
+    
+    def register_script(self , name : str , source : str):
+        self._script_sources[name] = source
+        self._scripts.pop(name , None)
+    
+    def run_script(self , name : str , keys : Iterable[str] = () , args : Iterable[Any] = ()) -> Any:
+        '''EVALSHA a registered script, loading it on the server the first time it is missing'''
+        if name not in self._scripts:
+            self._scripts[name] = self.redis.register_script(self._script_sources[name])
+        
+        # Pass the client explicitly, the pool is rebuilt in every forked worker
+        return self._scripts[name](keys = list(keys) , args = list(args) , client = self.redis)
+    
+    def acquire_lock(self , key : str , ttl : int) -> Optional[str]:
+        '''SET NX with a random token; returns the token, None if the lock is held or Redis is unavailable'''
+        token = uuid.uuid4().hex
+        
+        try:
+            return token if self.redis.set(key , token , nx = True , ex = ttl) else None
+        
+        except Exception as e:
+            logger.error(f"Redis lock error: {e}" , key = key)
+            
+            return None
+    
+    def extend_lock(self , key : str , token : str , ttl : int) -> bool:
+        '''Reset the TTL of a lock we still hold; False once it expired or was taken over'''
+        try:
+            return bool(self.run_script("extend_lock" , keys = [key] , args = [token , ttl]))
+        
+        except Exception as e:
+            logger.error(f"Redis lock extend error: {e}" , key = key)
+            
+            return False
+    
+    def release_lock(self , key : str , token : str) -> bool:
+        try:
+            return bool(self.run_script("release_lock" , keys = [key] , args = [token]))
+        
+        except Exception as e:
+            logger.error(f"Redis lock release error: {e}" , key = key)
+            
+            return False
+        
 
-redis_client = RedisClient()        
\ No newline at end of file
+redis_client = RedisClient()
+sync_redis_client = SyncRedisClient()
+sync_redis_client.register_script("release_lock" , RELEASE_LOCK_SCRIPT)
+sync_redis_client.register_script("extend_lock" , EXTEND_LOCK_SCRIPT)
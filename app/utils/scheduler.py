@@ -0,0 +1,92 @@
+import time
+from typing import List, Optional
+from app.config import settings
+from app.models.order import OrderStatus
+from app.utils.redis_client import sync_redis_client
+from app.core.logging import logger
+
+
+# Pop up to ARGV[2] members whose score is <= ARGV[1], atomically, so two pollers never get the same entry
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+sync_redis_client.register_script("pop_due", POP_DUE_SCRIPT)
+
+
+class DeadlineScheduler:
+    '''Delayed jobs kept in one Redis sorted set: member is the entity id, score the due time.
+
+    Registering, re-arming and cancelling are single O(log n) commands, and the
+    poller only ever touches entries that are already due instead of scanning tables.
+    '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key = f"deadlines:{name}"
+
+    def schedule(self, member: int, delay_seconds: float) -> bool:
+        '''Arm (or re-arm) the timer of one entity'''
+        try:
+            sync_redis_client.redis.zadd(self.key, {str(member): time.time() + delay_seconds})
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to schedule deadline", timer=self.name, member=member, error=str(e))
+            return False
+
+    def cancel(self, member: int) -> bool:
+        try:
+            return bool(sync_redis_client.redis.zrem(self.key, str(member)))
+
+        except Exception as e:
+            logger.error(f"Failed to cancel deadline", timer=self.name, member=member, error=str(e))
+            return False
+
+    def cancel_many(self, members: List[int]) -> int:
+        if not members:
+            return 0
+
+        try:
+            return sync_redis_client.redis.zrem(self.key, *[str(member) for member in members])
+
+        except Exception as e:
+            logger.error(f"Failed to cancel deadlines", timer=self.name, count=len(members), error=str(e))
+            return 0
+
+    def pop_due(self, limit: int, now: Optional[float] = None) -> List[int]:
+        '''Remove and return up to `limit` members whose deadline has passed'''
+        due = sync_redis_client.run_script(
+            "pop_due",
+            keys=[self.key],
+            args=[now if now is not None else time.time(), limit]
+        )
+        return [int(member) for member in due]
+
+    def pending(self) -> int:
+        return sync_redis_client.redis.zcard(self.key)
+
+
+# Orders left unpaid are cancelled when this fires; payment completion cancels it
+payment_deadlines = DeadlineScheduler("payment_timeout")
+
+# Orders stuck in PREPARING past the restaurant SLA
+preparing_deadlines = DeadlineScheduler("preparing_sla")
+
+
+def on_order_created(order_id: int):
+    payment_deadlines.schedule(order_id, settings.ORDER_PAYMENT_TIMEOUT_MINUTES * 60)
+
+
+def on_order_status_change(order_id: int, new_status: OrderStatus):
+    '''Arm or disarm the order timers for a status transition'''
+    if new_status != OrderStatus.PENDING:
+        payment_deadlines.cancel(order_id)
+
+    if new_status == OrderStatus.PREPARING:
+        preparing_deadlines.schedule(order_id, settings.ORDER_PREPARING_SLA_MINUTES * 60)
+    else:
+        preparing_deadlines.cancel(order_id)
@@ -0,0 +1,58 @@
+import math
+from typing import Dict, Hashable, List, Tuple
+
+
+class TimerWheel:
+    '''Hashed timer wheel: O(1) schedule/cancel, one shared tick for every timer'''
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 64):
+        self.tick_seconds = tick_seconds
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self.cursor = 0
+
+        # key -> slot index, so cancel/reschedule never scans the wheel
+        self.positions: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.positions
+
+    def schedule(self, key: Hashable, delay_seconds: float):
+        '''(Re)schedule ``key`` to expire after ``delay_seconds``'''
+        self.cancel(key)
+
+        ticks = max(1, math.ceil(delay_seconds / self.tick_seconds))
+        slot, rounds = self._place(ticks)
+
+        self.slots[slot][key] = rounds
+        self.positions[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self.positions.pop(key, None)
+        if slot is None:
+            return False
+
+        self.slots[slot].pop(key, None)
+        return True
+
+    def advance(self) -> List[Hashable]:
+        '''Move the wheel one tick and return the keys that expired'''
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        bucket = self.slots[self.cursor]
+
+        expired = []
+        for key, rounds in list(bucket.items()):
+            if rounds == 0:
+                del bucket[key]
+                self.positions.pop(key, None)
+                expired.append(key)
+            else:
+                bucket[key] = rounds - 1
+
+        return expired
+
+    def _place(self, ticks: int) -> Tuple[int, int]:
+        size = len(self.slots)
+        return (self.cursor + ticks) % size, (ticks - 1) // size
@@ -1,8 +1,26 @@
 from fastapi import WebSocket
 from typing import Dict , List , Optional
 import asyncio
-from app.core.logging import logger
 import json
+import time
+import redis.asyncio as aioredis
+from app.config import settings
+from app.core.logging import logger
+from app.utils.timer_wheel import TimerWheel
+from app.utils.ws_codec import Frame , encode_message
+
+
+# Close code used when the reaper drops a silent connection
+IDLE_TIMEOUT_CLOSE_CODE = 4002
+
+# Pub/sub channel per user; workers publish here and every API process relays to its own sockets
+USER_CHANNEL_PREFIX = "ws_user:"
+
+# System-wide broadcasts: {"roles": [...] or null, "message": {...}}
+BROADCAST_CHANNEL = "ws_broadcast"
+
+# Seconds to wait before resubscribing after a Redis error
+RELAY_RETRY_DELAY = 2
 
 
 class ConnectionManager:
@@ -11,51 +29,84 @@ class ConnectionManager:
         
         self.user_connection : Dict[int , WebSocket] = {}
         
-        # Store connecton by role for broadcasting
+        # Store connecton by role for broadcasting (role -> user_id -> websocket)
         
-        self.role_connection : Dict[str , List[WebSocket]] = {
-            "customer" : [],
-            "restaurant_owner" : [],
-            "delivery_partner" : [],
-            "admin" : []
+        self.role_connection : Dict[str , Dict[int , WebSocket]] = {
+            "customer" : {},
+            "restaurant_owner" : {},
+            "delivery_partner" : {},
+            "admin" : {}
             
         }
+
+        # Role of every connected user and monotonic time of its last inbound frame
+
+        self.user_role : Dict[int , str] = {}
+        self.last_seen : Dict[int , float] = {}
+
+        # Negotiated wire subprotocol per user (None means JSON text frames)
+
+        self.user_protocol : Dict[int , Optional[str]] = {}
+
+        # One wheel drives heartbeats and idle timeouts for every socket
+
+        self.timer_wheel = TimerWheel(settings.WS_TIMER_TICK , settings.WS_TIMER_SLOTS)
+        self.reaper_task : Optional[asyncio.Task] = None
+        self.relay_task : Optional[asyncio.Task] = None
+
+        self.reaped_count = 0
+        self.heartbeats_sent = 0
         
     
-    async def connect(self , websocket : WebSocket , user_id : int , user_role : str):
-        await websocket.accept()
+    async def connect(self , websocket : WebSocket , user_id : int , user_role : str , subprotocol : Optional[str] = None):
+        await websocket.accept(subprotocol = subprotocol)
         
+        # A reconnect replaces the previous socket of the same user
+
+        previous = self._evict(user_id)
+        if previous is not None and previous is not websocket:
+            await self._close_quietly(previous)
+
         self.user_connection[user_id] = websocket 
+        self.user_role[user_id] = user_role
+        self.user_protocol[user_id] = subprotocol
         
-        if user_role in self.user_connection:
-            self.role_connection[user_role].append(websocket)
+        if user_role in self.role_connection:
+            self.role_connection[user_role][user_id] = websocket
+
+        self.touch(user_id)
+        self.timer_wheel.schedule(user_id , settings.WS_HEARTBEAT_INTERVAL)
         
         logger.info(f"Websocket is connected " , user_id=user_id , role = user_role)
     
     
-    def disconnect(self , user_id : int , user_role : str):
-        websocket = self.user_connection.remove(user_id)
+    def disconnect(self , user_id : int , user_role : str , websocket : Optional[WebSocket] = None):
+        # Ignore late disconnects from a socket that was already replaced or reaped
         
-        if websocket and user_role in self.role_connection:
-            try:
-                self.role_connection.remove(user_role)
+        if websocket is not None and self.user_connection.get(user_id) is not websocket:
+            return
             
-            except ValueError:
-                pass                   
+        self._evict(user_id)
         
         logger.info(f"Websocket Disconnected" , user_id = user_id , role = user_role)
     
-    async def send_personal_msg(self , msg : dict , user_id : int):
+
+    def touch(self , user_id : int):
+        '''Record inbound activity; the wheel picks it up lazily on the next expiry'''
+        self.last_seen[user_id] = time.monotonic()
+
+
+    async def send_personal_message(self , msg : dict , user_id : int):
         websocket = self.user_connection.get(user_id)
         
         if websocket:
             try:
-                await websocket.send_text(json.dumps(msg))
+                await self._send(websocket , encode_message(msg , self.user_protocol.get(user_id)))
             
             except Exception as e:
                 logger.error(f"Failed to send personal message" , user_id = user_id , error = str(e)) 
                 
-                self.user_connection.pop(user_id , None)
+                self._evict(user_id)
                 
     
     async def send_to_role(self , message :dict , role : str):
@@ -65,31 +116,32 @@ class ConnectionManager:
         
         disconnected = []
         
-        for websocket in self.role_connection[role]:
+        # Encode once per subprotocol, not once per recipient
+        
+        frames : Dict[Optional[str] , Frame] = {}
+        
+        for user_id , websocket in list(self.role_connection[role].items()):
             try:
-                await websocket.send_text(json.dumps(message))
+                await self._send(websocket , self._encode_cached(frames , message , user_id))
             
             except Exception as e:
                 logger.error(f"Failed to send role message" , role = role , error = str(e))
                 
-                disconnected.append(websocket)
+                disconnected.append(user_id)
                 
         
         # clean up disconnected websockets 
         
-        for ws in disconnected:
-            try:
-                self.role_connection[role].remove(ws)                            
-        
-            except ValueError:
-                pass
+        for user_id in disconnected:
+            self._evict(user_id)
     
     async def broadcast(self, msg :dict):
         disconnected_users = []
+        frames : Dict[Optional[str] , Frame] = {}
         
-        for user_id , websocket in self.user_connection.items():
+        for user_id , websocket in list(self.user_connection.items()):
             try:
-                await websocket.send_text(json.dumps(msg))    
+                await self._send(websocket , self._encode_cached(frames , msg , user_id))
                 
             except Exception as e:
                 logger.error(f"Failed to broadcast message" , user_id = user_id , error = str(e)) 
@@ -100,7 +152,199 @@ class ConnectionManager:
          # clean  up disconnected users 
          
         for user_id in disconnected_users:
-            self.user_connection.pop(user_id , None)
+            self._evict(user_id)
+
+
+    def start_reaper(self):
+        '''Start the single background task that drives the timer wheel'''
+        if self.reaper_task is None or self.reaper_task.done():
+            self.reaper_task = asyncio.create_task(self._run_reaper())
+
+
+    async def stop_reaper(self):
+        if self.reaper_task is None:
+            return
+
+        self.reaper_task.cancel()
+
+        try:
+            await self.reaper_task
+
+        except asyncio.CancelledError:
+            pass
+
+        self.reaper_task = None
+
+
+    def start_relay(self):
+        '''Start forwarding messages published by background workers to local sockets'''
+        if self.relay_task is None or self.relay_task.done():
+            self.relay_task = asyncio.create_task(self._run_relay())
+
+
+    async def stop_relay(self):
+        if self.relay_task is None:
+            return
+
+        self.relay_task.cancel()
+
+        try:
+            await self.relay_task
+
+        except asyncio.CancelledError:
+            pass
+
+        self.relay_task = None
+
+
+    def stats(self) -> dict:
+        return {
+            "active_connections" : len(self.user_connection),
+            "by_role" : {role : len(conns) for role , conns in self.role_connection.items()},
+            "scheduled_timers" : len(self.timer_wheel),
+            "heartbeats_sent" : self.heartbeats_sent,
+            "reaped_connections" : self.reaped_count
+        }
+
+
+    async def _run_reaper(self):
+        while True:
+            await asyncio.sleep(self.timer_wheel.tick_seconds)
+
+            for user_id in self.timer_wheel.advance():
+                try:
+                    await self._check_connection(user_id)
+
+                except Exception as e:
+                    logger.error(f"Websocket heartbeat check failed" , user_id = user_id , error = str(e))
+
+
+    async def _run_relay(self):
+        while True:
+            client = aioredis.from_url(settings.redis_url , decode_responses = True)
+            pubsub = client.pubsub()
+
+            try:
+                await pubsub.psubscribe(f"{USER_CHANNEL_PREFIX}*")
+                await pubsub.subscribe(BROADCAST_CHANNEL)
+
+                async for item in pubsub.listen():
+                    if item["type"] == "message" and item["channel"] == BROADCAST_CHANNEL:
+                        await self._relay_broadcast(json.loads(item["data"]))
+                        continue
+
+                    if item["type"] != "pmessage":
+                        continue
+
+                    user_id = int(item["channel"][len(USER_CHANNEL_PREFIX):])
+
+                    # Every API process sees every message, only the one holding the socket sends
+
+                    if user_id in self.user_connection:
+                        await self.send_personal_message(json.loads(item["data"]) , user_id)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                logger.error(f"Websocket relay error" , error = str(e))
+
+            finally:
+                await pubsub.close()
+                await client.close()
+
+            await asyncio.sleep(RELAY_RETRY_DELAY)
+
+
+    async def _relay_broadcast(self , payload : dict):
+        roles = payload.get("roles")
+
+        if roles:
+            for role in roles:
+                await self.send_to_role(payload["message"] , role)
+        else:
+            await self.broadcast(payload["message"])
+
+
+    async def _check_connection(self , user_id : int):
+        websocket = self.user_connection.get(user_id)
+
+        if websocket is None:
+            return
+
+        idle = time.monotonic() - self.last_seen.get(user_id , 0.0)
+
+        # Silent for too long - the peer is gone
+
+        if idle >= settings.WS_IDLE_TIMEOUT:
+            await self._reap(user_id , websocket , idle)
+            return
+
+        if idle < settings.WS_HEARTBEAT_INTERVAL:
+            # Client was active since this timer was set, just push the deadline out
+
+            self.timer_wheel.schedule(user_id , settings.WS_HEARTBEAT_INTERVAL - idle)
+            return
+
+        try:
+            await self._send(websocket , encode_message({"type" : "ping"} , self.user_protocol.get(user_id)))
+            self.heartbeats_sent += 1
+
+        except Exception:
+            await self._reap(user_id , websocket , idle)
+            return
+
+        # Give the client until the idle timeout to answer
+
+        self.timer_wheel.schedule(user_id , settings.WS_IDLE_TIMEOUT - idle)
+
+
+    async def _reap(self , user_id : int , websocket : WebSocket , idle : float):
+        self._evict(user_id)
+        self.reaped_count += 1
+
+        await self._close_quietly(websocket , code = IDLE_TIMEOUT_CLOSE_CODE)
+
+        logger.info(f"Websocket reaped" , user_id = user_id , idle_seconds = round(idle , 1))
+
+
+    def _evict(self , user_id : int) -> Optional[WebSocket]:
+        '''Drop a user from every index; returns the socket that was removed'''
+        websocket = self.user_connection.pop(user_id , None)
+        role = self.user_role.pop(user_id , None)
+
+        self.last_seen.pop(user_id , None)
+        self.user_protocol.pop(user_id , None)
+        self.timer_wheel.cancel(user_id)
+
+        if role in self.role_connection:
+            self.role_connection[role].pop(user_id , None)
+
+        return websocket
+
+
+    def _encode_cached(self , frames : Dict[Optional[str] , Frame] , message : dict , user_id : int) -> Frame:
+        protocol = self.user_protocol.get(user_id)
+
+        if protocol not in frames:
+            frames[protocol] = encode_message(message , protocol)
+
+        return frames[protocol]
+
+
+    async def _send(self , websocket : WebSocket , frame : Frame):
+        if isinstance(frame , bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+
+    async def _close_quietly(self , websocket : WebSocket , code : int = 1000):
+        try:
+            await websocket.close(code = code)
+
+        except Exception:
+            pass
             
 
 manager = ConnectionManager()            
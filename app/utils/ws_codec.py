@@ -0,0 +1,66 @@
+import json
+import zlib
+from typing import Iterable, Optional, Union
+import msgpack
+
+
+# Subprotocols a client may offer in Sec-WebSocket-Protocol. No subprotocol means JSON text frames.
+MSGPACK_PROTOCOL = "fd.msgpack.v1"
+MSGPACK_DEFLATE_PROTOCOL = "fd.msgpack-deflate.v1"
+
+# Server preference order when a client offers several
+SUPPORTED_SUBPROTOCOLS = (MSGPACK_DEFLATE_PROTOCOL, MSGPACK_PROTOCOL)
+
+# Binary frames start with one flag byte describing the body
+FLAG_PLAIN = 0x00
+FLAG_DEFLATE = 0x01
+
+# Small frames (rider pings, status flips) do not shrink enough to pay for compression
+DEFLATE_MIN_BYTES = 512
+
+Frame = Union[str, bytes]
+
+
+def negotiate_subprotocol(offered: Iterable[str]) -> Optional[str]:
+    '''Pick the preferred subprotocol the client offered, or None for JSON'''
+    offered = set(offered or [])
+
+    for protocol in SUPPORTED_SUBPROTOCOLS:
+        if protocol in offered:
+            return protocol
+
+    return None
+
+
+def encode_message(message: dict, protocol: Optional[str] = None) -> Frame:
+    '''Encode a message as a text frame (JSON) or binary frame (msgpack)'''
+    if protocol not in SUPPORTED_SUBPROTOCOLS:
+        return json.dumps(message)
+
+    body = msgpack.packb(message, use_bin_type=True)
+
+    if protocol == MSGPACK_DEFLATE_PROTOCOL and len(body) >= DEFLATE_MIN_BYTES:
+        # Raw deflate stream, no zlib header/trailer
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return bytes([FLAG_DEFLATE]) + compressor.compress(body) + compressor.flush()
+
+    return bytes([FLAG_PLAIN]) + body
+
+
+def decode_message(data: Frame, protocol: Optional[str] = None) -> dict:
+    '''Decode a frame received from a client'''
+    if isinstance(data, str):
+        # Text frames are always JSON, even on a msgpack connection
+        return json.loads(data)
+
+    if protocol not in SUPPORTED_SUBPROTOCOLS or not data:
+        raise ValueError("Unexpected binary frame")
+
+    flag, body = data[0], data[1:]
+
+    if flag == FLAG_DEFLATE:
+        body = zlib.decompress(body, -zlib.MAX_WBITS)
+    elif flag != FLAG_PLAIN:
+        raise ValueError(f"Unknown frame flag {flag}")
+
+    return msgpack.unpackb(body, raw=False)
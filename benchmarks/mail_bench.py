@@ -0,0 +1,111 @@
+'''
+Throughput of the mail path against a local aiosmtpd stand-in.
+
+    python -m benchmarks.mail_bench [messages]
+
+Compares a fresh SMTP connection per message (the old per-task pattern) with
+the pooled transport used one message at a time and in batches, plus the cost
+of rendering a template per message.
+'''
+import socket
+import sys
+import smtplib
+import time
+import timeit
+from string import Template
+from aiosmtpd.controller import Controller
+from app.utils.email_templates import TEMPLATES
+from app.utils.mailer import SMTPTransport, build_message
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+CONTEXT = {
+    "user": "Asha Rao",
+    "verification_url": "https://yourapp.com/verify-email?token=0f9c1d2e3b4a5968",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def messages(count: int):
+    return [
+        build_message(f"user{i}@example.com", "Verify Your Email Address", "verify_email", CONTEXT)
+        for i in range(count)
+    ]
+
+
+def connection_per_message(host: str, port: int, batch):
+    for message in batch:
+        connection = smtplib.SMTP(host, port, timeout=10)
+        connection.send_message(message)
+        connection.quit()
+
+
+def pooled_single(transport: SMTPTransport, batch):
+    for message in batch:
+        transport.send(message)
+
+
+def pooled_batch(transport: SMTPTransport, batch):
+    transport.send_many(batch)
+
+
+def main(count: int):
+    handler = CountingHandler()
+    host, port = "127.0.0.1", free_port()
+    controller = Controller(handler, hostname=host, port=port)
+    controller.start()
+
+    transport = SMTPTransport(host, port, pool_size=1, max_messages=count + 1)
+
+    try:
+        runs = [
+            ("connection per message", lambda batch: connection_per_message(host, port, batch)),
+            ("pooled, one at a time", lambda batch: pooled_single(transport, batch)),
+            ("pooled, send_many", lambda batch: pooled_batch(transport, batch)),
+        ]
+
+        print(f"{'mode':<26}{'messages':>10}{'seconds':>10}{'msg/s':>10}")
+
+        for name, run in runs:
+            batch = messages(count)
+            before = handler.received
+
+            started = time.perf_counter()
+            run(batch)
+            elapsed = time.perf_counter() - started
+
+            delivered = handler.received - before
+            print(f"{name:<26}{delivered:>10}{elapsed:>10.3f}{delivered / elapsed:>10.0f}")
+
+    finally:
+        transport.close()
+        controller.stop()
+
+    source = TEMPLATES["verify_email"].source
+    template = Template(source)
+    compiled = TEMPLATES["verify_email"]
+
+    per_call = 20000
+    substitute = timeit.timeit(lambda: template.safe_substitute(CONTEXT), number=per_call) / per_call
+    render = timeit.timeit(lambda: compiled.render(CONTEXT), number=per_call) / per_call
+
+    print()
+    print(f"Template.safe_substitute {substitute * 1e6:8.2f} us/message")
+    print(f"CompiledTemplate.render  {render * 1e6:8.2f} us/message")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,272 @@
+'''
+Throughput of the payment path against the local Stripe stand-in.
+
+    python -m benchmarks.payment_bench [orders] [--latency-ms 80] [--jitter-ms 40] [--concurrency 50]
+
+Needs a local Redis at REDIS_URL. Everything else is started here: the
+Stripe stub and the payments API on free ports, with the stub delivering
+signed webhooks to the API. A throwaway SQLite database is used, and Celery
+runs eagerly, so no broker or worker is needed. PAYMENT_POLL_RATE_PER_SECOND
+defaults to 1000 so the poll measures capacity rather than the limiter; set
+it in the environment to benchmark the production limit instead.
+
+Phases:
+    create_payment_intent    blocking calls one after another vs concurrent awaits
+    check_pending_payments   one poll over every payment settled at the stub
+    webhooks                 stub -> /payments/webhook ingest rate, then process_stripe_events
+'''
+import argparse
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+STUB_PORT = free_port()
+API_PORT = free_port()
+WEBHOOK_SECRET = "whsec_bench"
+
+# Settings are read at import, so the environment has to be in place before any app module loads
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/payment_bench.db")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_bench")
+os.environ.setdefault("STRIPE_PUBLISHABLE_KEY", "pk_test_bench")
+os.environ["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+os.environ["STRIPE_API_BASE"] = f"http://127.0.0.1:{STUB_PORT}"
+os.environ.setdefault("PAYMENT_POLL_RATE_PER_SECOND", "1000")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import func, insert, select, update  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.restaurant import Restaurant  # noqa: E402
+from app.models.order import Order, OrderStatus  # noqa: E402
+from app.models.payment import Payment, PaymentMethod, PaymentStatus, StripeEvent  # noqa: E402
+from app.models.outbox import OutboxEvent  # noqa: E402,F401
+from app.task.celery_app import celery_app  # noqa: E402
+from app.service.payment_service import PaymentService  # noqa: E402
+from app.service.stripe_gateway import stripe_gateway, stripe_latency  # noqa: E402
+from app.utils.redis_client import sync_redis_client  # noqa: E402
+from app.task.payment_task import check_pending_payments, process_stripe_events  # noqa: E402
+from app.api.v1 import payments  # noqa: E402
+from benchmarks.stripe_stub import StubConfig, create_app  # noqa: E402
+
+WEBHOOK_URL = f"http://127.0.0.1:{API_PORT}/api/v1/payments/webhook"
+
+
+def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    return server
+
+
+def seed_orders(count: int) -> list:
+    db = SessionLocal()
+
+    try:
+        owner = db.execute(select(User.id).where(User.email == "bench@example.com")).scalar()
+        if owner is None:
+            owner = db.execute(
+                insert(User).values(email="bench@example.com", usename="bench", full_name="Bench", hashed_password="x")
+            ).inserted_primary_key[0]
+            db.execute(insert(Restaurant).values(name="Bench Kitchen", address="1 Bench St", owner_id=owner))
+
+        restaurant_id = db.execute(select(Restaurant.id).where(Restaurant.owner_id == owner)).scalar()
+        first = (db.execute(select(func.max(Order.id))).scalar() or 0) + 1
+
+        db.execute(insert(Order), [
+            {
+                "order_number": f"BENCH{first + i:08d}",
+                "customer_id": owner,
+                "restaurant_id": restaurant_id,
+                "subtotal": 250.0,
+                "total_amount": 299.0,
+                "delivery_address": "1 Bench St",
+                "status": OrderStatus.PENDING,
+            }
+            for i in range(count)
+        ])
+        db.commit()
+
+        return list(range(first, first + count))
+
+    finally:
+        db.close()
+
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name:<40}{count:>8}{elapsed:>10.3f}{count / elapsed if elapsed else 0:>10.0f}")
+
+
+def create_sequential(order_ids: list):
+    db = SessionLocal()
+    try:
+        service = PaymentService(db)
+        for order_id in order_ids:
+            service.create_payment_intent(order_id, PaymentMethod.CREDIT_CARD)
+    finally:
+        db.close()
+
+
+async def create_concurrent(order_ids: list, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def create(order_id: int):
+        async with limit:
+            db = SessionLocal()
+            try:
+                await PaymentService(db).acreate_payment_intent(order_id, PaymentMethod.CREDIT_CARD)
+            finally:
+                db.close()
+
+    try:
+        await asyncio.gather(*(create(order_id) for order_id in order_ids))
+    finally:
+        # The async pool belongs to this event loop
+        await stripe_gateway.aclose()
+
+
+async def settle_at_stub(intent_ids: list, concurrency: int, decline_every: int = 10):
+    limit = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=settings.STRIPE_API_BASE,
+        headers={"Authorization": f"Bearer {settings.STRIPE_SECRET_KEY}"}
+    ) as client:
+        async def confirm(i: int, intent_id: str):
+            method = "pm_card_chargeDeclined" if i % decline_every == 0 else "pm_card_visa"
+            async with limit:
+                await client.post(f"/v1/payment_intents/{intent_id}/confirm", data={"payment_method": method})
+
+        await asyncio.gather(*(confirm(i, intent_id) for i, intent_id in enumerate(intent_ids)))
+
+
+def intents_for(order_ids: list) -> list:
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(Payment.stripe_payment_intent_id).where(Payment.order_id.in_(order_ids))
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+def backdate_payments(order_ids: list):
+    # check_pending_payments only looks at payments older than five minutes
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Payment)
+            .where(Payment.order_id.in_(order_ids))
+            .values(created_at=datetime.utcnow() - timedelta(minutes=10))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_rows(*conditions, model=StripeEvent) -> int:
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).select_from(model).where(*conditions)).scalar()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment path benchmark against the Stripe stub")
+    parser.add_argument("orders", type=int, nargs="?", default=500)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=40.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    celery_app.conf.task_always_eager = True
+    Base.metadata.create_all(bind=engine)
+    sync_redis_client.delete(stripe_latency.key)
+
+    stub_config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        webhook_secret=WEBHOOK_SECRET
+    )
+    api = FastAPI()
+    api.include_router(payments.router, prefix="/api/v1")
+
+    servers = [serve(create_app(stub_config), STUB_PORT), serve(api, API_PORT)]
+
+    try:
+        print(f"Stripe stub latency {args.latency_ms:.0f}ms + up to {args.jitter_ms:.0f}ms, "
+              f"failure rate {args.failure_rate:.1%}, poll concurrency {settings.PAYMENT_POLL_CONCURRENCY}, "
+              f"poll rate {settings.PAYMENT_POLL_RATE_PER_SECOND:.0f}/s")
+        print()
+        print(f"{'phase':<40}{'count':>8}{'seconds':>10}{'per s':>10}")
+
+        # create_payment_intent: the old blocking path vs the awaited one
+        sequential = seed_orders(min(args.orders, 100))
+        started = time.perf_counter()
+        create_sequential(sequential)
+        report("create_payment_intent, blocking", len(sequential), time.perf_counter() - started)
+
+        polled = seed_orders(args.orders)
+        started = time.perf_counter()
+        asyncio.run(create_concurrent(polled, args.concurrency))
+        report(f"create_payment_intent, async x{args.concurrency}", len(polled), time.perf_counter() - started)
+
+        # check_pending_payments: settle at the stub without webhooks, then one poll
+        asyncio.run(settle_at_stub(intents_for(polled), args.concurrency))
+        backdate_payments(polled)
+
+        started = time.perf_counter()
+        updated = check_pending_payments()
+        report(f"check_pending_payments ({updated} updated)", len(polled), time.perf_counter() - started)
+
+        # Webhooks: fresh intents, settled with delivery on
+        webhooked = seed_orders(args.orders)
+        asyncio.run(create_concurrent(webhooked, args.concurrency))
+        processed_before = count_rows(StripeEvent.processed_at.isnot(None))
+        received_before = count_rows()
+
+        stub_config.webhook_url = WEBHOOK_URL
+        started = time.perf_counter()
+        asyncio.run(settle_at_stub(intents_for(webhooked), args.concurrency))
+
+        while count_rows() - received_before < len(webhooked) and time.perf_counter() - started < 120:
+            time.sleep(0.05)
+        report("webhooks acknowledged and stored", count_rows() - received_before, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        process_stripe_events()
+        processed = count_rows(StripeEvent.processed_at.isnot(None)) - processed_before
+        report("process_stripe_events", processed, time.perf_counter() - started)
+
+        print()
+        print(f"{'stripe operation':<40}{'count':>8}{'avg ms':>10}{'p95 ms':>10}")
+        for name, values in sorted(stripe_latency.snapshot().items()):
+            print(f"{name:<40}{values['count']:>8}{values['avg_ms']:>10.1f}{str(values['p95_ms']):>10}")
+
+    finally:
+        stripe_gateway.close()
+        for server in servers:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
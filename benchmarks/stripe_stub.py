@@ -0,0 +1,374 @@
+'''
+Local Stripe stand-in for load testing the payment path.
+
+    python -m benchmarks.stripe_stub --port 12111 --latency-ms 80 --jitter-ms 40 \
+        --failure-rate 0.01 --webhook-url http://127.0.0.1:8000/api/v1/payments/webhook
+
+Point the app at it with STRIPE_API_BASE=http://127.0.0.1:12111. Set
+STRIPE_WEBHOOK_SECRET to the same value as --webhook-secret.
+
+Implements the slice of the API the app uses, in memory:
+
+    POST /v1/payment_intents                 create (confirm=true settles at once; honours Idempotency-Key)
+    GET  /v1/payment_intents/{id}            retrieve
+    POST /v1/payment_intents/{id}/confirm    pm_card_chargeDeclined fails, anything else succeeds
+    POST /v1/payment_intents/{id}/cancel
+    POST /v1/refunds
+    GET  /v1/payment_intents, /v1/refunds    lists: created[gte|gt|lte|lt], limit, starting_after
+
+Every state change is sent to --webhook-url as a signed event, using the same
+Stripe-Signature scheme stripe.Webhook.construct_event verifies. Latency,
+5xx, 429 and hung requests can be injected on /v1 calls. GET /_stub/stats
+returns request and webhook counters.
+'''
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import re
+import secrets
+import time
+from collections import Counter
+from typing import Dict, Optional
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+OBJECT_ID = re.compile(r"/(pi|re|ch)_[0-9a-f]+")
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_seconds: float = 30.0,
+        webhook_url: Optional[str] = None,
+        webhook_secret: str = "whsec_stub",
+        webhook_concurrency: int = 20
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.webhook_concurrency = webhook_concurrency
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    '''Stripe-Signature header value for a webhook body'''
+    timestamp = timestamp or int(time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def _error(status_code: int, error_type: str, message: str, code: Optional[str] = None, param: Optional[str] = None):
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"type": error_type, "message": message, "code": code, "param": param}}
+    )
+
+
+def _form_value(form, key: str, default=None):
+    value = form.get(key)
+    return default if value is None else value
+
+
+def _list(objects: Dict[str, dict], request: Request, path: str):
+    '''Stripe list semantics: newest first, created filters, cursor on starting_after'''
+    query = request.query_params
+    limit = min(int(query.get("limit", 10)), 100)
+    bounds = {
+        "gte": lambda created, value: created >= value,
+        "gt": lambda created, value: created > value,
+        "lte": lambda created, value: created <= value,
+        "lt": lambda created, value: created < value,
+    }
+
+    # dicts keep insertion order, so reversing gives newest first for equal timestamps too
+    items = list(reversed(objects.values()))
+    for name, check in bounds.items():
+        if f"created[{name}]" in query:
+            value = int(query[f"created[{name}]"])
+            items = [item for item in items if check(item["created"], value)]
+
+    if query.get("starting_after"):
+        ids = [item["id"] for item in items]
+        if query["starting_after"] in ids:
+            items = items[ids.index(query["starting_after"]) + 1:]
+
+    return {"object": "list", "url": path, "data": items[:limit], "has_more": len(items) > limit}
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Stripe stub")
+
+    intents: Dict[str, dict] = {}
+    refunds: Dict[str, dict] = {}
+    idempotent: Dict[str, str] = {}
+    stats: Counter = Counter()
+    deliveries = set()
+    state = {"client": None, "limit": None}
+
+    def webhook_client() -> httpx.AsyncClient:
+        if state["client"] is None:
+            state["client"] = httpx.AsyncClient(timeout=10)
+            state["limit"] = asyncio.Semaphore(config.webhook_concurrency)
+        return state["client"]
+
+    async def deliver(event: dict):
+        client = webhook_client()
+        payload = json.dumps(event).encode()
+
+        async with state["limit"]:
+            for attempt in range(3):
+                try:
+                    response = await client.post(
+                        config.webhook_url,
+                        content=payload,
+                        headers={
+                            "Content-Type": "application/json",
+                            "Stripe-Signature": sign_payload(payload, config.webhook_secret)
+                        }
+                    )
+                    if response.status_code < 300:
+                        stats["webhooks_delivered"] += 1
+                        return
+                    stats["webhooks_rejected"] += 1
+
+                except httpx.HTTPError:
+                    stats["webhook_errors"] += 1
+
+                await asyncio.sleep(0.5 * (attempt + 1))
+
+            stats["webhooks_dropped"] += 1
+
+    def emit(event_type: str, obj: dict):
+        stats[f"event:{event_type}"] += 1
+        if not config.webhook_url:
+            return
+
+        event = {
+            "id": f"evt_{secrets.token_hex(12)}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "livemode": False,
+            "data": {"object": dict(obj)},
+        }
+
+        task = asyncio.create_task(deliver(event))
+        deliveries.add(task)
+        task.add_done_callback(deliveries.discard)
+
+    def settle(intent: dict, payment_method: Optional[str]):
+        intent["payment_method"] = payment_method or "pm_card_visa"
+
+        if payment_method == "pm_card_chargeDeclined":
+            intent["status"] = "requires_payment_method"
+            intent["last_payment_error"] = {"code": "card_declined", "message": "Your card was declined."}
+            emit("payment_intent.payment_failed", intent)
+        else:
+            intent["status"] = "succeeded"
+            intent["amount_received"] = intent["amount"]
+            intent["latest_charge"] = f"ch_{secrets.token_hex(12)}"
+            emit("payment_intent.succeeded", intent)
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if not request.url.path.startswith("/v1/"):
+            return await call_next(request)
+
+        stats[f"{request.method} {OBJECT_ID.sub('/{id}', request.url.path)}"] += 1
+
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return _error(401, "invalid_request_error", "You did not provide an API key.")
+
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        roll = random.random()
+        if roll < config.hang_rate:
+            stats["injected_hangs"] += 1
+            await asyncio.sleep(config.hang_seconds)
+        elif roll < config.hang_rate + config.rate_limit_rate:
+            stats["injected_429"] += 1
+            return _error(429, "rate_limit_error", "Too many requests hit the API too quickly.", code="rate_limit")
+        elif roll < config.hang_rate + config.rate_limit_rate + config.failure_rate:
+            stats["injected_500"] += 1
+            return _error(500, "api_error", "Injected failure.")
+
+        return await call_next(request)
+
+    @app.post("/v1/payment_intents")
+    async def create_payment_intent(request: Request):
+        form = await request.form()
+
+        key = request.headers.get("idempotency-key")
+        if key and key in idempotent:
+            stats["idempotent_replays"] += 1
+            return intents[idempotent[key]]
+
+        if not form.get("amount") or not form.get("currency"):
+            return _error(400, "invalid_request_error", "Missing required param: amount.", param="amount")
+
+        intent_id = f"pi_{secrets.token_hex(12)}"
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(form["amount"]),
+            "amount_received": 0,
+            "currency": form["currency"].lower(),
+            "status": "requires_payment_method",
+            "client_secret": f"{intent_id}_secret_{secrets.token_hex(12)}",
+            "created": int(time.time()),
+            "livemode": False,
+            "metadata": {
+                key[len("metadata["):-1]: value for key, value in form.items() if key.startswith("metadata[")
+            },
+        }
+        intents[intent_id] = intent
+        if key:
+            idempotent[key] = intent_id
+        emit("payment_intent.created", intent)
+
+        if _form_value(form, "confirm") == "true":
+            settle(intent, form.get("payment_method"))
+
+        return intent
+
+    @app.get("/v1/payment_intents")
+    async def list_payment_intents(request: Request):
+        return _list(intents, request, "/v1/payment_intents")
+
+    @app.get("/v1/refunds")
+    async def list_refunds(request: Request):
+        return _list(refunds, request, "/v1/refunds")
+
+    @app.get("/v1/payment_intents/{intent_id}")
+    async def retrieve_payment_intent(intent_id: str):
+        intent = intents.get(intent_id)
+        if intent is None:
+            return _error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'", "resource_missing", "intent")
+        return intent
+
+    @app.post("/v1/payment_intents/{intent_id}/confirm")
+    async def confirm_payment_intent(intent_id: str, request: Request):
+        intent = intents.get(intent_id)
+        if intent is None:
+            return _error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'", "resource_missing", "intent")
+        if intent["status"] in ("succeeded", "canceled"):
+            return _error(400, "invalid_request_error", f"PaymentIntent has a status of {intent['status']}.", "payment_intent_unexpected_state")
+
+        form = await request.form()
+        settle(intent, form.get("payment_method"))
+        return intent
+
+    @app.post("/v1/payment_intents/{intent_id}/cancel")
+    async def cancel_payment_intent(intent_id: str):
+        intent = intents.get(intent_id)
+        if intent is None:
+            return _error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'", "resource_missing", "intent")
+        if intent["status"] == "succeeded":
+            return _error(400, "invalid_request_error", "PaymentIntent has a status of succeeded.", "payment_intent_unexpected_state")
+
+        intent["status"] = "canceled"
+        emit("payment_intent.canceled", intent)
+        return intent
+
+    @app.post("/v1/refunds")
+    async def create_refund(request: Request):
+        form = await request.form()
+        intent = intents.get(form.get("payment_intent", ""))
+
+        if intent is None:
+            return _error(404, "invalid_request_error", "No such payment_intent.", "resource_missing", "payment_intent")
+        if intent["status"] != "succeeded":
+            return _error(400, "invalid_request_error", "This PaymentIntent has not succeeded.", "charge_not_refundable")
+
+        refunded = intent.get("amount_refunded", 0)
+        amount = int(_form_value(form, "amount", intent["amount"] - refunded))
+        if amount <= 0 or refunded + amount > intent["amount"]:
+            return _error(400, "invalid_request_error", "Refund amount is greater than the unrefunded amount.", "amount_too_large", "amount")
+
+        intent["amount_refunded"] = refunded + amount
+        refund = {
+            "id": f"re_{secrets.token_hex(12)}",
+            "object": "refund",
+            "amount": amount,
+            "currency": intent["currency"],
+            "payment_intent": intent["id"],
+            "charge": intent.get("latest_charge"),
+            "status": "succeeded",
+            "created": int(time.time()),
+        }
+        refunds[refund["id"]] = refund
+
+        emit("charge.refunded", {
+            "id": intent.get("latest_charge"),
+            "object": "charge",
+            "payment_intent": intent["id"],
+            "amount": intent["amount"],
+            "amount_refunded": intent["amount_refunded"],
+            "refunded": intent["amount_refunded"] >= intent["amount"],
+        })
+        return refund
+
+    @app.get("/_stub/stats")
+    async def get_stats():
+        return {
+            "payment_intents": len(intents),
+            "refunds": len(refunds),
+            "pending_webhooks": len(deliveries),
+            **stats,
+        }
+
+    @app.on_event("shutdown")
+    async def close_webhook_client():
+        if state["client"] is not None:
+            await state["client"].aclose()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Stripe stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every /v1 call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform extra latency on top")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of calls answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of calls held for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--webhook-url", default=None)
+    parser.add_argument("--webhook-secret", default="whsec_stub")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret
+    )
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''
+Bytes per message and encode CPU for each WebSocket wire mode.
+
+    python -m benchmarks.ws_codec_bench [iterations]
+'''
+import sys
+import timeit
+from app.utils.ws_codec import (
+    MSGPACK_PROTOCOL,
+    MSGPACK_DEFLATE_PROTOCOL,
+    encode_message,
+    decode_message
+)
+
+
+MODES = [
+    ("json", None),
+    ("msgpack", MSGPACK_PROTOCOL),
+    ("msgpack+deflate", MSGPACK_DEFLATE_PROTOCOL),
+]
+
+SAMPLES = {
+    "location_update": {
+        "type": "delivery_location_update",
+        "order_id": 918273,
+        "latitude": 12.971598,
+        "longitude": 77.594566,
+        "delivery_partner_id": 40211
+    },
+    "order_status_update": {
+        "type": "order_status_update",
+        "order_id": 918273,
+        "order_number": "ORD-20261018-A1B2C3",
+        "old_status": "preparing",
+        "new_status": "ready_for_pickup",
+        "timestamp": "2026-10-18T12:30:45.123456"
+    },
+    "order_snapshot": {
+        "type": "order_snapshot",
+        "order_id": 918273,
+        "order_number": "ORD-20261018-A1B2C3",
+        "status": "preparing",
+        "delivery_address": "221B Residency Road, Bengaluru, Karnataka 560025",
+        "items": [
+            {
+                "menu_item_id": 1000 + i,
+                "name": f"Menu item number {i}",
+                "quantity": 1 + i % 3,
+                "unit_price": 149.0 + i,
+                "total_price": (149.0 + i) * (1 + i % 3),
+                "special_instructions": "Less spicy, no onions" if i % 4 == 0 else None
+            }
+            for i in range(25)
+        ],
+        "subtotal": 5230.0,
+        "delivery_fee": 40.0,
+        "tax_amount": 418.4,
+        "total_amount": 5688.4
+    },
+}
+
+
+def run(iterations: int = 20000):
+    print(f"{'message':<22}{'mode':<18}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+
+    for name, message in SAMPLES.items():
+        for mode, protocol in MODES:
+            frame = encode_message(message, protocol)
+            assert decode_message(frame, protocol) == message
+
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            encode_us = timeit.timeit(lambda: encode_message(message, protocol), number=iterations) / iterations * 1e6
+            decode_us = timeit.timeit(lambda: decode_message(frame, protocol), number=iterations) / iterations * 1e6
+
+            print(f"{name:<22}{mode:<18}{size:>8}{encode_us:>12.2f}{decode_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)